@@ -2,7 +2,7 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from methods import (
     get_db_connection,
-    authenticate_user, register_user, verify_user, resend_verification, reset_password_request, send_verification_otp, verify_otp,
+    authenticate_user, refresh_session, logout_user, register_user, verify_user, resend_verification, reset_password_request, send_verification_otp, verify_otp,
     reset_password_complete, get_user_profile, update_user_profile,
     get_appointments, create_appointment, get_appointment_details, update_appointment,
     cancel_appointment, get_available_slots,
@@ -14,10 +14,12 @@ from methods import (
     delete_calendar_event, sync_external_calendar,
     get_knowledge_base, get_knowledge_article, 
     google_auth, complete_google_registration,
-    submit_tax_form, save_tax_form_progress, load_tax_form_progress, get_tax_form_templates
+    submit_tax_form, save_tax_form_progress, load_tax_form_progress, get_tax_form_templates,
+    get_db_query_stats
 
 )
 from firebase_setup  import verify_firebase_token
+import firebase_setup
 from microsoft_teams import MicrosoftTeamsIntegration
 from config import app_config
 import utils
@@ -25,6 +27,15 @@ import logging
 import datetime
 import json
 from utils import validate_token
+from principal import get_principal
+import db_session
+import db_metrics
+import hashing
+import email_outbox
+import email_templates
+import token_store
+import reminders
+from rate_limit import rate_limited
 import os 
 
 logging.basicConfig(
@@ -41,6 +52,42 @@ app = Flask(__name__)
 app.config.from_object(app_config)
 CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
 
+# One pooled connection and one transaction per request
+db_session.init_app(app)
+# Per-request query count and DB time in the Server-Timing header
+db_metrics.init_app(app)
+# OTPs, emailed links and refresh token revocations must be visible to every server process
+token_store.init_app(app)
+# Compile the email templates once, so a missing or broken one fails at startup
+email_templates.load_templates()
+
+_background_started = False
+
+
+def start_background():
+    """
+    Start what only the process serving requests needs: the bcrypt worker
+    processes, Google's signing keys, the outbox workers and the reminder
+    thread. Importing this module doesn't, so the reloader's watcher process
+    under debug doesn't run a second set. python app.py and serve_async.py
+    call it; another WSGI server should call it once in each worker process.
+    """
+    global _background_started
+    if _background_started:
+        return app
+    _background_started = True
+    # Pick the bcrypt work factor for this machine before serving logins
+    hashing.calibrate()
+    # Start the bcrypt worker processes while this is still the only thread
+    hashing.hashing_pool.start()
+    # Initialize Firebase Admin and fetch Google's signing keys before the first Google login
+    firebase_setup.warm_up()
+    # Background workers that send queued email (email_outbox table)
+    email_outbox.init_app(app)
+    # Appointment reminders, queued through the outbox
+    reminders.init_app(app)
+    return app
+
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 TAX_FORM_UPLOADS = os.path.join(UPLOAD_FOLDER, 'tax_forms')
 os.makedirs(TAX_FORM_UPLOADS, exist_ok=True)
@@ -53,15 +100,16 @@ teams_integration = MicrosoftTeamsIntegration()
 
 # Authentication & User Management Endpoints
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited('login_ip', 'login_email')
 def login():
     data = request.get_json()
     return authenticate_user(data)
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
-    # data = request.get_json()
+    data = request.get_json(silent=True)
     logger.info("User logout attempt")
-    return jsonify({"message": "Logged out successfully"}), 200
+    return logout_user(data)
 
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -70,41 +118,8 @@ def register():
 
 @app.route('/api/auth/refresh-token', methods=['POST'])
 def refresh_token():
-    try:
-        token = request.headers.get('Authorization')
-        if not token or not token.startswith('Bearer '):
-            return jsonify({"error": "Missing or invalid token"}), 401
-        
-        token = token.replace('Bearer ', '')
-        user_id = validate_token(token)
-        
-        if not user_id:
-            return jsonify({"error": "Invalid or expired token"}), 401
-        
-        # Get user info for the new token
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection error"}), 500
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, email, role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        
-        # Generate a new token
-        new_token = generate_token(user['id'], user['email'], user.get('role'))
-        
-        return jsonify({
-            "message": "Token refreshed successfully",
-            "token": new_token
-        }), 200
-    except Exception as e:
-        logger.error(f"Token refresh error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+    data = request.get_json(silent=True)
+    return refresh_session(data, request.headers.get('Authorization'))
     
 @app.route('/api/auth/google', methods=['POST'])
 def google_auth_route():
@@ -160,11 +175,13 @@ def verify_google_token_route():
         return jsonify({"error": str(e)}), 500
     
 @app.route('/api/auth/send-otp', methods=['POST'])
+@rate_limited('otp_send_ip', 'otp_send_email')
 def send_otp():
     data = request.get_json()
     return send_verification_otp(data)
 
 @app.route('/api/auth/verify-otp', methods=['POST'])
+@rate_limited('otp_verify_ip', 'otp_verify_email')
 def verify_otp_route():
     data = request.get_json()
     return verify_otp(data)
@@ -180,6 +197,7 @@ def resend_verification_email():
     return resend_verification(data)
 
 @app.route('/api/auth/reset-password-request', methods=['POST'])
+@rate_limited('reset_ip', 'reset_email')
 def reset_request():
     data = request.get_json()
     return reset_password_request(data)
@@ -228,6 +246,12 @@ def update_profile():
 #     token = request.headers.get('Authorization')
 #     return delete_admin(token, id)
 
+# Admin Diagnostics Endpoints
+@app.route('/api/admin/db/query-stats', methods=['GET'])
+def admin_db_query_stats():
+    token = request.headers.get('Authorization')
+    return get_db_query_stats(token)
+
 # Appointment Booking Endpoints
 @app.route('/api/appointments', methods=['GET'])
 def appointment_list():
@@ -359,8 +383,8 @@ def create_teams_meeting():
     token = request.headers.get('Authorization')
     data = request.get_json()
     
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
     
     subject = data.get('subject')
@@ -372,23 +396,12 @@ def create_teams_meeting():
     if not subject or not start_time or not end_time:
         return jsonify({"error": "Subject, start time, and end time are required"}), 400
     
-    # Get user email
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT email FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if not user:
+    if not principal.exists:
         return jsonify({"error": "User not found"}), 404
     
     # Add user's email to attendees if not already included
-    if user['email'] not in attendees:
-        attendees.append(user['email'])
+    if principal.email not in attendees:
+        attendees.append(principal.email)
     
     # Create Teams meeting
     meeting = teams_integration.create_meeting(
@@ -564,4 +577,8 @@ def tax_form_load_progress(form_id):
 #     return update_knowledge_article(token, id, data)
 
 if __name__ == '__main__':
+    # With the debug reloader this runs in a watcher process and again in the
+    # child that serves, which is the one with WERKZEUG_RUN_MAIN set
+    if not app_config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background()
     app.run(debug=app_config.DEBUG, host='0.0.0.0', port=5000)
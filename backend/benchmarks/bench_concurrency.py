@@ -0,0 +1,125 @@
+"""
+Measure how many concurrent slow requests a single server process holds.
+
+Start the server under test first, e.g. the threaded entry point
+
+    python app.py
+
+or the cooperative one
+
+    python serve_async.py
+
+then open CONCURRENCY connections at once against an I/O-bound endpoint
+and report throughput, latency percentiles, failures and the server's
+resident memory (pass --pid to read it from /proc):
+
+    python benchmarks/bench_concurrency.py --url http://localhost:5000/api/services \\
+        --concurrency 2000 --requests 20000 --pid $(pgrep -f serve_async.py)
+
+Run both modes with the same DB_POOL_MAX_SIZE to compare them at fixed memory.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+def read_rss_mb(pid):
+    if not pid:
+        return None
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        return None
+    return None
+
+
+async def fetch(host, port, path, headers):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n{headers}\r\n"
+    writer.write(request.encode('ascii'))
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def worker(queue, target, latencies, failures):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        try:
+            status = await fetch(*target)
+            if status >= 500:
+                failures.append(status)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            failures.append(type(e).__name__)
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+
+async def run(args):
+    parts = urlsplit(args.url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    headers = f"Authorization: {args.auth}\r\n" if args.auth else ''
+    target = (parts.hostname, parts.port or 80, path, headers)
+
+    queue = asyncio.Queue()
+    for _ in range(args.requests):
+        queue.put_nowait(None)
+    latencies, failures = [], []
+    rss_before = read_rss_mb(args.pid)
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(worker(queue, target, latencies, failures)) for _ in range(args.concurrency)]
+    peak_rss = rss_before
+    while not all(task.done() for task in workers):
+        await asyncio.sleep(0.25)
+        rss = read_rss_mb(args.pid)
+        if rss is not None:
+            peak_rss = max(peak_rss or 0, rss)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"url:          {args.url}")
+    print(f"concurrency:  {args.concurrency}")
+    print(f"completed:    {len(latencies)} ok, {len(failures)} failed in {elapsed:.2f}s")
+    print(f"throughput:   {len(latencies) / elapsed:,.1f} req/s")
+    print(f"latency p50:  {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"latency p99:  {percentile(latencies, 99) * 1000:.1f} ms")
+    if rss_before is not None:
+        print(f"server RSS:   {rss_before:.1f} MB before, {peak_rss:.1f} MB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000/api/services')
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--auth', default=os.environ.get('BENCH_AUTH'), help="Authorization header value, e.g. 'Bearer <token>'")
+    parser.add_argument('--pid', type=int, help="Server process id for memory readings")
+    args = parser.parse_args()
+    if args.concurrency > args.requests:
+        sys.exit("--concurrency must not exceed --requests")
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+Email pipeline throughput and latency against the local SMTP sink.
+
+Each scenario reports messages/sec, p50/p99 latency and the connections
+and logins the sink saw:
+
+  send_email  utils.send_email called directly from --threads threads, as
+              handlers did before the outbox; latency is per call.
+  flows       Emails from the registration flow (OTP) and the booking flow
+              (appointment confirmation), rendered from the real templates
+              and submitted to the delivery engine at --rate per second,
+              with --backlog reminders already queued; latency is from
+              submit to the sink accepting the message, per category.
+  server      The same flows over HTTP against a running backend that
+              sends through this sink; latency is from the request to the
+              sink accepting the message. Start the backend with
+              SMTP_SERVER=127.0.0.1 SMTP_PORT=<--sink-port>
+              SMTP_STARTTLS=False RATE_LIMIT_ENABLED=False; booking needs
+              --auth and a --service-id.
+
+The sink's --latency, --jitter and failure rates are passed through (see
+smtp_sink.py), and --seed makes runs repeatable. Run from the backend
+directory:
+
+    python benchmarks/bench_email_pipeline.py send_email flows --messages 500 --latency 0.01
+    python benchmarks/bench_email_pipeline.py flows --rate 100 --backlog 2000 --fail-rate 0.02
+    python benchmarks/bench_email_pipeline.py server --sink-port 2526 --url http://localhost:5000 --auth "Bearer <token>"
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import email_config  # noqa: E402
+from smtp_pool import close_smtp_pools  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def report(label, latencies, elapsed, sink):
+    stats = sink.stats
+    print(f"  {label:22s} {stats['messages'] / elapsed:8.1f} msg/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+          f"n={len(latencies)}")
+    print(f"  {'':22s} {stats['connections']} connections, {stats['logins']} logins, "
+          f"{stats['failures']} x 451, {stats['rejects']} x 550, {stats['disconnects']} dropped")
+
+
+def run_send_email(args, sink):
+    from email_templates import render_email
+    from utils import send_email
+
+    sink.reset_stats()
+    latencies = []
+    lock = threading.Lock()
+
+    def send(i):
+        email = render_email('appointment_confirmation', name=f"Client {i}", service_name='Tax Return Preparation',
+                             date='2026-03-14', time='10:00', teams_join_url=None)
+        started = time.perf_counter()
+        send_email(f"client{i}@example.com", email.subject, email.text, email.html)
+        with lock:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as senders:
+        list(senders.map(send, range(args.messages)))
+    elapsed = time.perf_counter() - started
+    print(f"send_email: {args.messages} messages from {args.threads} threads")
+    report('send_email', latencies, elapsed, sink)
+
+
+def run_flows(args, sink):
+    from email_delivery import DeliveryEngine, RateGovernor, lane_for
+    from email_templates import render_email
+    from utils import deliver_email
+
+    sink.reset_stats()
+    rng = random.Random(args.seed)
+    total = args.backlog + args.messages
+    done = threading.Semaphore(0)
+    submitted = {}
+    failed = [0]
+
+    def send(row):
+        deliver_email(row['to_email'], row['subject'], row['body'], row['html_body'])
+
+    def finished(row, error):
+        if error is not None:
+            failed[0] += 1
+        done.release()
+
+    def submit(engine, category, recipient, email):
+        row = {'to_email': recipient, 'subject': email.subject, 'body': email.text, 'html_body': email.html}
+        submitted[recipient] = (category, time.monotonic())
+        if not engine.submit(lane_for(category), row, finished):
+            raise RuntimeError("delivery lane full")
+
+    governor = RateGovernor('bench', args.rate_limit, args.burst, 0, args.reserve)
+    engine = DeliveryEngine('bench', send, governor, senders=args.senders, urgent_senders=args.urgent_senders,
+                            lane_capacity=total).start()
+    started = time.perf_counter()
+    for i in range(args.backlog):
+        email = render_email('appointment_reminder', name=f"Client {i}", service_name='Tax Return Preparation',
+                             date='2026-03-15', time='10:00')
+        submit(engine, 'reminder', f"reminder{i}@example.com", email)
+    for i in range(args.messages):
+        # Open loop: arrivals keep their schedule however far behind the senders are
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if rng.random() < args.otp_share:
+            email = render_email('otp', code=f"{rng.randrange(10 ** 6):06d}", ttl_minutes=5)
+            submit(engine, 'otp', f"signup{i}@example.com", email)
+        else:
+            email = render_email('appointment_confirmation', name=f"Client {i}", service_name='Tax Return Preparation',
+                                 date='2026-03-14', time=f"{9 + i % 8:02d}:00", teams_join_url=None)
+            submit(engine, 'appointment', f"booking{i}@example.com", email)
+    for _ in range(total):
+        done.acquire()
+    elapsed = time.perf_counter() - started
+    engine.stop()
+
+    latencies = {}
+    for recipient, (category, submitted_at) in submitted.items():
+        arrived = sink.arrivals.get(recipient)
+        if arrived is not None:
+            latencies.setdefault(category, []).append(arrived - submitted_at)
+    print(f"flows: {args.messages} at {args.rate:g}/s ({args.otp_share:.0%} OTP) behind {args.backlog} reminders, "
+          f"{args.senders} senders, {args.rate_limit:g} msg/s limit; {failed[0]} sends failed")
+    report('all', [value for values in latencies.values() for value in values], elapsed, sink)
+    for category in ('otp', 'appointment', 'reminder'):
+        values = latencies.get(category, [])
+        if values:
+            print(f"  {category:22s} p50 {percentile(values, 50) * 1000:7.1f} ms  "
+                  f"p99 {percentile(values, 99) * 1000:7.1f} ms  n={len(values)}")
+
+
+def post(url, payload, auth=None):
+    headers = {'Content-Type': 'application/json'}
+    if auth:
+        headers['Authorization'] = auth
+    request = urllib.request.Request(url, json.dumps(payload).encode('utf-8'), headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run_server(args, sink):
+    sink.reset_stats()
+    rng = random.Random(args.seed)
+    first_day = datetime.date.today() + datetime.timedelta(days=60)
+    plan = []
+    for i in range(args.messages):
+        if rng.random() < args.otp_share or not args.auth:
+            plan.append(('otp', f"bench{int(time.time())}-{i}@example.com"))
+        else:
+            day = first_day + datetime.timedelta(days=i // 8)
+            plan.append(('appointment', (day.isoformat(), f"{9 + i % 8:02d}:00")))
+
+    http, sent_at, errors = {}, {}, {}
+    lock = threading.Lock()
+
+    def request(item):
+        flow, value = item
+        started = time.monotonic()
+        if flow == 'otp':
+            sent_at[value] = started
+            status = post(f"{args.url}/api/auth/send-otp", {'email': value})
+        else:
+            status = post(f"{args.url}/api/appointments",
+                          {'service_id': args.service_id, 'date': value[0], 'time': value[1]}, args.auth)
+        with lock:
+            http.setdefault(flow, []).append(time.monotonic() - started)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as clients:
+        list(clients.map(request, plan))
+    expected = len(plan) - sum(errors.values())
+    if not sink.wait_for(expected, timeout=args.drain_timeout):
+        print(f"  only {sink.stats['messages']} of {expected} emails arrived within {args.drain_timeout}s")
+    elapsed = time.perf_counter() - started
+
+    delivered = [sink.arrivals[email] - at for email, at in sent_at.items() if email in sink.arrivals]
+    print(f"server: {len(plan)} requests to {args.url} from {args.threads} clients; HTTP errors: {errors or 'none'}")
+    report('OTP request to inbox', delivered, elapsed, sink)
+    for flow, values in http.items():
+        print(f"  {flow + ' HTTP':22s} p50 {percentile(values, 50) * 1000:7.1f} ms  "
+              f"p99 {percentile(values, 99) * 1000:7.1f} ms  n={len(values)}")
+
+
+SCENARIOS = {'send_email': run_send_email, 'flows': run_flows, 'server': run_server}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('scenarios', nargs='+', choices=sorted(SCENARIOS))
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8, help="Caller threads (send_email) or HTTP clients (server)")
+    parser.add_argument('--seed', type=int, default=1)
+    sink_args = parser.add_argument_group('sink')
+    sink_args.add_argument('--sink-port', type=int, default=0, help="0 picks a free port")
+    sink_args.add_argument('--latency', type=float, default=0.01, help="Seconds the sink waits before each reply")
+    sink_args.add_argument('--jitter', type=float, default=0.0)
+    sink_args.add_argument('--fail-rate', type=float, default=0.0)
+    sink_args.add_argument('--reject-rate', type=float, default=0.0)
+    sink_args.add_argument('--disconnect-rate', type=float, default=0.0)
+    flow_args = parser.add_argument_group('flows')
+    flow_args.add_argument('--rate', type=float, default=100, help="New emails per second")
+    flow_args.add_argument('--otp-share', type=float, default=0.2, help="Share of them that are OTPs")
+    flow_args.add_argument('--backlog', type=int, default=1000, help="Reminders queued before the run")
+    flow_args.add_argument('--senders', type=int, default=email_config.SMTP_MAX_SESSIONS)
+    flow_args.add_argument('--urgent-senders', type=int, default=1)
+    flow_args.add_argument('--rate-limit', type=float, default=1000, help="Governor emails per second")
+    flow_args.add_argument('--burst', type=float, default=50)
+    flow_args.add_argument('--reserve', type=float, default=0.1)
+    server_args = parser.add_argument_group('server')
+    server_args.add_argument('--url', default='http://localhost:5000')
+    server_args.add_argument('--auth', help="Authorization header for booking, e.g. 'Bearer <token>'; OTP only without it")
+    server_args.add_argument('--service-id', type=int, default=1)
+    server_args.add_argument('--drain-timeout', type=float, default=60, help="Seconds to wait for queued emails to arrive")
+    args = parser.parse_args()
+
+    sink = SMTPSink(port=args.sink_port, latency=args.latency, jitter=args.jitter, fail_rate=args.fail_rate,
+                    reject_rate=args.reject_rate, disconnect_rate=args.disconnect_rate, seed=args.seed).start()
+    # Everything in this process sends through the sink
+    email_config.EMAIL_ENABLED = True
+    email_config.SMTP_SERVER, email_config.SMTP_PORT = sink.host, sink.port
+    email_config.SMTP_STARTTLS = False
+    print(f"SMTP sink on {sink.host}:{sink.port}, {args.latency * 1000:.0f} ms per reply")
+    for name in args.scenarios:
+        SCENARIOS[name](args, sink)
+        close_smtp_pools()  # the next scenario starts without warm sessions
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
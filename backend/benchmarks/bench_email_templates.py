@@ -0,0 +1,95 @@
+"""
+Email rendering throughput: templates read and substituted per message
+versus templates compiled once (email_templates).
+
+The per-message mode reads the .txt, .html and layout files and fills in
+placeholders with re.sub for every email, which is what keeping templates
+on disk without a compile step costs. The compiled modes render from the
+templates loaded at startup: one render_email call per message, and
+render_many with the values every recipient shares filled in once up front.
+--mime also builds the multipart/alternative message deliver_email sends.
+Run from the backend directory:
+
+    python benchmarks/bench_email_templates.py --messages 20000
+"""
+import argparse
+import html
+import os
+import re
+import sys
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_templates  # noqa: E402
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+_IF_BLOCK = re.compile(r"\{%\s*if\s+(\w+)\s*%\}(.*?)\{%\s*endif\s*%\}", re.S)
+
+
+def render_per_message(name, context):
+    def read(filename):
+        with open(os.path.join(email_templates.TEMPLATE_DIR, filename), encoding='utf-8') as f:
+            return f.read()
+
+    def fill(source, escape):
+        source = _IF_BLOCK.sub(lambda m: m.group(2) if context.get(m.group(1)) else '', source)
+        value = (lambda m: html.escape(str(context[m.group(1)]))) if escape else (lambda m: str(context[m.group(1)]))
+        return _PLACEHOLDER.sub(value, source)
+
+    subject, _, text = read(name + '.txt').partition('\n')
+    page = read(email_templates.LAYOUT_NAME).replace('{{ content }}', read(name + '.html'))
+    return email_templates.RenderedEmail(
+        fill(subject[len('Subject:'):].strip(), False), fill(text.lstrip('\n'), False), fill(page, True))
+
+
+def build_mime(email, to_email):
+    msg = MIMEMultipart('alternative')
+    msg['From'] = 'noreply@example.com'
+    msg['To'] = to_email
+    msg['Subject'] = email.subject
+    msg.attach(MIMEText(email.text, 'plain', 'utf-8'))
+    msg.attach(MIMEText(email.html, 'html', 'utf-8'))
+    return msg.as_bytes()
+
+
+def contexts(count):
+    return [{'name': f"Client {i}", 'date': '2026-03-14', 'time': f"{9 + i % 8:02d}:00",
+             'teams_join_url': f"https://teams.example.com/l/meetup/{i}" if i % 2 else None}
+            for i in range(count)]
+
+
+def run(label, render, args):
+    started = time.perf_counter()
+    emails = render()
+    if args.mime:
+        for i, email in enumerate(emails):
+            build_mime(email, f"client{i}@example.com")
+    elapsed = time.perf_counter() - started
+    print(f"  {label:28s} {len(emails) / elapsed:10.0f} msg/s")
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--template', default='appointment_confirmation')
+    parser.add_argument('--mime', action='store_true', help="Also build the MIME message for each email")
+    args = parser.parse_args()
+
+    email_templates.load_templates()
+    shared = {'service_name': 'Tax Return Preparation'}
+    recipients = contexts(args.messages)
+    full = [dict(context, **shared) for context in recipients]
+    print(f"{args.messages} '{args.template}' emails{' with MIME build' if args.mime else ''}")
+
+    baseline = run('read + substitute per message', lambda: [render_per_message(args.template, c) for c in full], args)
+    single = run('compiled, render_email', lambda: [email_templates.render_email(args.template, **c) for c in full], args)
+    bulk = run('compiled, render_many', lambda: email_templates.render_many(args.template, recipients, **shared), args)
+    assert baseline == single == bulk, "renderers disagree"
+
+
+if __name__ == '__main__':
+    main()
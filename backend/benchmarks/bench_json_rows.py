@@ -0,0 +1,119 @@
+"""
+Compare serializing appointment rows the old way (walk every column,
+stringify timedeltas, let Flask's JSON provider handle Decimal and dates)
+with JsonReadyCursor's per-column conversion plan.
+
+Rows are generated in memory with the column types get_appointments()
+returns, so no database is needed. Run from the backend directory:
+
+    python benchmarks/bench_json_rows.py --rows 10000 --repeat 20
+"""
+import argparse
+import datetime
+import decimal
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from mysql.connector.constants import FieldType  # noqa: E402
+from db_convert import JsonReadyCursor  # noqa: E402
+
+# Columns of "SELECT a.*, u.name AS client_name, s.name AS service_name, s.price ..."
+DESCRIPTION = [
+    ('id', FieldType.LONG),
+    ('user_id', FieldType.LONG),
+    ('service_id', FieldType.LONG),
+    ('appointment_date', FieldType.DATE),
+    ('appointment_time', FieldType.TIME),
+    ('notes', FieldType.BLOB),
+    ('admin_notes', FieldType.BLOB),
+    ('status', FieldType.STRING),
+    ('created_at', FieldType.DATETIME),
+    ('updated_at', FieldType.DATETIME),
+    ('client_name', FieldType.VAR_STRING),
+    ('service_name', FieldType.VAR_STRING),
+    ('service_price', FieldType.NEWDECIMAL),
+]
+
+
+class FakeCursor:
+    """Hands out pre-built dict rows the way a buffered dictionary cursor would"""
+
+    def __init__(self, rows):
+        self.description = [(name, type_code) + (None,) * 5 for name, type_code in DESCRIPTION]
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+def make_rows(count):
+    base = datetime.datetime(2030, 1, 1, 9, 0)
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': i,
+            'user_id': i % 500,
+            'service_id': i % 12,
+            'appointment_date': (base + datetime.timedelta(days=i % 365)).date(),
+            'appointment_time': datetime.timedelta(hours=9 + i % 8),
+            'notes': 'Bring last year\'s return',
+            'admin_notes': None,
+            'status': 'confirmed',
+            'created_at': base,
+            'updated_at': base,
+            'client_name': f'Client {i}',
+            'service_name': 'Individual tax return',
+            'service_price': decimal.Decimal('149.00'),
+        })
+    return rows
+
+
+def old_way(app, rows):
+    for row in rows:
+        for key, value in row.items():
+            if isinstance(value, datetime.timedelta):
+                row[key] = str(value)
+    return app.json.dumps({"appointments": rows})
+
+
+def new_way(app, rows):
+    cursor = JsonReadyCursor(FakeCursor(rows), dictionary=True)
+    return app.json.dumps({"appointments": cursor.fetchall()})
+
+
+def measure(fn, app, count, repeat):
+    best = None
+    for _ in range(repeat):
+        rows = make_rows(count)
+        started = time.perf_counter()
+        fn(app, rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        results = {
+            'per-row loop': measure(old_way, app, args.rows, args.repeat),
+            'conversion plan': measure(new_way, app, args.rows, args.repeat),
+        }
+    print(f"{args.rows} rows, best of {args.repeat}:")
+    for label, elapsed in results.items():
+        print(f"  {label:16s} {elapsed * 1000:8.1f} ms  {elapsed / args.rows * 1e6:.2f} us/row")
+    saved = 1 - results['conversion plan'] / results['per-row loop']
+    print(f"  time saved: {saved:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Mixed-traffic latency during a login storm, with bcrypt run inline on the
+request threads versus through the bounded hashing pool.
+
+A fixed number of "request threads" (like a threaded WSGI server) serve an
+open-loop stream of requests: a share are logins (one bcrypt check), the
+rest are light API calls (a little JSON work plus a short simulated DB
+wait). p50/p99 are reported per request type, along with how many logins
+the pool shed with 429. Run from the backend directory:
+
+    python benchmarks/bench_login_storm.py --requests 2000 --rate 200 --login-share 0.3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt  # noqa: E402
+from hashing import HashingPool, HashingBusyError, _checkpw  # noqa: E402
+
+PAYLOAD = {"services": [{"id": i, "name": f"Service {i}", "price": 149.0} for i in range(20)]}
+
+
+def light_request():
+    json.dumps(PAYLOAD)
+    time.sleep(0.002)  # stand-in for a quick indexed query
+
+
+def login_request(pool, password, hashed):
+    try:
+        pool.submit(_checkpw, password, hashed)
+        return True
+    except HashingBusyError:
+        return False
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def run(pool, args, hashed):
+    rng = random.Random(1)
+    latencies = {'login': [], 'light': []}
+    rejected = [0]
+    lock = threading.Lock()
+
+    def handle(kind, arrived):
+        if kind == 'login':
+            ok = login_request(pool, b'correct horse', hashed)
+            if not ok:
+                with lock:
+                    rejected[0] += 1
+        else:
+            light_request()
+        with lock:
+            latencies[kind].append(time.perf_counter() - arrived)
+
+    with ThreadPoolExecutor(max_workers=args.threads) as server:
+        started = time.perf_counter()
+        for i in range(args.requests):
+            arrival = started + i / args.rate
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind = 'login' if rng.random() < args.login_share else 'light'
+            server.submit(handle, kind, time.perf_counter())
+    return latencies, rejected[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help="Requests per second")
+    parser.add_argument('--login-share', type=float, default=0.3)
+    parser.add_argument('--threads', type=int, default=16, help="Request threads")
+    parser.add_argument('--rounds', type=int, default=12, help="bcrypt cost of the stored hash")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--queue-limit', type=int, default=2 * (os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b'correct horse', bcrypt.gensalt(args.rounds))
+    modes = {
+        'inline bcrypt': HashingPool(0, 0),
+        'hashing pool': HashingPool(args.workers, args.queue_limit),
+    }
+    print(f"{args.requests} requests at {args.rate:.0f}/s, {args.login_share:.0%} logins, "
+          f"{args.threads} request threads, bcrypt cost {args.rounds}")
+    for label, pool in modes.items():
+        latencies, rejected = run(pool, args, hashed)
+        pool.shutdown()
+        print(f"  {label}:")
+        for kind in ('light', 'login'):
+            values = latencies[kind]
+            print(f"    {kind:5s} n={len(values):5d}  p50 {percentile(values, 50) * 1000:8.1f} ms  "
+                  f"p99 {percentile(values, 99) * 1000:8.1f} ms")
+        print(f"    logins rejected with 429: {rejected}")
+
+
+if __name__ == '__main__':
+    main()
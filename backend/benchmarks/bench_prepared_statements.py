@@ -0,0 +1,103 @@
+"""
+Compare the text protocol with the prepared statement cache on the hot
+authentication and appointment lookups.
+
+Needs a reachable database configured through the usual DB_* environment
+variables with the schema from database.sql loaded. Run from the backend
+directory:
+
+    python benchmarks/bench_prepared_statements.py --iterations 5000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool, primary_connect_kwargs  # noqa: E402
+
+AUTH_PATH = [
+    ("SELECT * FROM users WHERE email = %s", 'email'),
+    ("SELECT role FROM users WHERE id = %s", 'user_id'),
+]
+
+APPOINTMENT_PATH = [
+    ("SELECT id, name, duration FROM services WHERE id = %s", 'service_id'),
+    ("SELECT email, name FROM users WHERE id = %s", 'user_id'),
+    (
+        """
+        SELECT id FROM appointments 
+        WHERE appointment_date = %s AND appointment_time = %s AND status != 'cancelled'
+        """,
+        'slot',
+    ),
+]
+
+
+def load_params(pool):
+    conn = pool.checkout()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT id, email FROM users ORDER BY id LIMIT 1")
+    user = cursor.fetchone()
+    cursor.execute("SELECT id FROM services ORDER BY id LIMIT 1")
+    service = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    if not user or not service:
+        sys.exit("Benchmark needs at least one user and one service in the database")
+    return {
+        'email': (user['email'],),
+        'user_id': (user['id'],),
+        'service_id': (service['id'],),
+        'slot': ('2030-01-01', '09:00'),
+    }
+
+
+def run_path(pool, path, params, iterations):
+    conn = pool.checkout()
+    cursor = conn.cursor(dictionary=True)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for sql, key in path:
+            cursor.execute(sql, params[key])
+            cursor.fetchall()
+    elapsed = time.perf_counter() - started
+    cursor.close()
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    pools = {
+        'text protocol': ConnectionPool('bench-text', primary_connect_kwargs(), min_size=1, max_size=1,
+                                        statement_cache_size=0),
+        'prepared cache': ConnectionPool('bench-prepared', primary_connect_kwargs(), min_size=1, max_size=1,
+                                         statement_cache_size=32),
+    }
+    params = load_params(pools['text protocol'])
+
+    for label, path in (('authentication', AUTH_PATH), ('appointment', APPOINTMENT_PATH)):
+        print(f"{label} path: {len(path)} queries x {args.iterations} iterations")
+        results = {}
+        for mode, pool in pools.items():
+            # Warm up so the prepared pool has its statements prepared
+            run_path(pool, path, params, 10)
+            results[mode] = run_path(pool, path, params, args.iterations)
+            queries = len(path) * args.iterations
+            print(f"  {mode:15s} {results[mode]:.3f}s  {queries / results[mode]:,.0f} queries/s  "
+                  f"{results[mode] / queries * 1e6:.1f} us/query")
+        saved = 1 - results['prepared cache'] / results['text protocol']
+        print(f"  time saved by prepared statements: {saved:.1%}")
+
+    print("statement cache:", pools['prepared cache'].metrics()['statements'])
+    for pool in pools.values():
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
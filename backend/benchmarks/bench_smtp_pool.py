@@ -0,0 +1,75 @@
+"""
+Email throughput with a new SMTP connection per message (the old send_email)
+versus pooled, authenticated sessions (smtp_pool.SMTPPool).
+
+Both modes send the same messages from a few sender threads to the local
+SMTP sink, which adds --latency before every reply to stand in for the
+network round trip to a real provider. The per-message mode pays connect,
+EHLO, login and QUIT for each email; with a real provider it would also pay
+STARTTLS, so the gap here is a lower bound. Run from the backend directory:
+
+    python benchmarks/bench_smtp_pool.py --messages 300 --latency 0.01 --threads 4
+"""
+import argparse
+import os
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from smtp_pool import SMTPPool  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+
+def build_message(i):
+    msg = MIMEMultipart()
+    msg['From'] = 'noreply@example.com'
+    msg['To'] = f'client{i}@example.com'
+    msg['Subject'] = 'Appointment Confirmation'
+    msg.attach(MIMEText(f"Hi client {i},\n\nYour appointment has been scheduled.\n", 'plain'))
+    return msg
+
+
+def send_per_message(sink, msg):
+    server = smtplib.SMTP(sink.host, sink.port)
+    server.login('user', 'password')
+    server.send_message(msg)
+    server.quit()
+
+
+def run(label, send, args, sink):
+    sink.reset_stats()
+    messages = [build_message(i) for i in range(args.messages)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as senders:
+        list(senders.map(send, messages))
+    elapsed = time.perf_counter() - started
+    print(f"  {label:22s} {args.messages / elapsed:8.1f} msg/s  "
+          f"{sink.stats['connections']:4d} connections  {sink.stats['logins']:4d} logins")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=4, help="Concurrent senders")
+    parser.add_argument('--sessions', type=int, default=3, help="Pool size (max_sessions)")
+    parser.add_argument('--latency', type=float, default=0.01, help="Seconds the sink waits before each reply")
+    args = parser.parse_args()
+
+    sink = SMTPSink(latency=args.latency).start()
+    print(f"{args.messages} messages, {args.threads} sender threads, {args.latency * 1000:.0f} ms per SMTP reply")
+    run('connect per message', lambda msg: send_per_message(sink, msg), args, sink)
+
+    pool = SMTPPool('bench', sink.host, sink.port, 'user', 'password', starttls=False, max_sessions=args.sessions)
+    run(f'pool ({args.sessions} sessions)', pool.send, args, sink)
+    pool.close()
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
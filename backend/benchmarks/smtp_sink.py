@@ -0,0 +1,203 @@
+"""
+Local SMTP sink: accepts and discards mail so email code can be exercised
+without sending anything through EmailConfig.SMTP_SERVER.
+
+Speaks enough SMTP for smtplib (EHLO, AUTH PLAIN/LOGIN accepting any
+credentials, MAIL, RCPT, DATA, RSET, NOOP, QUIT); no STARTTLS, so point
+clients at it with SMTP_STARTTLS=False. --latency (plus up to --jitter)
+delays every reply to stand in for the round trip to a real provider.
+Failures can be injected after DATA: --fail-rate answers 451 (temporary,
+worth retrying), --reject-rate answers 550 (permanent) and
+--disconnect-rate drops the connection without replying. Run from the
+backend directory:
+
+    python benchmarks/smtp_sink.py --port 2525 --latency 0.02 --fail-rate 0.05
+"""
+import argparse
+import random
+import socketserver
+import threading
+import time
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        delay = self.server.sink.delay()
+        if delay:
+            time.sleep(delay)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink._count('connections')
+        self.reply("220 localhost ESMTP sink")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.wfile.write(b'250-localhost\r\n250-8BITMIME\r\n')
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == 'HELO':
+                self.reply("250 localhost")
+            elif verb == 'AUTH':
+                parts = command.split()
+                if len(parts) > 1 and parts[1].upper() == 'LOGIN':
+                    for prompt in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6'):
+                        self.reply(f"334 {prompt}")
+                        self.rfile.readline()
+                sink._count('logins')
+                self.reply("235 Authentication successful")
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[-1].strip(' <>'))
+                self.reply("250 OK")
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply("250 OK")
+            elif verb == 'NOOP':
+                sink._count('noops')
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                outcome = sink.outcome()
+                if outcome == 'disconnects':
+                    sink._count('disconnects')
+                    return
+                if outcome == 'failures':
+                    sink._count('failures')
+                    self.reply("451 4.3.0 Temporary failure, try again later")
+                elif outcome == 'rejects':
+                    sink._count('rejects')
+                    self.reply("550 5.7.1 Message rejected")
+                else:
+                    sink._delivered(recipients)
+                    self.reply("250 OK queued")
+                recipients = []
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class SMTPSink:
+    """
+    Threaded SMTP sink that counts connections, logins, NOOPs, messages and
+    injected failures, and notes when each recipient's message arrived.
+
+    Args:
+        host (str): Address to bind
+        port (int): Port to bind; 0 picks a free one
+        latency (float): Seconds added before every reply
+        jitter (float): Up to this many extra seconds, at random, per reply
+        fail_rate (float): Share of messages answered 451
+        reject_rate (float): Share of messages answered 550
+        disconnect_rate (float): Share of messages whose connection is dropped instead of answered
+        seed (int): Seed for the random choices, for repeatable runs
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, fail_rate=0.0, reject_rate=0.0,
+                 disconnect_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self.disconnect_rate = disconnect_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Condition()
+        self.stats = {'connections': 0, 'logins': 0, 'noops': 0, 'messages': 0,
+                      'failures': 0, 'rejects': 0, 'disconnects': 0}
+        self.arrivals = {}  # recipient -> time.monotonic() its last message was accepted
+        self._server = _Server((host, port), _SinkHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _delivered(self, recipients):
+        now = time.monotonic()
+        with self._lock:
+            self.stats['messages'] += 1
+            for recipient in recipients:
+                self.arrivals[recipient] = now
+            self._lock.notify_all()
+
+    def delay(self):
+        if not self.jitter:
+            return self.latency
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def outcome(self):
+        """What happens to the next message: 'messages', 'failures', 'rejects' or 'disconnects'"""
+        with self._lock:
+            roll = self._random.random()
+        for name, rate in (('disconnects', self.disconnect_rate), ('failures', self.fail_rate),
+                           ('rejects', self.reject_rate)):
+            if roll < rate:
+                return name
+            roll -= rate
+        return 'messages'
+
+    def wait_for(self, messages, timeout=None):
+        """Block until at least this many messages were accepted; False on timeout"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self.stats['messages'] >= messages, timeout)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self.stats:
+                self.stats[name] = 0
+            self.arrivals.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added before every reply")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Up to this many extra seconds per reply")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of messages answered 451")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="Share of messages answered 550")
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help="Share of messages whose connection is dropped")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.latency, args.jitter, args.fail_rate, args.reject_rate,
+                    args.disconnect_rate, args.seed).start()
+    print(f"SMTP sink listening on {sink.host}:{sink.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  {sink.stats}")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""
+Capture EXPLAIN plans for every query the backend runs against a large
+seeded dataset and fail if any of them scans a whole large table.
+
+The check builds a scratch database (DB_NAME + '_plan_check' by default)
+from database.sql and the migrations, seeds the high-volume tables, runs
+EXPLAIN on each statement found in SOURCE_FILES and on the repository
+loaders' queries, and exits with status 1 when a plan has access type ALL
+on a table with at least --min-rows rows, or when a statement can't be
+explained at all. Full scans of small lookup tables (service categories,
+templates, ...) are what MySQL should do and are not reported. Queries
+whose SQL is assembled at runtime beyond an IN (...) list are listed in
+the report as skipped.
+
+    python check_query_plans.py --users 20000 --plans-out plans.txt
+"""
+import argparse
+import ast
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import mysql.connector
+from config import db_config
+from migrate import run_migrations, split_statements
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FILES = [
+    os.path.join(BASE_DIR, name)
+    for name in ('methods.py', 'app.py', 'repositories.py', 'reminders.py', 'email_outbox.py', 'slot_index.py')
+]
+_EXPLAINABLE_RE = re.compile(r'\s*(?:SELECT\s.*\sFROM\s|UPDATE\s+\w+\s.*\bSET\s|DELETE\s+FROM\s)', re.I | re.S)
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*$', re.I)
+
+
+def _sql_text(node, assigned):
+    """
+    SQL held by an expression: a string literal, a name assigned one, an
+    f-string whose only fields fill an IN (...) list (rendered as one %s),
+    or a concatenation of those.
+
+    Returns:
+        str: The SQL, '' if it is built at runtime, or None if node isn't SQL-like at all
+    """
+    if isinstance(node, ast.Constant):
+        return node.value if isinstance(node.value, str) else None
+    if isinstance(node, ast.Name):
+        return assigned.get(node.id)
+    if isinstance(node, ast.JoinedStr):
+        text = ''
+        for part in node.values:
+            if isinstance(part, ast.Constant):
+                text += part.value
+            elif _IN_LIST_RE.search(text):
+                text += '%s'
+            else:
+                return ''
+        return text
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = _sql_text(node.left, assigned), _sql_text(node.right, assigned)
+        if left is None or right is None:
+            return None
+        return left + right if left and right else ''
+    return None
+
+
+def extract_queries(path):
+    """
+    Find SQL passed as the first argument of a call in a module: to
+    cursor.execute() and to helpers such as Repository._fetchone().
+
+    Handles string literals passed directly, names assigned a string
+    literal earlier in the same function (e.g. insert_form_query) and
+    f-strings that only interpolate an IN (...) placeholder list.
+
+    Returns:
+        tuple: (queries, skipped); queries are (function, 'file:line', sql)
+            tuples, skipped are (function, 'file:line') of execute() calls
+            whose SQL is built at runtime
+    """
+    with open(path, 'r') as file:
+        tree = ast.parse(file.read(), filename=path)
+    name = os.path.basename(path)
+
+    queries, skipped = [], []
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        assigned = {}
+        for node in ast.walk(func):
+            if isinstance(node, ast.Assign):
+                sql = _sql_text(node.value, assigned)
+                for target in node.targets:
+                    if sql and isinstance(target, ast.Name):
+                        assigned[target.id] = sql
+        for node in ast.walk(func):
+            if not (isinstance(node, ast.Call) and node.args):
+                continue
+            location = f"{name}:{node.lineno}"
+            sql = _sql_text(node.args[0], assigned)
+            if sql and _EXPLAINABLE_RE.match(sql):
+                queries.append((func.name, location, sql))
+            elif sql == '' and isinstance(node.func, ast.Attribute) and node.func.attr == 'execute':
+                skipped.append((func.name, location))
+    return queries, skipped
+
+
+def loader_queries():
+    """The IN (...) query of every BatchLoader on a Repository"""
+    from repositories import BatchLoader, Repository
+
+    queries = []
+    for attr, loader in vars(Repository()).items():
+        if isinstance(loader, BatchLoader):
+            sql = f"SELECT {loader.columns} FROM {loader.table} WHERE id IN (%s, %s)"
+            queries.append((f"Repository.{attr}", 'repositories.py', sql))
+    return queries
+
+
+def sample_value(column):
+    """Pick a plausible parameter for the column a placeholder is compared with"""
+    column = column.lower()
+    if column.endswith('_date') or column == 'date':
+        return '2030-01-15'
+    if column.endswith('_time'):
+        return '10:00:00'
+    if column.endswith('_at') or column.endswith('_expiry'):
+        return '2030-01-15 10:00:00'
+    if 'email' in column:
+        return 'user1@example.com'
+    if column in ('reference', 'verification_token', 'reset_token', 'firebase_uid', 'otp', 'status', 'form_data'):
+        return f'{column}-1'
+    return 1
+
+
+# The column a placeholder is compared with, from the text in front of it
+_COMPARED_RE = re.compile(r'([\w.]+)\s*(?:=|!=|<>|<=|>=|<|>|LIKE)\s*$', re.I)
+_IN_ITEM_RE = re.compile(r'([\w.]+)\s+IN\s*\((?:\s*%s\s*,)*\s*$', re.I)
+
+
+def bind_sample_params(sql):
+    """
+    Replace every %s with a literal suited to its column. Placeholders not
+    compared with a column (LIMIT %s, INTERVAL %s SECOND) get 1.
+    """
+    parts = sql.split('%s')
+    values = []
+    for i in range(1, len(parts)):
+        before = '%s'.join(parts[:i])
+        match = _COMPARED_RE.search(before) or _IN_ITEM_RE.search(before)
+        values.append(sample_value(match.group(1).split('.')[-1] if match else ''))
+    out = parts[0]
+    for value, part in zip(values, parts[1:]):
+        out += (str(value) if isinstance(value, int) else "'" + value.replace("'", "''") + "'") + part
+    return out
+
+
+def strip_comments(statement):
+    """Remove -- and /* */ comments, so a statement is classified by its first keyword"""
+    statement = re.sub(r'/\*.*?\*/', ' ', statement, flags=re.S)
+    return '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('--')).strip()
+
+
+def create_scratch_database(conn, name):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+    cursor.execute(f"CREATE DATABASE `{name}`")
+    cursor.execute(f"USE `{name}`")
+    with open(os.path.join(BASE_DIR, 'database.sql'), 'r') as file:
+        for statement in split_statements(file.read()):
+            statement = strip_comments(statement)
+            # database.sql selects its own database; stay in the scratch one
+            first = statement.split(None, 2)
+            if first and first[0].upper() == 'USE':
+                continue
+            if len(first) > 1 and first[0].upper() == 'CREATE' and first[1].upper() == 'DATABASE':
+                continue
+            cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+    run_migrations(conn)
+
+
+def insert_batches(cursor, sql, rows, batch_size=5000):
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def seed(conn, users):
+    """Fill the high-volume tables, scaled from the user count"""
+    rng = random.Random(42)
+    cursor = conn.cursor()
+    now = datetime.datetime(2030, 1, 1)
+    statuses = ['pending', 'confirmed', 'completed', 'cancelled']
+
+    insert_batches(cursor, """
+        INSERT INTO users (name, email, password, role, verification_token, reset_token, firebase_uid, is_verified)
+        VALUES (%s, %s, 'x', %s, %s, %s, %s, 1)
+        """, [
+            (f'User {i}', f'user{i}@example.com', 'admin' if i % 5000 == 0 else 'client',
+             f'verification_token-{i}', f'reset_token-{i}', f'firebase_uid-{i}')
+            for i in range(1, users + 1)
+        ])
+    cursor.execute("SELECT COUNT(*) FROM services")
+    services = cursor.fetchone()[0]
+
+    appointments = users * 4
+    insert_batches(cursor, """
+        INSERT INTO appointments (user_id, service_id, appointment_date, appointment_time, status, notes)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        """, [
+            (rng.randint(1, users), rng.randint(1, services),
+             now.date() + datetime.timedelta(days=rng.randint(0, 365)),
+             f'{rng.randint(9, 16):02d}:00:00', rng.choice(statuses), '')
+            for _ in range(appointments)
+        ])
+    insert_batches(cursor, """
+        INSERT INTO invoices (user_id, invoice_number, issue_date, due_date, subtotal_amount, tax_amount, total_amount, created_at)
+        VALUES (%s, %s, %s, %s, 100, 10, 110, %s)
+        """, [
+            (rng.randint(1, users), f'INV-{i}', now.date(), now.date(), now - datetime.timedelta(minutes=i))
+            for i in range(1, users + 1)
+        ])
+    insert_batches(cursor, """
+        INSERT INTO invoice_items (invoice_id, description, quantity, unit_price, total_price)
+        VALUES (%s, 'Service', 1, 100, 100)
+        """, [(i,) for i in range(1, users + 1)])
+    insert_batches(cursor, """
+        INSERT INTO payments (user_id, invoice_id, amount, payment_method, reference, status, created_at)
+        VALUES (%s, %s, 110, 'credit_card', %s, 'completed', %s)
+        """, [
+            (rng.randint(1, users), rng.randint(1, users), f'reference-{i}', now - datetime.timedelta(minutes=i))
+            for i in range(1, users * 2 + 1)
+        ])
+    insert_batches(cursor, """
+        INSERT INTO notifications (user_id, title, message, type, created_at)
+        VALUES (%s, 'Title', 'Message', 'info', %s)
+        """, [
+            (rng.randint(1, users), now - datetime.timedelta(minutes=i))
+            for i in range(1, users * 4 + 1)
+        ])
+    insert_batches(cursor, """
+        INSERT INTO calendar_events (user_id, title, event_date, start_time, end_time)
+        VALUES (%s, 'Event', %s, '09:00:00', '10:00:00')
+        """, [
+            (rng.randint(1, users), now.date() + datetime.timedelta(days=rng.randint(0, 365)))
+            for _ in range(users)
+        ])
+    insert_batches(cursor, """
+        INSERT INTO email_verification (email, otp, created_at) VALUES (%s, '123456', %s)
+        """, [(f'pending{i}@example.com', now) for i in range(1, users + 1)])
+    insert_batches(cursor, """
+        INSERT INTO tax_forms (id, user_id, form_data, status) VALUES (%s, %s, %s, 'submitted')
+        """, [
+            (f'form-{i}', rng.randint(1, users), json.dumps({'email': f'user{i}@example.com'}))
+            for i in range(1, users + 1)
+        ])
+    conn.commit()
+
+    cursor.execute("SHOW TABLES")
+    for (table,) in cursor.fetchall():
+        cursor.execute(f"ANALYZE TABLE `{table}`")
+        cursor.fetchall()
+    cursor.close()
+
+
+def table_sizes(conn):
+    cursor = conn.cursor()
+    sizes = {}
+    cursor.execute("SHOW TABLES")
+    for (table,) in cursor.fetchall():
+        cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+        sizes[table] = cursor.fetchone()[0]
+    cursor.close()
+    return sizes
+
+
+def explain_all(conn, queries, sizes, min_rows):
+    """
+    Returns:
+        tuple: (report lines, list of failures)
+    """
+    cursor = conn.cursor(dictionary=True)
+    report, failures = [], []
+    for func, location, sql in queries:
+        statement = bind_sample_params(sql)
+        report.append(f"{func} ({location})")
+        report.append("    " + " ".join(statement.split()))
+        try:
+            cursor.execute("EXPLAIN " + statement)
+            plan = cursor.fetchall()
+        except mysql.connector.Error as err:
+            # A query that doesn't match the schema fails in production too
+            report.append(f"    could not explain: {err}")
+            failures.append(f"{func} ({location}) could not be explained: {err}")
+            continue
+        for row in plan:
+            table = row.get('table')
+            access = row.get('type')
+            report.append(
+                f"    table={table} type={access} key={row.get('key')} rows={row.get('rows')} extra={row.get('Extra')}"
+            )
+            # Aliases are used in joins; resolve them to the table they name
+            real_table = resolve_alias(sql, table)
+            if access == 'ALL' and sizes.get(real_table, 0) >= min_rows:
+                failures.append(f"{func} ({location}) full scan of {real_table} ({sizes[real_table]} rows)")
+    cursor.close()
+    return report, failures
+
+
+def resolve_alias(sql, alias):
+    if alias is None:
+        return None
+    match = re.search(r'(?:FROM|JOIN|UPDATE)\s+(\w+)\s+(?:AS\s+)?' + re.escape(alias) + r'\b', sql, re.I)
+    return match.group(1) if match else alias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', default=f"{db_config.DB_NAME}_plan_check")
+    parser.add_argument('--users', type=int, default=20000, help="Seeded users; other tables scale from this")
+    parser.add_argument('--min-rows', type=int, default=1000, help="Tables smaller than this may be scanned")
+    parser.add_argument('--plans-out', help="Write every captured plan to this file")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch database afterwards")
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(
+        host=db_config.DB_HOST,
+        port=db_config.DB_PORT,
+        user=db_config.DB_USER,
+        password=db_config.DB_PASSWORD
+    )
+    try:
+        create_scratch_database(conn, args.database)
+        seed(conn, args.users)
+        sizes = table_sizes(conn)
+        queries, skipped = loader_queries(), []
+        for path in SOURCE_FILES:
+            found, dynamic = extract_queries(path)
+            queries.extend(found)
+            skipped.extend(dynamic)
+        report, failures = explain_all(conn, queries, sizes, args.min_rows)
+        report.extend(f"{func} ({location}) skipped: SQL built at runtime" for func, location in skipped)
+    finally:
+        if not args.keep:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+            cursor.close()
+        conn.close()
+
+    if args.plans_out:
+        with open(args.plans_out, 'w') as file:
+            file.write("\n".join(report) + "\n")
+    print(f"Checked {len(queries)} queries, skipped {len(skipped)} built at runtime")
+    if failures:
+        print("Full table scans or unexplainable queries found:")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("No full scans of large tables.")
+
+
+if __name__ == '__main__':
+    main()
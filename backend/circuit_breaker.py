@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailableError(Exception):
+    """
+    Raised instead of waiting on the database when it is known to be down or saturated.
+
+    Args:
+        message (str): Error description
+        retry_after (float): Seconds the client should wait before retrying
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        """retry_after rounded up to whole seconds for the Retry-After header"""
+        return str(max(1, int(math.ceil(self.retry_after))))
+
+
+class CircuitOpenError(DatabaseUnavailableError):
+    """The circuit breaker is open and calls are rejected without trying"""
+
+
+class BulkheadFullError(DatabaseUnavailableError):
+    """Too many requests are already using the database"""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker.
+
+    Outcomes are kept for the last `window` seconds. Once at least min_calls
+    outcomes are recorded and the share of failures reaches failure_rate, the
+    circuit opens and before_call() raises CircuitOpenError for reset_timeout
+    seconds. After that the circuit is half-open: up to half_open_max_calls
+    trial calls are let through, the first success closes the circuit and a
+    failure opens it again.
+
+    Args:
+        name (str): Name used in logs and metrics
+        failure_rate (float): Failure share (0-1) that opens the circuit
+        min_calls (int): Outcomes needed in the window before the rate is trusted
+        window (float): Seconds of outcomes considered
+        reset_timeout (float): Seconds the circuit stays open before a trial call
+        half_open_max_calls (int): Concurrent trial calls allowed while half-open
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=30, reset_timeout=15, half_open_max_calls=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._outcomes = deque()  # (timestamp, ok)
+        self._failures = 0
+        self._opened_at = None
+        self._trials = 0
+        self._stats = {'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state_locked(time.monotonic())
+
+    def _current_state_locked(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def _prune_locked(self, now):
+        cutoff = now - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def _open_locked(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+        self._stats['opened'] += 1
+
+    def before_call(self):
+        """
+        Check whether a call may go ahead.
+
+        Returns:
+            bool: True when the call is a half-open trial whose outcome decides the circuit
+
+        Raises:
+            CircuitOpenError: The circuit is open (or half-open with its trials in flight)
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state_locked(now)
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and self._trials < self.half_open_max_calls:
+                self._trials += 1
+                return True
+            self._stats['rejected'] += 1
+            retry_after = max(self.reset_timeout - (now - self._opened_at), 1)
+        raise CircuitOpenError(f"Circuit '{self.name}' is open", retry_after=retry_after)
+
+    def release_trial(self):
+        """Give back a half-open trial slot taken by before_call() whose call never reached the server"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state_locked(now)
+            if state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._trials = 0
+                logger.info(f"Circuit '{self.name}' closed")
+            elif state == self.OPEN:
+                return
+            self._outcomes.append((now, True))
+            self._prune_locked(now)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state_locked(now)
+            if state == self.HALF_OPEN:
+                self._open_locked(now)
+                logger.warning(f"Circuit '{self.name}' re-opened after a failed trial call")
+                return
+            if state == self.OPEN:
+                return
+            self._outcomes.append((now, False))
+            self._failures += 1
+            self._prune_locked(now)
+            calls = len(self._outcomes)
+            if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+                logger.error(f"Circuit '{self.name}' opened: {self._failures}/{calls} failures in {self.window}s")
+                self._open_locked(now)
+
+    def metrics(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune_locked(now)
+            stats = dict(self._stats)
+            stats['state'] = self._current_state_locked(now)
+            stats['calls'] = len(self._outcomes)
+            stats['failures'] = self._failures
+        return stats
+
+
+class Bulkhead:
+    """
+    Caps how many requests use the database at once.
+
+    Requests over the cap wait up to queue_timeout for a slot and are then
+    rejected with BulkheadFullError, so overload turns into quick 503s rather
+    than a growing backlog of blocked worker threads.
+
+    Args:
+        name (str): Name used in logs and metrics
+        max_concurrent (int): Requests allowed to hold database connections at once
+        queue_timeout (float): Seconds a request waits for a slot
+    """
+
+    def __init__(self, name, max_concurrent, queue_timeout=1):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._stats = {'acquired': 0, 'rejected': 0}
+
+    def acquire(self):
+        """
+        Take a slot, waiting up to queue_timeout.
+
+        Raises:
+            BulkheadFullError: No slot freed up in time
+        """
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._semaphore.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            if not acquired:
+                self._stats['rejected'] += 1
+            else:
+                self._active += 1
+                self._stats['acquired'] += 1
+        if not acquired:
+            logger.warning(f"Bulkhead '{self.name}' full ({self.max_concurrent} active), rejecting request")
+            raise BulkheadFullError(f"Too many concurrent database requests on '{self.name}'", retry_after=1)
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+        self._semaphore.release()
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = self._active
+            stats['waiting'] = self._waiting
+            stats['max_concurrent'] = self.max_concurrent
+        return stats
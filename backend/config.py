@@ -6,6 +6,13 @@ class AppConfig:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     API_PREFIX = '/api'
     CORS_HEADERS = 'Content-Type'
+    # Cooperative (gevent) serving mode, see serve_async.py
+    ASYNC_HOST = os.environ.get('ASYNC_HOST', '0.0.0.0')
+    ASYNC_PORT = int(os.environ.get('ASYNC_PORT', 5000))
+    ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 5000))  # concurrent requests held by one process
+    ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 50))  # replaces DB_POOL_MAX_SIZE in this mode
+    ASYNC_DB_MAX_CONCURRENT_REQUESTS = int(os.environ.get('ASYNC_DB_MAX_CONCURRENT_REQUESTS', 500))  # replaces DB_MAX_CONCURRENT_REQUESTS in this mode
+    WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', 1))  # server processes serving requests (gunicorn reads the same variable)
     
 # Database configuration
 class DatabaseConfig:
@@ -14,12 +21,79 @@ class DatabaseConfig:
     DB_PASSWORD = os.environ.get('DB_PASSWORD', 'mysql.0987mysql')
     DB_NAME = os.environ.get('DB_NAME', 'Accverse')
     DB_PORT = int(os.environ.get('DB_PORT', 3306))
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))  # seconds
+    DB_USE_PURE = os.environ.get('DB_USE_PURE', 'False') == 'True'  # pure-Python driver; required for cooperative I/O
+    # Connection pool settings
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_IDLE_TIMEOUT = int(os.environ.get('DB_POOL_IDLE_TIMEOUT', 300))  # seconds before idle connections above min size are closed
+    DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', 5))  # seconds to wait for a free connection
+    DB_POOL_PING_AFTER_IDLE = float(os.environ.get('DB_POOL_PING_AFTER_IDLE', 5))  # ping connections idle longer than this on checkout
+    # Read replicas: comma-separated host:port list, e.g. "db-replica-1:3306,localhost:3307"
+    DB_REPLICAS = [r.strip() for r in os.environ.get('DB_REPLICAS', '').split(',') if r.strip()]
+    DB_REPLICA_POOL_MAX_SIZE = int(os.environ.get('DB_REPLICA_POOL_MAX_SIZE', 10))
+    DB_REPLICA_CHECKOUT_TIMEOUT = float(os.environ.get('DB_REPLICA_CHECKOUT_TIMEOUT', 1))  # seconds before falling back to the primary
+    DB_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))  # seconds of replication lag tolerated for reads
+    DB_REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_LAG_CHECK_INTERVAL', 2))  # seconds between lag probes per replica
+    DB_READ_YOUR_WRITES_WINDOW = float(os.environ.get('DB_READ_YOUR_WRITES_WINDOW', 10))  # seconds a session reads from the primary after writing
+    DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 200))  # queries slower than this are logged
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 32))  # prepared statements kept per connection, 0 disables
+    DB_STATEMENT_PREPARE_AFTER = int(os.environ.get('DB_STATEMENT_PREPARE_AFTER', 2))  # executions before a statement is prepared
+    DB_BREAKER_FAILURE_RATE = float(os.environ.get('DB_BREAKER_FAILURE_RATE', 0.5))  # failure share that opens the circuit
+    DB_BREAKER_MIN_CALLS = int(os.environ.get('DB_BREAKER_MIN_CALLS', 5))  # outcomes needed before the rate is trusted
+    DB_BREAKER_WINDOW = float(os.environ.get('DB_BREAKER_WINDOW', 30))  # seconds of outcomes considered
+    DB_BREAKER_RESET_TIMEOUT = float(os.environ.get('DB_BREAKER_RESET_TIMEOUT', 15))  # seconds open before a trial connection
+    DB_MAX_CONCURRENT_REQUESTS = int(os.environ.get('DB_MAX_CONCURRENT_REQUESTS', 20))  # requests holding DB connections at once
+    DB_QUEUE_TIMEOUT = float(os.environ.get('DB_QUEUE_TIMEOUT', 1))  # seconds a request waits for a slot before a 503
 
 # JWT configuration
 class JWTConfig:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = 24 * 60 * 60  # 24 hours in seconds
     JWT_REFRESH_TOKEN_EXPIRES = 30 * 24 * 60 * 60  # 30 days in seconds
+    JWT_REFRESH_REUSE_GRACE = int(os.environ.get('JWT_REFRESH_REUSE_GRACE', 10))  # seconds a rotated refresh token still returns its successor
+    JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 10000))  # verified tokens kept in memory
+    JWT_CACHE_MAX_TTL = int(os.environ.get('JWT_CACHE_MAX_TTL', 3600))  # cache lifetime for tokens without exp
+    PRINCIPAL_CACHE_SIZE = int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000))  # user rows cached for authenticated requests
+    PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', 30))  # seconds a cached user row (role, name, email) is trusted
+
+# Password hashing configuration
+class PasswordConfig:
+    HASH_POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', os.cpu_count() or 1))  # hashing processes, 0 hashes on the request thread
+    HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', 2 * (os.cpu_count() or 1)))  # hashes waiting for a worker before 429s
+    HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))  # seconds a request waits for its hash
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 0))  # fixed work factor, 0 calibrates at startup
+    BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', 250))  # hash time the calibrated work factor aims for
+    BCRYPT_MIN_ROUNDS = int(os.environ.get('BCRYPT_MIN_ROUNDS', 10))
+    BCRYPT_MAX_ROUNDS = int(os.environ.get('BCRYPT_MAX_ROUNDS', 15))
+
+# Shared Redis-protocol server (rate limits, ephemeral tokens)
+class RedisConfig:
+    REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    REDIS_TIMEOUT = float(os.environ.get('REDIS_TIMEOUT', 0.5))  # seconds per command before falling back to in-process state
+
+# Rate limits for the auth endpoints, as "<count>/<seconds>"
+class RateLimitConfig:
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # 'memory' (per process) or 'redis' (shared)
+    RATE_LIMIT_SHARDS = int(os.environ.get('RATE_LIMIT_SHARDS', 16))  # lock shards of the in-process backend
+    RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))  # reverse proxies appending to X-Forwarded-For
+    RATE_LIMIT_LOGIN_IP = os.environ.get('RATE_LIMIT_LOGIN_IP', '30/300')  # token bucket: burst of 30, refills 30 per 5 minutes
+    RATE_LIMIT_LOGIN_EMAIL = os.environ.get('RATE_LIMIT_LOGIN_EMAIL', '10/900')
+    RATE_LIMIT_OTP_SEND_IP = os.environ.get('RATE_LIMIT_OTP_SEND_IP', '10/600')
+    RATE_LIMIT_OTP_SEND_EMAIL = os.environ.get('RATE_LIMIT_OTP_SEND_EMAIL', '3/600')
+    RATE_LIMIT_OTP_VERIFY_IP = os.environ.get('RATE_LIMIT_OTP_VERIFY_IP', '30/600')
+    RATE_LIMIT_OTP_VERIFY_EMAIL = os.environ.get('RATE_LIMIT_OTP_VERIFY_EMAIL', '5/600')  # guesses allowed against one OTP
+    RATE_LIMIT_RESET_IP = os.environ.get('RATE_LIMIT_RESET_IP', '10/3600')
+    RATE_LIMIT_RESET_EMAIL = os.environ.get('RATE_LIMIT_RESET_EMAIL', '3/3600')
+
+# Short-lived OTPs and emailed verification / password reset tokens
+class TokenStoreConfig:
+    TOKEN_STORE_BACKEND = os.environ.get('TOKEN_STORE_BACKEND', 'memory')  # 'memory' (single process, lost on restart) or 'redis' (shared); startup fails with 'memory' and WEB_CONCURRENCY > 1
+    TOKEN_STORE_SIZE = int(os.environ.get('TOKEN_STORE_SIZE', 100000))  # tokens and refresh token revocations kept by the in-process backend
+    OTP_TTL = int(os.environ.get('OTP_TTL', 5 * 60))  # seconds an emailed verification code is valid
+    VERIFICATION_TOKEN_TTL = int(os.environ.get('VERIFICATION_TOKEN_TTL', 24 * 60 * 60))
+    RESET_TOKEN_TTL = int(os.environ.get('RESET_TOKEN_TTL', 24 * 60 * 60))
 
 # Email configuration
 class EmailConfig:
@@ -29,6 +103,55 @@ class EmailConfig:
     SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
     SMTP_USERNAME = os.environ.get('SMTP_USERNAME', 'kaurnancy186@gmail.com')
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', 'pwnc mmiy rfkn gttd')
+    SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'True') == 'True'
+    SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 10))  # seconds per SMTP command
+    # Pooled SMTP sessions, see smtp_pool.py
+    SMTP_MAX_SESSIONS = int(os.environ.get('SMTP_MAX_SESSIONS', 3))  # open sessions per SMTP account
+    SMTP_CHECKOUT_TIMEOUT = float(os.environ.get('SMTP_CHECKOUT_TIMEOUT', 10))  # seconds a send waits for a free session
+    SMTP_KEEPALIVE_INTERVAL = float(os.environ.get('SMTP_KEEPALIVE_INTERVAL', 30))  # idle seconds before a NOOP keeps a session open
+    SMTP_IDLE_TIMEOUT = float(os.environ.get('SMTP_IDLE_TIMEOUT', 240))  # idle seconds before a session is closed
+
+# Email outbox workers, see email_outbox.py
+class OutboxConfig:
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 1))  # worker threads in the web process, 0 when run as a separate process
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 20))  # emails claimed per round
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 1))  # seconds between polls when idle
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))  # sends tried before an email is marked failed
+    OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', 30))  # seconds before the first retry, doubling after each failure
+    OUTBOX_BACKOFF_MAX = float(os.environ.get('OUTBOX_BACKOFF_MAX', 3600))
+    OUTBOX_LEASE = int(os.environ.get('OUTBOX_LEASE', 300))  # seconds a claimed email may stay unsent before another worker retries it
+    OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', 7))  # days sent and failed emails are kept before they are purged, 0 to keep them
+    OUTBOX_PURGE_INTERVAL = int(os.environ.get('OUTBOX_PURGE_INTERVAL', 3600))  # seconds between purges
+
+# Email delivery lanes and per-account rate limits, see email_delivery.py
+class DeliveryConfig:
+    DELIVERY_SENDERS = int(os.environ.get('DELIVERY_SENDERS', EmailConfig.SMTP_MAX_SESSIONS))  # sender threads, one SMTP session each
+    DELIVERY_URGENT_SENDERS = int(os.environ.get('DELIVERY_URGENT_SENDERS', 1))  # senders kept free for urgent mail
+    DELIVERY_LANE_CAPACITY = int(os.environ.get('DELIVERY_LANE_CAPACITY', 100))  # emails buffered in memory per lane; the rest wait in email_outbox
+    DELIVERY_URGENT_CATEGORIES = set(os.environ.get('DELIVERY_URGENT_CATEGORIES', 'otp,password_reset,verification').split(','))
+    DELIVERY_BULK_CATEGORIES = set(os.environ.get('DELIVERY_BULK_CATEGORIES', 'reminder').split(','))
+    DELIVERY_RATE = float(os.environ.get('DELIVERY_RATE', 5))  # emails per second per SMTP account and sending process; divide the account's limit between processes
+    DELIVERY_BURST = float(os.environ.get('DELIVERY_BURST', 20))
+    DELIVERY_DAILY_QUOTA = int(os.environ.get('DELIVERY_DAILY_QUOTA', 2000))  # emails per rolling day per SMTP account (Gmail Workspace: 2000), shared by every process through email_outbox, 0 for none
+    DELIVERY_URGENT_RESERVE = float(os.environ.get('DELIVERY_URGENT_RESERVE', 0.1))  # share of each rate limit only urgent mail may use
+    DELIVERY_QUOTA_SYNC_INTERVAL = float(os.environ.get('DELIVERY_QUOTA_SYNC_INTERVAL', 60))  # seconds between re-reading the daily quota used by all processes from email_outbox
+
+# Appointment reminders (reminders.py)
+class ReminderConfig:
+    REMINDER_SCHEDULER = os.environ.get('REMINDER_SCHEDULER', 'True') == 'True'  # run the scheduler thread in the web process
+    REMINDER_LEAD = int(os.environ.get('REMINDER_LEAD', 86400))  # seconds before the appointment the reminder goes out
+    REMINDER_HORIZON = int(os.environ.get('REMINDER_HORIZON', 900))  # seconds of upcoming reminders held in memory
+    REMINDER_REFRESH_INTERVAL = float(os.environ.get('REMINDER_REFRESH_INTERVAL', 60))  # seconds between loads of new and changed appointments
+    REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 500))  # reminders rendered and queued per transaction
+
+# Bookable appointment slots and the availability index, see slot_index.py
+class SlotConfig:
+    SLOT_DAY_START = os.environ.get('SLOT_DAY_START', '09:00')  # first slot
+    SLOT_DAY_END = os.environ.get('SLOT_DAY_END', '17:00')  # the last slot ends here
+    SLOT_MINUTES = int(os.environ.get('SLOT_MINUTES', 60))
+    SLOT_INDEX_BACKEND = os.environ.get('SLOT_INDEX_BACKEND', 'local')  # 'redis' shares version counters between server processes
+    SLOT_INDEX_SIZE = int(os.environ.get('SLOT_INDEX_SIZE', 1000))  # dates kept in memory
+    SLOT_INDEX_TTL = float(os.environ.get('SLOT_INDEX_TTL', 300))  # seconds before a date is reloaded; bounds staleness with the local backend
 
 # File upload configuration
 class UploadConfig:
@@ -49,6 +172,9 @@ class FirebaseConfig:
     PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', 'accverse-8bd06')
     # Path to service account JSON file - in production, use environment variables
     SERVICE_ACCOUNT_PATH = os.environ.get('FIREBASE_SERVICE_ACCOUNT_PATH', os.path.join(os.getcwd(), 'firebase-service-account.json'))
+    # Google's ID token signing certificates, cached for the max-age they are served with
+    CERTS_URL = os.environ.get('FIREBASE_CERTS_URL', 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com')
+    TOKEN_CACHE_SIZE = int(os.environ.get('FIREBASE_TOKEN_CACHE_SIZE', 1000))  # verified ID tokens kept until they expire
     # For proper Firebase Admin initialization
     os.environ['GOOGLE_CLOUD_PROJECT'] = PROJECT_ID
     
@@ -56,7 +182,15 @@ class FirebaseConfig:
 app_config = AppConfig()
 db_config = DatabaseConfig()
 jwt_config = JWTConfig()
+password_config = PasswordConfig()
+redis_config = RedisConfig()
+rate_limit_config = RateLimitConfig()
+token_store_config = TokenStoreConfig()
 email_config = EmailConfig()
+outbox_config = OutboxConfig()
+delivery_config = DeliveryConfig()
+reminder_config = ReminderConfig()
+slot_config = SlotConfig()
 upload_config = UploadConfig()
 teams_config = TeamsConfig()
 firebase_config = FirebaseConfig()
@@ -0,0 +1,116 @@
+import datetime
+from functools import lru_cache
+from mysql.connector.constants import FieldType
+
+
+def time_to_str(value):
+    """TIME columns arrive as timedelta; render them as HH:MM:SS"""
+    if isinstance(value, datetime.timedelta):
+        seconds = int(value.total_seconds())
+        sign = '-' if seconds < 0 else ''
+        hours, rest = divmod(abs(seconds), 3600)
+        minutes, seconds = divmod(rest, 60)
+        return f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return str(value)
+
+
+def date_to_str(value):
+    return value.isoformat()
+
+
+def decimal_to_float(value):
+    return float(value)
+
+
+# MySQL column type -> function producing a JSON-ready value
+_CONVERTERS = {
+    FieldType.TIME: time_to_str,
+    FieldType.DATE: date_to_str,
+    FieldType.NEWDATE: date_to_str,
+    FieldType.DATETIME: date_to_str,
+    FieldType.TIMESTAMP: date_to_str,
+    FieldType.DECIMAL: decimal_to_float,
+    FieldType.NEWDECIMAL: decimal_to_float,
+}
+
+
+@lru_cache(maxsize=512)
+def conversion_plan(columns):
+    """
+    Work out which columns of a result need converting.
+
+    Args:
+        columns (tuple): (name, type_code) per column, as in cursor.description
+
+    Returns:
+        tuple: (index, name, converter) for every column that needs converting
+    """
+    plan = []
+    for index, (name, type_code) in enumerate(columns):
+        converter = _CONVERTERS.get(type_code)
+        if converter is not None:
+            plan.append((index, name, converter))
+    return tuple(plan)
+
+
+class JsonReadyCursor:
+    """
+    Cursor wrapper whose rows contain only JSON-ready values.
+
+    TIME becomes 'HH:MM:SS', DATE/DATETIME/TIMESTAMP become ISO 8601 strings
+    and DECIMAL becomes float. The columns to convert are worked out once per
+    result shape from cursor.description, so each row only touches the
+    columns that need it instead of type-checking every value.
+
+    Args:
+        cursor: Cursor to wrap
+        dictionary (bool): Rows are dicts rather than tuples
+    """
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _plan(self):
+        description = self._cursor.description
+        if not description:
+            return ()
+        return conversion_plan(tuple((column[0], column[1]) for column in description))
+
+    def _convert(self, rows, plan):
+        if not plan:
+            return rows
+        if self._dictionary:
+            for row in rows:
+                for _, name, converter in plan:
+                    value = row[name]
+                    if value is not None:
+                        row[name] = converter(value)
+            return rows
+        converted = []
+        for row in rows:
+            row = list(row)
+            for index, _, converter in plan:
+                value = row[index]
+                if value is not None:
+                    row[index] = converter(value)
+            converted.append(tuple(row))
+        return converted
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is None:
+            return None
+        return self._convert([row], self._plan())[0]
+
+    def fetchmany(self, size=1):
+        return self._convert(self._cursor.fetchmany(size), self._plan())
+
+    def fetchall(self):
+        return self._convert(self._cursor.fetchall(), self._plan())
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
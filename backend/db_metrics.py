@@ -0,0 +1,151 @@
+import re
+import sys
+import time
+import threading
+import logging
+from collections import deque
+from functools import lru_cache
+from flask import g, has_request_context
+from config import db_config
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r'/\*.*?\*/|--[^\n]*', re.S)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%s|%\(\w+\)s')
+_IN_LIST_RE = re.compile(r'\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalize a statement so calls that differ only in literal values group together"""
+    text = _COMMENT_RE.sub(' ', sql)
+    text = _STRING_RE.sub('?', text)
+    text = _PARAM_RE.sub('?', text)
+    text = _NUMBER_RE.sub('?', text)
+    text = _IN_LIST_RE.sub('IN (...)', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+class FingerprintStats:
+    """Counters and a bounded sample of durations for one query fingerprint"""
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.callers = set()
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, duration_ms, rows, caller):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        if rows > 0:
+            self.rows += rows
+        self.callers.add(caller)
+        self.samples.append(duration_ms)
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class QueryStats:
+    """
+    Process-wide query statistics keyed by SQL fingerprint.
+
+    Args:
+        slow_query_ms (float): Queries at or above this duration are logged
+        sample_size (int): Recent durations kept per fingerprint for percentiles
+    """
+
+    def __init__(self, slow_query_ms=200, sample_size=1000):
+        self.slow_query_ms = slow_query_ms
+        self.sample_size = sample_size
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, sql, duration_ms, rows, caller):
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = FingerprintStats(self.sample_size)
+            stats.add(duration_ms, rows, caller)
+
+        if has_request_context():
+            g.db_query_count = g.get('db_query_count', 0) + 1
+            g.db_time_ms = g.get('db_time_ms', 0.0) + duration_ms
+
+        if duration_ms >= self.slow_query_ms:
+            logger.warning(f"Slow query ({duration_ms:.1f} ms, {rows} rows) in {caller}: {key}")
+
+    def snapshot(self):
+        """Per-fingerprint summary sorted by total time, slowest first"""
+        with self._lock:
+            items = [(key, stats, sorted(stats.samples)) for key, stats in self._stats.items()]
+        result = []
+        for key, stats, ordered in items:
+            result.append({
+                'fingerprint': key,
+                'callers': sorted(stats.callers),
+                'count': stats.count,
+                'rows': stats.rows,
+                'total_ms': round(stats.total_ms, 3),
+                'avg_ms': round(stats.total_ms / stats.count, 3),
+                'max_ms': round(stats.max_ms, 3),
+                'p50_ms': round(_percentile(ordered, 50), 3),
+                'p95_ms': round(_percentile(ordered, 95), 3),
+                'p99_ms': round(_percentile(ordered, 99), 3),
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+query_stats = QueryStats(slow_query_ms=db_config.DB_SLOW_QUERY_MS)
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times every execute() and reports it to query_stats"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        caller = sys._getframe(1).f_code.co_name
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000.0
+            query_stats.record(operation, duration_ms, self._cursor.rowcount, caller)
+
+
+def _add_server_timing(response):
+    count = g.get('db_query_count')
+    if count:
+        db_time = g.get('db_time_ms', 0.0)
+        response.headers.add('Server-Timing', f'db;dur={db_time:.2f};desc="{count} queries"')
+    return response
+
+
+def init_app(app):
+    """Attach per-request database timing to responses as a Server-Timing header"""
+    app.after_request(_add_server_timing)
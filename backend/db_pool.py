@@ -0,0 +1,394 @@
+import threading
+import time
+import logging
+from collections import deque
+import mysql.connector
+from config import db_config
+from db_metrics import InstrumentedCursor
+from db_statements import StatementCache, CachingCursor
+from db_convert import JsonReadyCursor
+from circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available before the checkout timeout"""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a MySQL connection checked out from a ConnectionPool.
+
+    Everything except close() is delegated to the underlying connection, so
+    existing code written against mysql.connector keeps working. close()
+    hands the connection back to the pool instead of disconnecting.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get('_raw')
+        if raw is None:
+            raise mysql.connector.errors.OperationalError("Connection has been returned to the pool")
+        return getattr(raw, name)
+
+    @property
+    def pool(self):
+        return self._pool
+
+    def cursor(self, *args, **kwargs):
+        """
+        Return an instrumented cursor. Text-protocol cursors are buffered so
+        rowcount is known after execute() and several cursors can share the
+        connection without unread-result errors. Plain and dictionary cursors
+        go through the connection's prepared statement cache.
+
+        Pass json_ready=True for results that go straight into a response;
+        TIME, DATE/DATETIME and DECIMAL columns then come back as strings and
+        floats (see db_convert.JsonReadyCursor).
+        """
+        if self._raw is None:
+            raise mysql.connector.errors.OperationalError("Connection has been returned to the pool")
+        json_ready = kwargs.pop('json_ready', False)
+        special = args or any(kwargs.get(k) for k in ('prepared', 'raw', 'named_tuple', 'cursor_class'))
+        if not kwargs.get('prepared'):
+            kwargs.setdefault('buffered', True)
+        cursor = self._raw.cursor(*args, **kwargs)
+        if not special:
+            cursor = CachingCursor(self._pool.statement_cache(self._raw), cursor, kwargs.get('dictionary', False))
+        if json_ready:
+            cursor = JsonReadyCursor(cursor, kwargs.get('dictionary', False))
+        return InstrumentedCursor(cursor)
+
+    def close(self):
+        """Return the connection to the pool. Safe to call more than once."""
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw)
+
+    def __del__(self):
+        # Safety net for code paths that forget to close on error
+        try:
+            if self.__dict__.get('_raw') is not None:
+                logger.warning(f"Pooled connection from '{self._pool.name}' was garbage collected without close()")
+                self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of MySQL connections.
+
+    Args:
+        name (str): Pool name used in logs and metrics
+        connect_kwargs (dict): Arguments passed to mysql.connector.connect()
+        min_size (int): Connections kept open even when idle
+        max_size (int): Hard cap on open connections
+        idle_timeout (float): Seconds an idle connection above min_size may live
+        checkout_timeout (float): Seconds checkout() waits for a free connection
+        ping_after_idle (float): Connections idle longer than this are pinged on checkout
+        statement_cache_size (int): Prepared statements kept per connection; 0 disables preparing
+        prepare_after (int): Executions of the same SQL on a connection before it is prepared
+        breaker (CircuitBreaker): Optional breaker fed with the health of the server: connect
+            and ping errors and connections returned broken are failures, every other
+            checkout a success. Waiting for a busy pool is not a server failure. While the
+            breaker is open checkout() fails immediately with CircuitOpenError
+    """
+
+    def __init__(self, name, connect_kwargs, min_size=2, max_size=10, idle_timeout=300,
+                 checkout_timeout=5, ping_after_idle=5, statement_cache_size=32, prepare_after=2, breaker=None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.name = name
+        self.connect_kwargs = dict(connect_kwargs)
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_after_idle = ping_after_idle
+        self.statement_cache_size = statement_cache_size
+        self.prepare_after = prepare_after
+        self.breaker = breaker
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, idle_since) - newest on the right
+        self._statement_caches = {}  # connection -> StatementCache, lives as long as the connection
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'checkout_timeouts': 0,
+            'ping_failures': 0,
+            'idle_evictions': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats['created'] += 1
+        return raw
+
+    def _disconnect(self, raw):
+        with self._cond:
+            self._statement_caches.pop(raw, None)
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['closed'] += 1
+
+    def statement_cache(self, raw):
+        """Prepared statement cache for a connection owned by this pool"""
+        with self._cond:
+            cache = self._statement_caches.get(raw)
+            if cache is None:
+                cache = self._statement_caches[raw] = StatementCache(
+                    raw, capacity=self.statement_cache_size, prepare_after=self.prepare_after)
+        return cache
+
+    def _is_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _take_expired_locked(self, now):
+        """Pop idle connections past idle_timeout while staying above min_size"""
+        expired = []
+        while self._idle and self._size > self.min_size:
+            raw, idle_since = self._idle[0]
+            if now - idle_since < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['idle_evictions'] += 1
+            expired.append(raw)
+        return expired
+
+    def prefill(self):
+        """Open connections up to min_size. Errors are logged, not raised."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw = self._connect()
+            except mysql.connector.Error as err:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                logger.error(f"Pool '{self.name}' prefill failed: {err}")
+                return
+            with self._cond:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+
+    def checkout(self, timeout=None):
+        """
+        Borrow a connection from the pool.
+
+        Args:
+            timeout (float): Seconds to wait when the pool is exhausted; defaults to checkout_timeout
+
+        Returns:
+            PooledConnection: Call close() to give it back
+
+        Raises:
+            CircuitOpenError: The pool's circuit breaker is open
+            PoolTimeoutError: No connection became available in time
+            mysql.connector.Error: A new connection could not be opened
+        """
+        # A half-open trial always talks to the server so its outcome is known
+        trial = self.breaker.before_call() if self.breaker is not None else False
+        try:
+            return self._checkout(timeout, trial)
+        finally:
+            if trial:
+                # No-op when the trial recorded an outcome; frees the slot when it never reached the server
+                self.breaker.release_trial()
+
+    def _checkout(self, timeout, trial):
+        if timeout is None:
+            timeout = self.checkout_timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        raw = None
+        idle_since = None
+        expired = []
+
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError(f"Pool '{self.name}' is closed")
+                    now = time.monotonic()
+                    expired.extend(self._take_expired_locked(now))
+                    if self._idle:
+                        raw, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        # Saturation of this pool, not a sign the server is down
+                        self._stats['checkout_timeouts'] += 1
+                        logger.warning(f"Pool '{self.name}' checkout timed out after {timeout}s ({self._size} connections in use)")
+                        raise PoolTimeoutError(f"Timed out waiting for a connection from pool '{self.name}'")
+                    self._cond.wait(remaining)
+        finally:
+            for stale in expired:
+                self._disconnect(stale)
+
+        if raw is not None and (trial or time.monotonic() - idle_since >= self.ping_after_idle):
+            if not self._is_alive(raw):
+                self._record_outcome(False)
+                with self._cond:
+                    self._stats['ping_failures'] += 1
+                self._disconnect(raw)
+                raw = None
+
+        if raw is None:
+            try:
+                raw = self._connect()
+            except Exception:
+                self._record_outcome(False)
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        self._record_outcome(True)
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return PooledConnection(self, raw)
+
+    def _record_outcome(self, ok):
+        if self.breaker is None:
+            return
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def release(self, raw):
+        """Give a connection back. Open transactions are rolled back first."""
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+        if healthy:
+            try:
+                healthy = raw.is_connected()
+            except Exception:
+                healthy = False
+
+        if not healthy:
+            # The connection was lost while in use; SQL errors on a live connection don't count
+            self._record_outcome(False)
+        with self._cond:
+            if healthy and not self._closed:
+                self._idle.append((raw, time.monotonic()))
+                self._cond.notify()
+                return
+            self._size -= 1
+            self._cond.notify()
+        self._disconnect(raw)
+
+    def metrics(self):
+        """Snapshot of pool counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+            stats['min_size'] = self.min_size
+            statements = {'hits': 0, 'prepares': 0, 'evictions': 0, 'text': 0, 'open': 0}
+            for cache in self._statement_caches.values():
+                for key, value in cache.stats.items():
+                    statements[key] += value
+                statements['open'] += len(cache)
+            stats['statements'] = statements
+        if self.breaker is not None:
+            stats['breaker'] = self.breaker.metrics()
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
+
+    def close(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw in idle:
+            self._disconnect(raw)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def primary_connect_kwargs():
+    return {
+        'host': db_config.DB_HOST,
+        'port': db_config.DB_PORT,
+        'user': db_config.DB_USER,
+        'password': db_config.DB_PASSWORD,
+        'database': db_config.DB_NAME,
+        'connection_timeout': db_config.DB_CONNECT_TIMEOUT,
+        'use_pure': db_config.DB_USE_PURE,
+    }
+
+
+def make_breaker(name):
+    """Circuit breaker for a pool, configured from DatabaseConfig"""
+    return CircuitBreaker(
+        name,
+        failure_rate=db_config.DB_BREAKER_FAILURE_RATE,
+        min_calls=db_config.DB_BREAKER_MIN_CALLS,
+        window=db_config.DB_BREAKER_WINDOW,
+        reset_timeout=db_config.DB_BREAKER_RESET_TIMEOUT,
+    )
+
+
+def get_pool():
+    """Return the process-wide primary pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    'primary',
+                    primary_connect_kwargs(),
+                    min_size=db_config.DB_POOL_MIN_SIZE,
+                    max_size=db_config.DB_POOL_MAX_SIZE,
+                    idle_timeout=db_config.DB_POOL_IDLE_TIMEOUT,
+                    checkout_timeout=db_config.DB_POOL_CHECKOUT_TIMEOUT,
+                    ping_after_idle=db_config.DB_POOL_PING_AFTER_IDLE,
+                    statement_cache_size=db_config.DB_STATEMENT_CACHE_SIZE,
+                    prepare_after=db_config.DB_STATEMENT_PREPARE_AFTER,
+                    breaker=make_breaker('primary'),
+                )
+                pool.prefill()
+                _pool = pool
+    return _pool
@@ -0,0 +1,185 @@
+import threading
+import time
+import logging
+import mysql.connector
+from config import db_config
+from db_pool import ConnectionPool, PoolTimeoutError, primary_connect_kwargs, make_breaker
+from circuit_breaker import DatabaseUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaState:
+    """Pool plus cached health/lag information for one replica endpoint"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.lag = None
+        self.healthy = False
+        self.checked_at = None
+        self.check_lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica whose replication lag is within tolerance.
+
+    Lag is probed with SHOW REPLICA STATUS at most once per check_interval per
+    replica. A replica that returns no replication status (for example a
+    second local instance used for testing) is treated as having zero lag.
+
+    Args:
+        pools (list): ConnectionPool per replica endpoint
+        max_lag (float): Highest acceptable Seconds_Behind_Source
+        check_interval (float): Seconds between lag probes for a replica
+    """
+
+    def __init__(self, pools, max_lag=5, check_interval=2):
+        self.replicas = [ReplicaState(pool) for pool in pools]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _probe_lag(self, pool):
+        conn = pool.checkout()
+        try:
+            cursor = conn.cursor(buffered=True, dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                # MySQL < 8.0.22 / MariaDB
+                cursor.execute("SHOW SLAVE STATUS")
+            status = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+        if not status:
+            return 0
+        lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        # NULL lag means the replication threads are stopped
+        return float(lag) if lag is not None else None
+
+    def _refresh(self, replica):
+        now = time.monotonic()
+        if replica.checked_at is not None and now - replica.checked_at < self.check_interval:
+            return
+        # Only one thread probes a replica; the rest use the cached state
+        if not replica.check_lock.acquire(blocking=False):
+            return
+        try:
+            try:
+                replica.lag = self._probe_lag(replica.pool)
+            except (mysql.connector.Error, PoolTimeoutError, DatabaseUnavailableError) as err:
+                logger.warning(f"Replica '{replica.pool.name}' lag check failed: {err}")
+                replica.lag = None
+            replica.healthy = replica.lag is not None and replica.lag <= self.max_lag
+            replica.checked_at = time.monotonic()
+        finally:
+            replica.check_lock.release()
+
+    def checkout(self):
+        """
+        Check out a connection from a healthy replica.
+
+        Returns:
+            PooledConnection or None: None when no replica is usable and the caller should read from the primary
+        """
+        if not self.replicas:
+            return None
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            self._refresh(replica)
+            if not replica.healthy:
+                continue
+            try:
+                return replica.pool.checkout()
+            except (mysql.connector.Error, PoolTimeoutError, DatabaseUnavailableError) as err:
+                logger.warning(f"Replica '{replica.pool.name}' unavailable, trying next: {err}")
+                replica.healthy = False
+                replica.checked_at = time.monotonic()
+        return None
+
+    def status(self):
+        return [
+            {'name': r.pool.name, 'healthy': r.healthy, 'lag': r.lag}
+            for r in self.replicas
+        ]
+
+
+class WriteTracker:
+    """
+    Remembers which sessions wrote recently so their reads stay on the primary.
+
+    Args:
+        window (float): Seconds after a write during which reads go to the primary
+        max_sessions (int): Entries kept before expired ones are pruned
+    """
+
+    def __init__(self, window=10, max_sessions=10000):
+        self.window = window
+        self.max_sessions = max_sessions
+        self._last_write = {}
+        self._lock = threading.Lock()
+
+    def record_write(self, session_key):
+        if session_key is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[session_key] = now
+            if len(self._last_write) > self.max_sessions:
+                cutoff = now - self.window
+                self._last_write = {k: t for k, t in self._last_write.items() if t > cutoff}
+
+    def wrote_recently(self, session_key):
+        if session_key is None:
+            return False
+        last = self._last_write.get(session_key)
+        return last is not None and time.monotonic() - last < self.window
+
+
+def _parse_endpoint(endpoint):
+    host, _, port = endpoint.rpartition(':')
+    if not host:
+        return endpoint, db_config.DB_PORT
+    return host, int(port)
+
+
+_router = None
+_router_lock = threading.Lock()
+write_tracker = WriteTracker(window=db_config.DB_READ_YOUR_WRITES_WINDOW)
+
+
+def get_router():
+    """Return the process-wide replica router built from DatabaseConfig.DB_REPLICAS"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                pools = []
+                for endpoint in db_config.DB_REPLICAS:
+                    host, port = _parse_endpoint(endpoint)
+                    kwargs = primary_connect_kwargs()
+                    kwargs.update(host=host, port=port)
+                    pools.append(ConnectionPool(
+                        f'replica-{host}:{port}',
+                        kwargs,
+                        min_size=0,
+                        max_size=db_config.DB_REPLICA_POOL_MAX_SIZE,
+                        idle_timeout=db_config.DB_POOL_IDLE_TIMEOUT,
+                        checkout_timeout=db_config.DB_REPLICA_CHECKOUT_TIMEOUT,
+                        ping_after_idle=db_config.DB_POOL_PING_AFTER_IDLE,
+                        statement_cache_size=db_config.DB_STATEMENT_CACHE_SIZE,
+                        prepare_after=db_config.DB_STATEMENT_PREPARE_AFTER,
+                        breaker=make_breaker(f'replica-{host}:{port}'),
+                    ))
+                _router = ReplicaRouter(
+                    pools,
+                    max_lag=db_config.DB_REPLICA_MAX_LAG,
+                    check_interval=db_config.DB_REPLICA_LAG_CHECK_INTERVAL,
+                )
+    return _router
@@ -0,0 +1,266 @@
+import hashlib
+import logging
+from flask import g, has_request_context, jsonify, request
+from config import db_config
+from db_pool import get_pool
+from db_router import get_router, write_tracker
+from circuit_breaker import Bulkhead, DatabaseUnavailableError
+
+logger = logging.getLogger(__name__)
+
+bulkhead = Bulkhead('database', db_config.DB_MAX_CONCURRENT_REQUESTS, db_config.DB_QUEUE_TIMEOUT)
+
+
+class UnitOfWork:
+    """
+    One connection and one transaction for the lifetime of an HTTP request.
+
+    The connection is checked out lazily on first use. Helpers that call
+    commit() only mark the transaction as dirty; the real COMMIT happens once
+    when the response is ready. When the last open handle is closed and the
+    transaction is clean (nothing to commit), the connection goes back to the
+    pool right away, so slow work after the queries (bcrypt, Firebase, email
+    rendering) doesn't hold it; a later get_connection() checks out another.
+    A dirty transaction keeps its connection until teardown.
+
+    Read-only callers get a replica connection instead, unless this request
+    already holds the primary or the session wrote within the read-your-writes
+    window, in which case they share the primary so they see their own writes.
+
+    The first checkout also takes a slot in the process-wide bulkhead, which
+    is held while the request holds a connection.
+    """
+
+    def __init__(self, session_key=None):
+        self.session_key = session_key
+        self.conn = None
+        self.read_conn = None
+        self.dirty = False
+        self.has_slot = False
+        self.handles = 0  # open RequestConnection handles on conn
+        self.read_handles = 0  # open ReadConnection handles on read_conn
+        self.after_commit = []
+
+    def _take_slot(self):
+        if not self.has_slot:
+            bulkhead.acquire()
+            self.has_slot = True
+
+    def _release_slot_if_idle(self):
+        if self.has_slot and self.conn is None and self.read_conn is None:
+            self.has_slot = False
+            bulkhead.release()
+
+    def connection(self):
+        if self.conn is None:
+            self._take_slot()
+            try:
+                self.conn = get_pool().checkout()
+            except Exception:
+                self._release_slot_if_idle()
+                raise
+        self.handles += 1
+        return RequestConnection(self)
+
+    def read_connection(self):
+        if self.conn is not None:
+            return self.connection()
+        if self.read_conn is None:
+            self._take_slot()
+            if not write_tracker.wrote_recently(self.session_key):
+                self.read_conn = get_router().checkout()
+            if self.read_conn is None:
+                # No usable replica: fall back to the primary
+                return self.connection()
+        self.read_handles += 1
+        return ReadConnection(self)
+
+    def close_handle(self):
+        """A RequestConnection was closed; give the connection back if nothing uses or awaits it"""
+        self.handles -= 1
+        if self.handles == 0 and not self.dirty and self.conn is not None:
+            # Not dirty: anything it ran is rolled back at teardown anyway
+            conn, self.conn = self.conn, None
+            conn.close()
+            self._release_slot_if_idle()
+
+    def close_read_handle(self):
+        self.read_handles -= 1
+        if self.read_handles == 0 and self.read_conn is not None:
+            read_conn, self.read_conn = self.read_conn, None
+            read_conn.close()
+            self._release_slot_if_idle()
+
+    def commit(self):
+        if self.conn is not None and self.dirty:
+            self.conn.commit()
+            write_tracker.record_write(self.session_key)
+        self.dirty = False
+        callbacks, self.after_commit = self.after_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"After-commit callback failed: {str(e)}")
+
+    def rollback(self):
+        self.after_commit = []
+        if self.conn is not None:
+            try:
+                self.conn.rollback()
+            except Exception as e:
+                logger.error(f"Rollback failed: {str(e)}")
+        self.dirty = False
+
+    def release(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            conn.close()
+        read_conn, self.read_conn = self.read_conn, None
+        if read_conn is not None:
+            read_conn.close()
+        self.handles = self.read_handles = 0
+        self._release_slot_if_idle()
+
+
+class RequestConnection:
+    """
+    Connection handle given to request code; commit is deferred to the unit
+    of work, and close() only gives the connection back once no handle is
+    open and there is nothing to commit.
+    """
+
+    def __init__(self, uow):
+        self._uow = uow
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._uow.conn, name)
+
+    def commit(self):
+        self._uow.dirty = True
+
+    def rollback(self):
+        self._uow.rollback()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._uow.close_handle()
+
+
+class ReadConnection:
+    """Replica connection handle; given back once every handle on it is closed"""
+
+    def __init__(self, uow):
+        self._uow = uow
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._uow.read_conn, name)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._uow.close_read_handle()
+
+
+def _session_key():
+    """Identify the client session by a digest of its bearer token"""
+    auth = request.headers.get('Authorization')
+    if not auth:
+        return None
+    return hashlib.sha256(auth.encode('utf-8')).hexdigest()
+
+
+def get_connection(read_only=False):
+    """
+    Return a database connection for the caller.
+
+    Inside a Flask request every call returns a handle to the same pooled
+    connection; outside a request (scripts, background jobs) a plain pooled
+    connection is returned and the caller owns commit/close.
+
+    Args:
+        read_only (bool): Caller only runs SELECTs and may be served by a replica
+
+    Raises:
+        DatabaseUnavailableError: The circuit is open or the bulkhead is full;
+            the request's response is turned into a 503 with Retry-After
+    """
+    if not has_request_context():
+        if read_only:
+            conn = get_router().checkout()
+            if conn is not None:
+                return conn
+        return get_pool().checkout()
+    uow = g.get('db_unit_of_work')
+    if uow is None:
+        uow = g.db_unit_of_work = UnitOfWork(_session_key())
+    try:
+        if read_only:
+            return uow.read_connection()
+        return uow.connection()
+    except DatabaseUnavailableError as err:
+        g.db_retry_after = err.retry_after_header
+        raise
+
+
+def on_commit(callback):
+    """
+    Run callback() once the request's transaction has committed; it is
+    dropped if the transaction rolls back. Outside a request, where callers
+    commit themselves, it runs straight away.
+    """
+    uow = g.get('db_unit_of_work') if has_request_context() else None
+    if uow is None:
+        callback()
+    else:
+        uow.after_commit.append(callback)
+
+
+def _commit_unit_of_work(response):
+    uow = g.get('db_unit_of_work')
+    if uow is None:
+        return response
+    if response.status_code >= 500:
+        uow.rollback()
+        return response
+    try:
+        uow.commit()
+    except Exception as e:
+        logger.error(f"Commit failed: {str(e)}")
+        uow.rollback()
+        response = jsonify({"error": "Database commit failed"})
+        response.status_code = 500
+    return response
+
+
+def _database_unavailable(response):
+    """Report requests that failed because the database was unavailable as 503s"""
+    retry_after = g.get('db_retry_after')
+    if retry_after is None or response.status_code < 500:
+        return response
+    response = jsonify({"error": "Database temporarily unavailable, please retry later"})
+    response.status_code = 503
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+def _release_unit_of_work(exc):
+    uow = g.pop('db_unit_of_work', None)
+    if uow is None:
+        return
+    if exc is not None or uow.dirty:
+        uow.rollback()
+    uow.release()
+
+
+def init_app(app):
+    """Register the request hooks that commit and release the request's connection and report fast-fails"""
+    app.after_request(_commit_unit_of_work)
+    app.after_request(_database_unavailable)
+    app.teardown_request(_release_unit_of_work)
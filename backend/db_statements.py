@@ -0,0 +1,191 @@
+from collections import OrderedDict
+import mysql.connector
+
+# Statements worth preparing; everything else (DDL, SHOW, SET...) stays on the text protocol
+_PREPARABLE = ('select', 'insert', 'update', 'delete')
+
+
+class StatementCache:
+    """
+    LRU of server-side prepared statements for one connection, keyed by SQL text.
+
+    A statement is only prepared once it has been seen prepare_after times on
+    the connection, so one-off queries keep using the text protocol and don't
+    pay for an extra PREPARE round trip.
+
+    Args:
+        raw: The underlying mysql.connector connection
+        capacity (int): Prepared statements kept open; the least recently used is closed
+        prepare_after (int): Executions of the same SQL text before it is prepared
+    """
+
+    def __init__(self, raw, capacity=32, prepare_after=2):
+        self.raw = raw
+        self.capacity = capacity
+        self.prepare_after = prepare_after
+        self._statements = OrderedDict()  # sql -> (sql as prepared, prepared cursor)
+        self._seen = OrderedDict()  # sql -> executions so far
+        self.stats = {'hits': 0, 'prepares': 0, 'evictions': 0, 'text': 0}
+
+    def lookup(self, operation, params):
+        """
+        Return (sql, prepared_cursor) for the statement, or None to use the text protocol.
+
+        The returned sql is the exact string object the cursor was prepared
+        with; mysql.connector only reuses a prepared statement when it is
+        handed the same object again.
+        """
+        if self.capacity <= 0 or not params or not isinstance(operation, str):
+            self.stats['text'] += 1
+            return None
+
+        entry = self._statements.get(operation)
+        if entry is not None:
+            self._statements.move_to_end(operation)
+            self.stats['hits'] += 1
+            return entry
+
+        if not operation.lstrip()[:6].lower().startswith(_PREPARABLE):
+            self.stats['text'] += 1
+            return None
+
+        seen = self._seen.pop(operation, 0) + 1
+        if seen < self.prepare_after:
+            self._seen[operation] = seen
+            if len(self._seen) > self.capacity * 8:
+                self._seen.popitem(last=False)
+            self.stats['text'] += 1
+            return None
+
+        entry = (operation, self.raw.cursor(prepared=True))
+        self._statements[operation] = entry
+        self.stats['prepares'] += 1
+        if len(self._statements) > self.capacity:
+            _, (_, old_cursor) = self._statements.popitem(last=False)
+            self._close_cursor(old_cursor)
+            self.stats['evictions'] += 1
+        return entry
+
+    def discard(self, operation):
+        entry = self._statements.pop(operation, None)
+        if entry is not None:
+            self._close_cursor(entry[1])
+
+    def clear(self):
+        """Forget every statement, closing them if the connection is still usable"""
+        statements, self._statements = self._statements, OrderedDict()
+        self._seen.clear()
+        for _, cursor in statements.values():
+            self._close_cursor(cursor)
+
+    def _close_cursor(self, cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def __len__(self):
+        return len(self._statements)
+
+
+class CachingCursor:
+    """
+    Cursor that runs repeated statements through the connection's
+    StatementCache and everything else through a buffered text cursor.
+
+    Results from prepared statements are fetched eagerly so the connection is
+    free for the next statement, and converted to dicts when dictionary=True,
+    matching what cursor(dictionary=True) returns on the text protocol.
+    """
+
+    def __init__(self, cache, text_cursor, dictionary=False):
+        self._cache = cache
+        self._text = text_cursor
+        self._dictionary = dictionary
+        self._prepared = False
+        self._rows = []
+        self._pos = 0
+        self._rowcount = -1
+        self._lastrowid = None
+        self._description = None
+
+    def __getattr__(self, name):
+        return getattr(self._text, name)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        statement = self._cache.lookup(operation, params)
+        if statement is None:
+            self._prepared = False
+            return self._text.execute(operation, params, *args, **kwargs)
+
+        sql, cursor = statement
+        try:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall() if cursor.with_rows else []
+        except mysql.connector.Error:
+            # Leave the statement out of the cache in case its state is unknown
+            self._cache.discard(sql)
+            raise
+
+        self._prepared = True
+        self._description = cursor.description
+        if self._dictionary and self._description:
+            names = [column[0] for column in self._description]
+            rows = [dict(zip(names, row)) for row in rows]
+        self._rows = rows
+        self._pos = 0
+        self._rowcount = len(rows) if self._description else cursor.rowcount
+        self._lastrowid = cursor.lastrowid
+        return None
+
+    @property
+    def rowcount(self):
+        return self._rowcount if self._prepared else self._text.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._lastrowid if self._prepared else self._text.lastrowid
+
+    @property
+    def description(self):
+        return self._description if self._prepared else self._text.description
+
+    @property
+    def column_names(self):
+        if not self._prepared:
+            return self._text.column_names
+        return tuple(column[0] for column in self._description or ())
+
+    @property
+    def with_rows(self):
+        return self._description is not None if self._prepared else self._text.with_rows
+
+    def fetchone(self):
+        if not self._prepared:
+            return self._text.fetchone()
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size=1):
+        if not self._prepared:
+            return self._text.fetchmany(size)
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        if not self._prepared:
+            return self._text.fetchall()
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._rows = []
+        return self._text.close()
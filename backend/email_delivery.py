@@ -0,0 +1,318 @@
+import threading
+import time
+import logging
+from collections import deque
+from config import delivery_config, email_config
+from utils import deliver_email
+
+logger = logging.getLogger(__name__)
+
+URGENT, NORMAL, BULK = 0, 1, 2
+LANE_NAMES = ('urgent', 'normal', 'bulk')
+DAY = 86400
+
+
+def lane_for(category):
+    """Lane (and email_outbox.priority) for a category of email"""
+    if category in delivery_config.DELIVERY_URGENT_CATEGORIES:
+        return URGENT
+    if category in delivery_config.DELIVERY_BULK_CATEGORIES:
+        return BULK
+    return NORMAL
+
+
+class TokenBucket:
+    """
+    Args:
+        rate (float): Tokens added per second
+        capacity (float): Most tokens the bucket holds, i.e. the burst size
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, floor=0.0):
+        """Seconds until a token can be taken without going below floor"""
+        self._refill(self.clock())
+        missing = floor + 1 - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateGovernor:
+    """
+    Sending limits of one SMTP account: a per-second token bucket and, for
+    providers with a daily quota such as Gmail, a bucket refilling quota
+    tokens per day. Non-urgent mail may not use the last reserve share of
+    either bucket, so OTPs still go out when bulk mail has used up the rest.
+
+    The buckets live in this process. The daily quota is shared with every
+    other process sending through the account by sync_daily(), which the
+    outbox workers call with the count of emails sent in the last 24 hours
+    (see email_outbox.py); between syncs only this process's sends are
+    taken off it.
+
+    Args:
+        name (str): Account name used in metrics
+        rate (float): Emails per second
+        burst (float): Emails that may go out back to back
+        daily_quota (int): Emails per rolling day; 0 for no daily limit
+        reserve (float): Share of each bucket kept for urgent mail
+    """
+
+    def __init__(self, name, rate, burst, daily_quota=0, reserve=0.1, clock=time.monotonic):
+        self.name = name
+        self.reserve = reserve
+        self.daily_quota = daily_quota
+        self.buckets = [TokenBucket(rate, burst, clock)]
+        if daily_quota:
+            self.buckets.append(TokenBucket(daily_quota / DAY, daily_quota, clock))
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.synced_at = None  # time.monotonic() of the last sync_daily()
+
+    def _wait(self, urgent):
+        return max(bucket.wait_time(0.0 if urgent else bucket.capacity * self.reserve) for bucket in self.buckets)
+
+    def wait_time(self, urgent=False):
+        with self._lock:
+            return self._wait(urgent)
+
+    def acquire(self, urgent=False):
+        """
+        Take a token from every bucket if all have one to spare.
+
+        Returns:
+            float: 0 when the email may be sent now, otherwise seconds to wait
+        """
+        with self._lock:
+            wait = self._wait(urgent)
+            if wait:
+                self.throttled += 1
+                return wait
+            for bucket in self.buckets:
+                bucket.take()
+            return 0.0
+
+    def sync_daily(self, sent):
+        """Set what is left of the daily quota from the emails the account sent in the last 24 hours"""
+        with self._lock:
+            if self.daily_quota:
+                bucket = self.buckets[1]
+                bucket._refill(bucket.clock())
+                bucket.tokens = max(0.0, bucket.capacity - sent)
+            self.synced_at = time.monotonic()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'tokens': [round(bucket.tokens, 2) for bucket in self.buckets],
+                'throttled': self.throttled,
+            }
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(host=None, port=None, username=None):
+    """Rate governor for an SMTP account, keyed like smtp_pool.get_smtp_pool"""
+    host = host or email_config.SMTP_SERVER
+    port = port or email_config.SMTP_PORT
+    username = email_config.SMTP_USERNAME if username is None else username
+    key = (host, port, username)
+    with _governors_lock:
+        governor = _governors.get(key)
+        if governor is None:
+            governor = _governors[key] = RateGovernor(
+                f"{username}@{host}" if username else host,
+                delivery_config.DELIVERY_RATE,
+                delivery_config.DELIVERY_BURST,
+                delivery_config.DELIVERY_DAILY_QUOTA,
+                delivery_config.DELIVERY_URGENT_RESERVE,
+            )
+    return governor
+
+
+class DeliveryEngine:
+    """
+    Sender threads fed from bounded priority lanes.
+
+    A free sender always takes from the most urgent non-empty lane, so an
+    OTP waits for at most the sends already in progress, never for the
+    queue of reminders in front of it. urgent_senders threads never pick up
+    normal or bulk mail, and every send first takes a token from the account's
+    RateGovernor. Lanes hold at most lane_capacity items; submit() refuses
+    more, and callers keep the overflow in durable storage (the email_outbox
+    table) until there is room.
+
+    Args:
+        name (str): Name used in logs and metrics
+        send (callable): send(payload); raises if the email wasn't sent
+        governor (RateGovernor): Limits of the account being sent through
+        senders (int): Sender threads
+        urgent_senders (int): Senders reserved for the urgent lane
+        lane_capacity (int): Items buffered per lane
+    """
+
+    def __init__(self, name, send, governor, senders=3, urgent_senders=1, lane_capacity=100):
+        if senders < 1:
+            raise ValueError("senders must be at least 1")
+        self.name = name
+        self.send = send
+        self.governor = governor
+        self.senders = senders
+        self.urgent_senders = min(urgent_senders, senders - 1)
+        self.lane_capacity = lane_capacity
+        self._lanes = [deque() for _ in LANE_NAMES]  # (payload, callback, queued_at)
+        self._cond = threading.Condition()
+        self._non_urgent_busy = 0
+        self._closed = False
+        self._threads = []
+        self._stats = [{'sent': 0, 'failed': 0, 'latencies': deque(maxlen=1000)} for _ in LANE_NAMES]
+
+    def free(self, lane):
+        with self._cond:
+            return self.lane_capacity - len(self._lanes[lane])
+
+    def submit(self, lane, payload, callback):
+        """
+        Buffer payload in lane. callback(payload, error) runs on a sender
+        thread once it was sent (error None) or failed.
+
+        Returns:
+            bool: False if the lane is full or the engine is stopped
+        """
+        with self._cond:
+            if self._closed or len(self._lanes[lane]) >= self.lane_capacity:
+                return False
+            self._lanes[lane].append((payload, callback, time.monotonic()))
+            self._cond.notify()
+            return True
+
+    def expire(self, max_age):
+        """Remove and return payloads buffered for longer than max_age seconds"""
+        cutoff = time.monotonic() - max_age
+        expired = []
+        with self._cond:
+            for lane in self._lanes:
+                while lane and lane[0][2] < cutoff:
+                    expired.append(lane.popleft()[0])
+        return expired
+
+    def _take(self):
+        with self._cond:
+            while not self._closed:
+                wait = None
+                for lane, items in enumerate(self._lanes):
+                    if not items:
+                        continue
+                    if lane != URGENT and self._non_urgent_busy >= self.senders - self.urgent_senders:
+                        continue
+                    wait = self.governor.acquire(urgent=lane == URGENT)
+                    if wait:
+                        # Lower lanes face a stricter limit, no point trying them
+                        break
+                    if lane != URGENT:
+                        self._non_urgent_busy += 1
+                    payload, callback, queued_at = items.popleft()
+                    return lane, payload, callback, queued_at
+                self._cond.wait(wait)
+            return None
+
+    def _run(self):
+        while True:
+            taken = self._take()
+            if taken is None:
+                return
+            lane, payload, callback, queued_at = taken
+            error = None
+            try:
+                self.send(payload)
+            except Exception as e:
+                error = e
+            with self._cond:
+                if lane != URGENT:
+                    self._non_urgent_busy -= 1
+                    self._cond.notify()
+                stats = self._stats[lane]
+                stats['failed' if error else 'sent'] += 1
+                stats['latencies'].append(time.monotonic() - queued_at)  # buffered + sending
+            try:
+                callback(payload, error)
+            except Exception as e:
+                logger.error(f"{self.name}: delivery callback failed: {str(e)}")
+
+    def start(self):
+        for i in range(self.senders):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-sender-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the senders after their current email.
+
+        Returns:
+            list: Payloads that were still buffered
+        """
+        with self._cond:
+            self._closed = True
+            left = [item[0] for lane in self._lanes for item in lane]
+            for lane in self._lanes:
+                lane.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        return left
+
+    def metrics(self):
+        lanes = {}
+        with self._cond:
+            for lane, name in enumerate(LANE_NAMES):
+                stats = self._stats[lane]
+                latencies = sorted(stats['latencies'])
+                lanes[name] = {
+                    'queued': len(self._lanes[lane]),
+                    'sent': stats['sent'],
+                    'failed': stats['failed'],
+                    'latency_p50': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                    'latency_p99': round(latencies[int(len(latencies) * 0.99)], 3) if latencies else None,
+                }
+        return {'lanes': lanes, 'senders': self.senders, 'governor': self.governor.metrics()}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The process-wide engine sending through the EmailConfig account, started on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            def send(row):
+                deliver_email(row['to_email'], row['subject'], row['body'], row['html_body'])
+
+            _engine = DeliveryEngine(
+                'delivery', send, get_governor(),
+                senders=delivery_config.DELIVERY_SENDERS,
+                urgent_senders=delivery_config.DELIVERY_URGENT_SENDERS,
+                lane_capacity=delivery_config.DELIVERY_LANE_CAPACITY,
+            ).start()
+    return _engine
+
+
+def delivery_stats():
+    return _engine.metrics() if _engine is not None else None
@@ -0,0 +1,455 @@
+import argparse
+import random
+import smtplib
+import threading
+import time
+import logging
+from flask import g, has_request_context
+from config import outbox_config, delivery_config
+import db_session
+from email_delivery import get_engine, lane_for, LANE_NAMES, URGENT
+
+logger = logging.getLogger(__name__)
+
+# Set when a request enqueued mail, so in-process workers don't wait for their next poll
+_wake = threading.Event()
+
+
+def enqueue_email(to_email, subject, body, category='general', html_body=None, expires_at=None):
+    """
+    Queue an email for delivery by the outbox workers instead of sending it
+    during the request.
+
+    Inside a request the row joins the request's transaction, so it is sent
+    only if the change the email is about commits; outside a request it is
+    committed straight away.
+
+    Args:
+        to_email (str): Recipient
+        subject (str): Subject line
+        body (str): Plain-text body
+        category (str): Kind of email, e.g. 'otp' or 'appointment'
+        html_body (str): Optional HTML alternative
+        expires_at (datetime): Drop the email if it is still queued at this time
+    """
+    conn = db_session.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO email_outbox (category, priority, to_email, subject, body, html_body, expires_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (category, lane_for(category), to_email, subject, body, html_body, expires_at)
+        )
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+    if has_request_context():
+        g.outbox_enqueued = True
+    else:
+        _wake.set()
+
+
+def enqueue_emails(conn, messages, category='general'):
+    """
+    Queue many emails with one multi-row INSERT on conn. The caller commits,
+    so the emails are queued in the same transaction as its own changes.
+
+    Args:
+        conn: Open connection
+        messages (list): (to_email, subject, body, html_body, expires_at) tuples;
+            expires_at may be None or left out
+        category (str): Kind of email, e.g. 'reminder'
+    """
+    if not messages:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO email_outbox (category, priority, to_email, subject, body, html_body, expires_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            [(category, lane_for(category)) + (tuple(message) + (None,))[:5] for message in messages]
+        )
+    finally:
+        cursor.close()
+    if has_request_context():
+        g.outbox_enqueued = True
+    else:
+        _wake.set()
+
+
+def _wake_workers(exc):
+    # Teardown runs after the unit of work committed, so the rows are visible
+    if g.pop('outbox_enqueued', False) and exc is None:
+        _wake.set()
+
+
+def _permanent_failure(error):
+    """5xx rejections of the message or its recipient won't succeed on retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False  # our credentials, not the message
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def _release(conn, ids):
+    """Put claimed rows that won't be sent by this worker back to 'pending'"""
+    if not ids:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"UPDATE email_outbox SET status = 'pending', locked_until = NULL "
+            f"WHERE status = 'sending' AND id IN ({', '.join(['%s'] * len(ids))})",
+            ids
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class OutboxWorker:
+    """
+    Feeds queued emails to the delivery engine and records the results.
+
+    Each round claims due rows in a short transaction (SELECT ... FOR
+    UPDATE SKIP LOCKED, then mark them 'sending' with a lease), so concurrent
+    workers never pick the same row and no lock is held while talking to
+    SMTP. Rows are claimed lane by lane, urgent first, and only as many as
+    the engine's lane has room for: whatever doesn't fit stays in the table
+    until it does. Rows whose lease expired, e.g. because a worker died
+    mid-send, are put back to 'pending'.
+
+    Rows claimed after their expires_at, such as reminders for appointments
+    that have started, are marked 'expired' instead of being sent.
+
+    Urgent mail carries live OTP codes and one-time links, so its body is
+    blanked as soon as it is sent or given up on. Sent, failed and expired
+    rows are deleted once they are retention_days old.
+
+    Every quota_sync_interval seconds the engine's RateGovernor is told how
+    many emails all processes sent in the last 24 hours, so the account's
+    daily quota holds across processes and restarts.
+
+    Args:
+        name (str): Worker name used in logs
+        batch_size (int): Most rows claimed per lane per round
+        poll_interval (float): Seconds to wait when nothing is due
+        max_attempts (int): Sends tried before a row is marked 'failed'
+        backoff_base (float): Seconds before the first retry; doubles per attempt
+        backoff_max (float): Upper bound on the retry delay
+        lease (int): Seconds a claimed row may stay in 'sending'
+        retention_days (int): Days sent and failed rows are kept
+        purge_interval (float): Seconds between purges of older ones
+        quota_sync_interval (float): Seconds between daily quota syncs
+        engine (DeliveryEngine): Sends the claimed rows; the process-wide engine by default
+    """
+
+    def __init__(self, name='outbox', batch_size=20, poll_interval=1, max_attempts=8,
+                 backoff_base=30, backoff_max=3600, lease=300, retention_days=7, purge_interval=3600,
+                 quota_sync_interval=60, engine=None):
+        self.name = name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.retention_days = retention_days
+        self.purge_interval = purge_interval
+        self.quota_sync_interval = quota_sync_interval
+        self.engine = engine
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_reap = 0.0
+        self._last_purge = 0.0
+        self._results = []  # (row, error) from the engine's sender threads
+        self._results_lock = threading.Lock()
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'expired': 0, 'rounds': 0, 'reaped': 0, 'purged': 0}
+
+    def backoff(self, attempts):
+        """Seconds before retry number attempts, with jitter so retries don't bunch up"""
+        delay = self.backoff_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+        return min(self.backoff_max, delay)
+
+    def _claim(self, conn, room):
+        """Claim due rows for each lane, up to room[lane] of them"""
+        cursor = conn.cursor(dictionary=True)
+        try:
+            rows = []
+            for lane, limit in enumerate(room):
+                if limit <= 0:
+                    continue
+                cursor.execute(
+                    """
+                    SELECT id, category, priority, to_email, subject, body, html_body, attempts,
+                    expires_at <= NOW() AS expired
+                    FROM email_outbox
+                    WHERE status = 'pending' AND priority = %s AND next_attempt_at <= NOW()
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (lane, limit)
+                )
+                rows.extend(cursor.fetchall())
+            expired = [row['id'] for row in rows if row['expired']]
+            rows = [row for row in rows if not row['expired']]
+            if expired:
+                cursor.execute(
+                    f"UPDATE email_outbox SET status = 'expired' WHERE id IN ({', '.join(['%s'] * len(expired))})",
+                    expired
+                )
+            if rows:
+                placeholders = ', '.join(['%s'] * len(rows))
+                cursor.execute(
+                    f"UPDATE email_outbox SET status = 'sending', locked_until = NOW() + INTERVAL %s SECOND "
+                    f"WHERE id IN ({placeholders})",
+                    [self.lease] + [row['id'] for row in rows]
+                )
+            conn.commit()
+            self.stats['expired'] += len(expired)
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _reap(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "UPDATE email_outbox SET status = 'pending', next_attempt_at = NOW() "
+                "WHERE status = 'sending' AND locked_until < NOW()"
+            )
+            if cursor.rowcount:
+                logger.warning(f"{self.name}: requeued {cursor.rowcount} emails whose send lease expired")
+                self.stats['reaped'] += cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def _sync_quota(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM email_outbox WHERE sent_at > NOW() - INTERVAL 1 DAY")
+            (sent,) = cursor.fetchone()
+        finally:
+            cursor.close()
+        self.engine.governor.sync_daily(sent)
+
+    def _purge(self, conn, batch=1000):
+        """Delete finished rows older than retention_days, batch rows per transaction"""
+        cursor = conn.cursor()
+        try:
+            while True:
+                cursor.execute(
+                    "DELETE FROM email_outbox WHERE status IN ('sent', 'failed', 'expired') "
+                    "AND next_attempt_at < NOW() - INTERVAL %s DAY LIMIT %s",
+                    (self.retention_days, batch)
+                )
+                deleted = cursor.rowcount
+                conn.commit()
+                self.stats['purged'] += deleted
+                if deleted < batch:
+                    return
+        finally:
+            cursor.close()
+
+    def _record(self, conn, sent_ids, failures):
+        cursor = conn.cursor()
+        try:
+            if sent_ids:
+                placeholders = ', '.join(['%s'] * len(sent_ids))
+                # Urgent bodies hold live codes and links; nothing needs them once sent
+                cursor.execute(
+                    f"UPDATE email_outbox SET status = 'sent', sent_at = NOW(), attempts = attempts + 1, "
+                    f"locked_until = NULL, last_error = NULL, body = IF(priority = %s, '', body), "
+                    f"html_body = IF(priority = %s, NULL, html_body) WHERE id IN ({placeholders})",
+                    [URGENT, URGENT] + sent_ids
+                )
+            for row, error, permanent in failures:
+                attempts = row['attempts'] + 1
+                if permanent or attempts >= self.max_attempts:
+                    cursor.execute(
+                        "UPDATE email_outbox SET status = 'failed', attempts = %s, locked_until = NULL, last_error = %s, "
+                        "body = IF(priority = %s, '', body), html_body = IF(priority = %s, NULL, html_body) "
+                        "WHERE id = %s",
+                        (attempts, error[:500], URGENT, URGENT, row['id'])
+                    )
+                    logger.error(f"{self.name}: giving up on email {row['id']} to {row['to_email']} "
+                                 f"after {attempts} attempts: {error}")
+                else:
+                    cursor.execute(
+                        "UPDATE email_outbox SET status = 'pending', attempts = %s, locked_until = NULL, last_error = %s, "
+                        "next_attempt_at = NOW() + INTERVAL %s SECOND WHERE id = %s",
+                        (attempts, error[:500], int(self.backoff(attempts)), row['id'])
+                    )
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def _on_result(self, row, error):
+        with self._results_lock:
+            self._results.append((row, error))
+        _wake.set()
+
+    def _flush(self, conn):
+        """Record the outcome of the sends finished since the last round"""
+        with self._results_lock:
+            results, self._results = self._results, []
+        if not results:
+            return
+        sent_ids, failures = [], []
+        for row, error in results:
+            if error is None:
+                sent_ids.append(row['id'])
+            else:
+                logger.warning(f"{self.name}: sending email {row['id']} failed: {str(error)}")
+                failures.append((row, str(error) or type(error).__name__, _permanent_failure(error)))
+        try:
+            self._record(conn, sent_ids, failures)
+        except Exception:
+            with self._results_lock:
+                self._results[:0] = results
+            raise
+        given_up = sum(1 for row, _, permanent in failures if permanent or row['attempts'] + 1 >= self.max_attempts)
+        self.stats['sent'] += len(sent_ids)
+        self.stats['retried'] += len(failures) - given_up
+        self.stats['failed'] += given_up
+
+    def run_once(self):
+        """
+        Record finished sends, then claim what the engine's lanes have room
+        for and hand it over.
+
+        Returns:
+            int: Emails claimed
+        """
+        engine = self.engine = self.engine or get_engine()
+        conn = db_session.get_connection()
+        try:
+            self._flush(conn)
+            governor = engine.governor
+            if governor.daily_quota and (governor.synced_at is None
+                                         or time.monotonic() - governor.synced_at > self.quota_sync_interval):
+                self._sync_quota(conn)
+            if time.monotonic() - self._last_reap > self.lease:
+                self._last_reap = time.monotonic()
+                self._reap(conn)
+            if self.retention_days and time.monotonic() - self._last_purge > self.purge_interval:
+                self._last_purge = time.monotonic()
+                self._purge(conn)
+            # Buffered too long (e.g. the daily quota ran out): give them back before the lease lapses
+            _release(conn, [row['id'] for row in engine.expire(self.lease / 2)])
+
+            room = []
+            for lane in range(len(LANE_NAMES)):
+                # Don't claim mail that the rate limit would keep buffered for most of its lease
+                limited = engine.governor.wait_time(urgent=lane == URGENT) > self.lease / 4
+                room.append(0 if limited else min(self.batch_size, engine.free(lane)))
+            rows = self._claim(conn, room)
+            rejected = [row['id'] for row in rows if not engine.submit(row['priority'], row, self._on_result)]
+            _release(conn, rejected)
+            self.stats['rounds'] += 1
+            return len(rows) - len(rejected)
+        finally:
+            conn.close()
+
+    def run(self):
+        logger.info(f"{self.name}: started")
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name}: outbox round failed: {str(e)}")
+                claimed = 0
+            if not claimed:
+                # Nothing due or no room: sleep until the next poll, a new enqueue or a finished send
+                _wake.wait(self.poll_interval)
+                _wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        _wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_workers = []
+
+
+def start_workers(count=None):
+    """Start count outbox worker threads in this process (OUTBOX_WORKERS by default)"""
+    count = outbox_config.OUTBOX_WORKERS if count is None else count
+    for i in range(count):
+        _workers.append(OutboxWorker(
+            name=f"outbox-{len(_workers) + 1}",
+            batch_size=outbox_config.OUTBOX_BATCH_SIZE,
+            poll_interval=outbox_config.OUTBOX_POLL_INTERVAL,
+            max_attempts=outbox_config.OUTBOX_MAX_ATTEMPTS,
+            backoff_base=outbox_config.OUTBOX_BACKOFF_BASE,
+            backoff_max=outbox_config.OUTBOX_BACKOFF_MAX,
+            lease=outbox_config.OUTBOX_LEASE,
+            retention_days=outbox_config.OUTBOX_RETENTION_DAYS,
+            purge_interval=outbox_config.OUTBOX_PURGE_INTERVAL,
+            quota_sync_interval=delivery_config.DELIVERY_QUOTA_SYNC_INTERVAL,
+        ).start())
+    return list(_workers)
+
+
+def stop_workers(timeout=10):
+    """
+    Stop the workers and their engine. Emails still buffered go back to
+    'pending' and sends that finished are recorded.
+    """
+    for worker in _workers:
+        worker.stop(timeout)
+    engines = {id(worker.engine): worker.engine for worker in _workers if worker.engine is not None}
+    left = [row for engine in engines.values() for row in engine.stop(timeout)]
+    conn = db_session.get_connection()
+    try:
+        _release(conn, [row['id'] for row in left])
+        for worker in _workers:
+            worker._flush(conn)
+    finally:
+        conn.close()
+
+
+def outbox_stats():
+    return {worker.name: dict(worker.stats) for worker in _workers}
+
+
+def init_app(app):
+    """
+    Start OUTBOX_WORKERS worker threads and wake them after requests that
+    queued email. Extra workers can run elsewhere with `python email_outbox.py`.
+    """
+    app.teardown_request(_wake_workers)
+    start_workers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run email outbox workers as a separate process")
+    parser.add_argument('--workers', type=int, default=max(1, outbox_config.OUTBOX_WORKERS), help="Worker threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    start_workers(args.workers)
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Outbox: {outbox_stats()}")
+    except KeyboardInterrupt:
+        stop_workers(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import html
+import os
+import re
+import threading
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+LAYOUT_NAME = '_layout.html'
+
+# {{ name }} inserts a value; {% if name %}...{% endif %} keeps a section only when name is truthy
+_TOKEN = re.compile(r"\{\{\s*(\w+)\s*\}\}|\{%\s*(if|endif)\s*(\w*)\s*%\}")
+
+RenderedEmail = namedtuple('RenderedEmail', ['subject', 'text', 'html'])
+
+
+class TemplateError(Exception):
+    """A template can't be parsed, or a value it needs wasn't supplied"""
+
+
+def _merge(nodes):
+    """Join adjacent static strings so rendering appends as few pieces as possible"""
+    merged = []
+    for node in nodes:
+        if isinstance(node, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += node
+        elif node != '':
+            merged.append(node)
+    return merged
+
+
+def _parse(source, name):
+    """
+    Turn template source into nodes: static strings, ('var', name) and
+    ('if', name, nodes).
+    """
+    stack = [[]]
+    conditions = []
+    position = 0
+    for match in _TOKEN.finditer(source):
+        stack[-1].append(source[position:match.start()])
+        position = match.end()
+        var, tag, condition = match.groups()
+        if var:
+            stack[-1].append(('var', var))
+        elif tag == 'if':
+            if not condition:
+                raise TemplateError(f"{name}: {{% if %}} needs a name")
+            conditions.append(condition)
+            stack.append([])
+        else:
+            if not conditions:
+                raise TemplateError(f"{name}: {{% endif %}} without {{% if %}}")
+            children = _merge(stack.pop())
+            stack[-1].append(('if', conditions.pop(), children))
+    if conditions:
+        raise TemplateError(f"{name}: unclosed {{% if {conditions[-1]} %}}")
+    stack[-1].append(source[position:])
+    return _merge(stack[0])
+
+
+class CompiledTemplate:
+    """
+    A parsed template, rendered by walking its nodes once per message.
+
+    Args:
+        name (str): Used in error messages
+        source (str): Template text
+        escape (bool): HTML-escape inserted values
+    """
+
+    def __init__(self, name, source=None, escape=False, nodes=None):
+        self.name = name
+        self.escape = escape
+        self.nodes = nodes if nodes is not None else _parse(source, name)
+
+    def _value(self, key, context):
+        try:
+            value = context[key]
+        except KeyError:
+            raise TemplateError(f"{self.name}: no value for '{key}'")
+        value = '' if value is None else str(value)
+        return html.escape(value) if self.escape else value
+
+    def _render(self, nodes, context, out):
+        for node in nodes:
+            if isinstance(node, str):
+                out.append(node)
+            elif node[0] == 'var':
+                out.append(self._value(node[1], context))
+            elif context.get(node[1]):
+                self._render(node[2], context, out)
+
+    def render(self, context):
+        out = []
+        self._render(self.nodes, context, out)
+        return ''.join(out)
+
+    def _bind(self, nodes, shared):
+        bound = []
+        for node in nodes:
+            if isinstance(node, str):
+                bound.append(node)
+            elif node[0] == 'var':
+                bound.append(self._value(node[1], shared) if node[1] in shared else node)
+            elif node[1] in shared:
+                if shared[node[1]]:
+                    bound.extend(self._bind(node[2], shared))
+            else:
+                bound.append(('if', node[1], _merge(self._bind(node[2], shared))))
+        return bound
+
+    def bind(self, shared):
+        """Copy of the template with the values in shared already filled in"""
+        return CompiledTemplate(self.name, escape=self.escape, nodes=_merge(self._bind(self.nodes, shared)))
+
+
+class EmailTemplate:
+    """
+    Subject, plain-text and (optional) HTML parts of one email.
+
+    Args:
+        name (str): Template name, e.g. 'otp'
+        subject (CompiledTemplate): Subject line
+        text (CompiledTemplate): Plain-text body
+        html (CompiledTemplate): HTML body, already wrapped in the shared layout, or None
+    """
+
+    def __init__(self, name, subject, text, html=None):
+        self.name = name
+        self.subject = subject
+        self.text = text
+        self.html = html
+
+    def render(self, context):
+        return RenderedEmail(
+            self.subject.render(context),
+            self.text.render(context),
+            self.html.render(context) if self.html is not None else None,
+        )
+
+    def bind(self, shared):
+        return EmailTemplate(
+            self.name,
+            self.subject.bind(shared),
+            self.text.bind(shared),
+            self.html.bind(shared) if self.html is not None else None,
+        )
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def load_templates(directory=TEMPLATE_DIR):
+    """
+    Read and compile every template in directory.
+
+    <name>.txt holds a "Subject: ..." line, a blank line and the text body;
+    an optional <name>.html holds the HTML body, which is placed into
+    _layout.html at {{ content }} before compiling, so the layout becomes part
+    of the template's static text instead of being rendered per message.
+
+    Returns:
+        int: Templates loaded
+    """
+    layout_path = os.path.join(directory, LAYOUT_NAME)
+    layout = _read(layout_path) if os.path.exists(layout_path) else '{{ content }}'
+    if '{{ content }}' not in layout:
+        raise TemplateError(f"{LAYOUT_NAME} has no {{{{ content }}}} placeholder")
+
+    loaded = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.txt'):
+            continue
+        name = filename[:-4]
+        first_line, _, text = _read(os.path.join(directory, filename)).partition('\n')
+        if not first_line.startswith('Subject:'):
+            raise TemplateError(f"{filename}: first line must be 'Subject: ...'")
+        html_path = os.path.join(directory, name + '.html')
+        html_template = None
+        if os.path.exists(html_path):
+            html_template = CompiledTemplate(name + '.html', layout.replace('{{ content }}', _read(html_path)), escape=True)
+        loaded[name] = EmailTemplate(
+            name,
+            CompiledTemplate(name + ' subject', first_line[len('Subject:'):].strip()),
+            CompiledTemplate(filename, text.lstrip('\n')),
+            html_template,
+        )
+    with _lock:
+        _templates.clear()
+        _templates.update(loaded)
+    logger.info(f"Loaded {len(loaded)} email templates from {directory}")
+    return len(loaded)
+
+
+def get_template(name):
+    if not _templates:
+        load_templates()
+    try:
+        return _templates[name]
+    except KeyError:
+        raise TemplateError(f"Unknown email template '{name}'")
+
+
+def render_email(template_name, /, **context):
+    """
+    Render one email.
+
+    Returns:
+        RenderedEmail: (subject, text, html); html is None for text-only templates
+    """
+    return get_template(template_name).render(context)
+
+
+def render_many(template_name, contexts, /, **shared):
+    """
+    Render the same email for many recipients. Values in shared (the same for
+    everyone) are filled in once up front; each context only supplies the
+    per-recipient values.
+
+    Returns:
+        list: RenderedEmail per context, in order
+    """
+    template = get_template(template_name)
+    if shared:
+        template = template.bind(shared)
+    return [template.render(context) for context in contexts]
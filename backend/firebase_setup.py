@@ -1,9 +1,17 @@
 import os
+import re
+import time
+import hashlib
+import threading
 import firebase_admin
-from firebase_admin import credentials, auth
+from firebase_admin import credentials
 import json
 import logging
+import jwt
+import requests
+from cryptography import x509
 from config import firebase_config
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -41,21 +49,164 @@ def initialize_firebase_admin():
         logger.error(f"Failed to initialize Firebase Admin SDK: {str(e)}")
         return False
 
+class PublicKeyCache:
+    """
+    Google's ID token signing keys, keyed by kid.
+
+    The certificate document is re-fetched refresh_ahead seconds before the
+    max-age from its Cache-Control header runs out, or when a token names a
+    kid we don't have (keys rotate). Fetches are serialized, so concurrent
+    misses wait for one fetch instead of each making their own, and at most
+    one is attempted per min_refresh seconds. When a fetch fails the keys we
+    have keep being served until they expire.
+
+    Args:
+        url (str): Certificate document (JSON object of kid -> PEM certificate)
+        fetch (callable): fetch(url) -> response with .json(), .headers and
+            .raise_for_status(); requests.get by default, replaceable for offline use
+        default_ttl (float): Lifetime when the response has no max-age
+        min_refresh (float): Shortest gap between fetch attempts
+        refresh_ahead (float): Seconds before expiry the keys are re-fetched
+    """
+
+    _MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+    def __init__(self, url, fetch=None, default_ttl=3600, min_refresh=60, refresh_ahead=300, clock=time.time):
+        self.url = url
+        self._fetch = fetch or (lambda url: requests.get(url, timeout=5))
+        self.default_ttl = default_ttl
+        self.min_refresh = min_refresh
+        self.refresh_ahead = refresh_ahead
+        self._clock = clock
+        self._keys = {}
+        self._expires_at = 0
+        self._attempted_at = None
+        self._refresh_lock = threading.Lock()
+        self.stats = {'fetches': 0, 'failures': 0}
+
+    def refresh(self):
+        with self._refresh_lock:
+            self._load()
+
+    def _load(self):
+        self.stats['fetches'] += 1
+        try:
+            response = self._fetch(self.url)
+            response.raise_for_status()
+            keys = {
+                kid: x509.load_pem_x509_certificate(pem.encode('utf-8')).public_key()
+                for kid, pem in response.json().items()
+            }
+            match = self._MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+            ttl = int(match.group(1)) if match else self.default_ttl
+            self._keys = keys
+            self._expires_at = self._clock() + ttl
+        finally:
+            # Set once the keys are in place, so callers arriving meanwhile queue on the lock
+            self._attempted_at = self._clock()
+        logger.info(f"Loaded {len(keys)} Google signing keys, valid for {ttl}s")
+
+    def _due(self, kid, now):
+        if self._attempted_at is not None and now - self._attempted_at < self.min_refresh:
+            return False
+        return kid not in self._keys or now >= self._expires_at - self.refresh_ahead
+
+    def get(self, kid):
+        """Public key for kid, or None if Google doesn't publish it or we have no unexpired copy"""
+        if self._due(kid, self._clock()):
+            with self._refresh_lock:
+                # Whoever held the lock before us may have fetched already
+                if self._due(kid, self._clock()):
+                    try:
+                        self._load()
+                    except Exception as e:
+                        self.stats['failures'] += 1
+                        logger.error(f"Failed to fetch Google signing keys: {str(e)}")
+        keys, expires_at = self._keys, self._expires_at
+        if self._clock() >= expires_at:
+            return None
+        return keys.get(kid)
+
+
+class IdTokenVerifier:
+    """
+    Verifies Firebase ID tokens locally, with the same checks as
+    firebase_admin.auth.verify_id_token (without revocation checks):
+    RS256 signature from a current Google key, audience = project id, issuer,
+    expiry/issued-at and a non-empty subject, which is exposed as uid.
+
+    Args:
+        project_id (str): Firebase project id
+        key_cache (PublicKeyCache): Source of signing keys
+    """
+
+    def __init__(self, project_id, key_cache):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_cache = key_cache
+
+    def verify(self, token):
+        """
+        Returns:
+            dict: Decoded claims plus uid
+
+        Raises:
+            jwt.InvalidTokenError: The token is not a valid ID token for this project
+        """
+        header = jwt.get_unverified_header(token)
+        if header.get('alg') != 'RS256':
+            raise jwt.InvalidAlgorithmError(f"Unexpected algorithm {header.get('alg')}")
+        key = self.key_cache.get(header.get('kid'))
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown signing key {header.get('kid')}")
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=['RS256'],
+            audience=self.project_id,
+            issuer=self.issuer,
+            options={'require': ['exp', 'iat', 'aud', 'iss', 'sub']},
+        )
+        subject = claims.get('sub')
+        if not isinstance(subject, str) or not subject or len(subject) > 128:
+            raise jwt.InvalidTokenError("Invalid subject claim")
+        claims['uid'] = subject
+        return claims
+
+
+key_cache = PublicKeyCache(firebase_config.CERTS_URL)
+id_token_verifier = IdTokenVerifier(firebase_config.PROJECT_ID, key_cache)
+# Decoded ID tokens keyed by a digest of the token, kept until the token expires;
+# one sign-up flow verifies the same token several times
+_verified_id_tokens = TTLCache(maxsize=firebase_config.TOKEN_CACHE_SIZE)
+
+
+def warm_up():
+    """
+    Initialize the Admin SDK and fetch Google's signing keys now, so the
+    first Google login on a worker doesn't pay for it. Call at worker startup.
+    """
+    initialized = initialize_firebase_admin()
+    try:
+        key_cache.refresh()
+    except Exception as e:
+        logger.error(f"Failed to prefetch Google signing keys: {str(e)}")
+    return initialized
+
+
 def verify_firebase_token(token):
     """Verify Firebase ID token and return the decoded token"""
     try:
-        # Initialize Firebase Admin if not already initialized
-        if not hasattr(verify_firebase_token, "initialized"):
-            verify_firebase_token.initialized = initialize_firebase_admin()
-            
-        if not verify_firebase_token.initialized:
-            logger.error("Firebase Admin SDK not initialized")
-            return None
-            
-        # Verify the token
-        decoded_token = auth.verify_id_token(token)
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        decoded_token = _verified_id_tokens.get(key)
+        if decoded_token is not None:
+            return dict(decoded_token)
+        
+        # Verify the token against Google's (cached) signing keys
+        decoded_token = id_token_verifier.verify(token)
+        _verified_id_tokens.set(key, decoded_token, expires_at=decoded_token['exp'])
         logger.info(f"Firebase token verified for user {decoded_token.get('uid')}")
-        return decoded_token
+        return dict(decoded_token)
     except Exception as e:
         logger.error(f"Error verifying Firebase token: {str(e)}")
         return None
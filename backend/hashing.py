@@ -0,0 +1,251 @@
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from config import password_config
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing queue is full; callers answer with 429"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Run in the worker processes; must stay importable module-level functions
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _ready():
+    return True
+
+
+class HashingPool:
+    """
+    Runs bcrypt in a bounded process pool so password checks don't occupy
+    request threads' CPU time.
+
+    At most workers + queue_limit hashes are accepted at once; beyond that
+    submit() raises HashingBusyError straight away instead of queueing, so a
+    burst of logins is shed quickly rather than delaying everything else.
+
+    Args:
+        workers (int): Worker processes; 0 runs bcrypt inline on the caller's thread
+        queue_limit (int): Hashes allowed to wait for a free worker
+        timeout (float): Seconds a caller waits for its result
+    """
+
+    def __init__(self, workers, queue_limit, timeout=10):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'submitted': 0, 'rejected': 0, 'timeouts': 0, 'max_in_flight': 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def start(self):
+        """
+        Fork the worker processes now. Call at startup before any other thread
+        runs: a process forked later copies the locks other threads held at that
+        moment and can deadlock on them. The first submit starts every worker.
+        """
+        if self.workers > 0:
+            self._get_executor().submit(_ready).result()
+        return self
+
+    def _done(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    def submit(self, fn, *args):
+        """
+        Run fn(*args) on the pool and wait for the result.
+
+        Raises:
+            HashingBusyError: The queue is full or the result didn't arrive within timeout
+        """
+        if self.workers <= 0:
+            return fn(*args)
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_limit:
+                self._stats['rejected'] += 1
+                raise HashingBusyError("Password hashing queue is full")
+            self._in_flight += 1
+            self._stats['submitted'] += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            logger.warning(f"Password hash did not finish within {self.timeout}s")
+            raise HashingBusyError("Password hashing timed out")
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        stats['workers'] = self.workers
+        stats['queue_limit'] = self.queue_limit
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+hashing_pool = HashingPool(
+    password_config.HASH_POOL_WORKERS,
+    password_config.HASH_QUEUE_LIMIT,
+    timeout=password_config.HASH_TIMEOUT,
+)
+
+
+_rounds = None
+_rounds_lock = threading.Lock()
+
+
+def calibrate(target_ms=None, min_rounds=None, max_rounds=None, samples=3):
+    """
+    Pick the bcrypt work factor for this machine.
+
+    Times a few hashes at min_rounds and, since each extra round doubles the
+    cost, takes the highest work factor whose estimated time stays within
+    target_ms. BCRYPT_ROUNDS overrides calibration when set.
+
+    Returns:
+        int: The work factor new hashes will use
+    """
+    global _rounds
+    target_ms = password_config.BCRYPT_TARGET_MS if target_ms is None else target_ms
+    min_rounds = password_config.BCRYPT_MIN_ROUNDS if min_rounds is None else min_rounds
+    max_rounds = password_config.BCRYPT_MAX_ROUNDS if max_rounds is None else max_rounds
+
+    if password_config.BCRYPT_ROUNDS:
+        rounds = password_config.BCRYPT_ROUNDS
+    else:
+        salt = bcrypt.gensalt(min_rounds)
+        best = None
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.hashpw(b'calibration', salt)
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            best = elapsed_ms if best is None else min(best, elapsed_ms)
+        rounds = min_rounds
+        while rounds < max_rounds and best * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+            rounds += 1
+        logger.info(f"bcrypt work factor {rounds} (cost {min_rounds} took {best:.1f} ms, target {target_ms:.0f} ms)")
+
+    with _rounds_lock:
+        _rounds = rounds
+    return rounds
+
+
+def get_rounds():
+    """Work factor for new hashes, calibrating on first use"""
+    if _rounds is None:
+        return calibrate()
+    return _rounds
+
+
+def hash_rounds(hashed):
+    """Work factor stored in a bcrypt hash ("$2b$12$..." -> 12), or None if unreadable"""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed):
+    """
+    True when a stored hash was made with a lower work factor than the current
+    one. Stronger hashes are kept, so a host that calibrates lower doesn't
+    downgrade them.
+    """
+    rounds = hash_rounds(hashed)
+    return rounds is None or rounds < get_rounds()
+
+
+# Rehashes run here so logins don't wait for them
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehash')
+_rehash_pending = set()
+_rehash_lock = threading.Lock()
+MAX_PENDING_REHASHES = 100
+
+
+def schedule_rehash(key, password, store):
+    """
+    Hash password with the current work factor in the background and pass the
+    new hash to store(new_hash). Skipped if a rehash for key is already queued,
+    too many are queued or the hashing pool is busy; the next successful login
+    tries again.
+
+    Args:
+        key: Identifies the account, e.g. the user id
+        password (str): The plaintext password that just verified
+        store (callable): Persists the new hash
+    """
+    with _rehash_lock:
+        if key in _rehash_pending or len(_rehash_pending) >= MAX_PENDING_REHASHES:
+            return
+        _rehash_pending.add(key)
+
+    def run():
+        try:
+            store(hash_password(password))
+        except HashingBusyError:
+            logger.info(f"Skipped rehash for {key}: hashing pool busy")
+        except Exception as e:
+            logger.error(f"Rehash for {key} failed: {str(e)}")
+        finally:
+            with _rehash_lock:
+                _rehash_pending.discard(key)
+
+    _rehash_executor.submit(run)
+
+
+def check_password(password, hashed):
+    """
+    Check a plaintext password against a stored bcrypt hash.
+
+    Raises:
+        HashingBusyError: Too many hashes in progress
+    """
+    return hashing_pool.submit(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_password(password, rounds=None):
+    """
+    Hash a plaintext password with bcrypt at the calibrated work factor.
+
+    Raises:
+        HashingBusyError: Too many hashes in progress
+    """
+    if rounds is None:
+        rounds = get_rounds()
+    return hashing_pool.submit(_hashpw, password.encode('utf-8'), rounds).decode('utf-8')
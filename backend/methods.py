@@ -1,20 +1,33 @@
 from flask import jsonify
 import mysql.connector
-from config import db_config, jwt_config
+from config import db_config, jwt_config, token_store_config
 import jwt
 import datetime
-import bcrypt
+from hashing import check_password, hash_password, needs_rehash, schedule_rehash, HashingBusyError, hashing_pool
 import uuid
-from utils import send_email, generate_token, validate_token, get_user_id_from_token
+from utils import generate_token, validate_token, get_token_claims, get_user_id_from_token, token_cache_stats
 import requests
 import firebase_admin
-import random
 from microsoft_teams import MicrosoftTeamsIntegration
 from firebase_setup import verify_firebase_token
+from db_pool import get_pool, PoolTimeoutError
+from circuit_breaker import DatabaseUnavailableError
+from db_metrics import query_stats
+from repositories import get_repository
+from principal import get_principal, invalidate_user, principal_cache_stats
+from smtp_pool import smtp_pool_stats
+from email_outbox import enqueue_email, outbox_stats
+from email_delivery import delivery_stats
+from email_templates import render_email
+from reminders import reminder_stats
+from slot_index import slot_index, slot_index_stats
+from token_store import issue_otp, consume_otp, issue_token, peek_token, consume_token, TokenStoreUnavailableError, token_store_stats
+from refresh_tokens import issue_refresh_token, rotate, revoke, revoke_user, adopt_legacy_session, RefreshTokenError, refresh_token_stats
+import db_session
+from rate_limit import rate_limit_stats
 teams_integration = MicrosoftTeamsIntegration()
 import logging 
 logger = logging.getLogger(__name__)
-from datetime import timedelta
 import json
 import os
 import uuid
@@ -23,18 +36,24 @@ import uuid
 # form_data['id'] = form_id 
 
 # Database Connection Function
-def get_db_connection():
+def get_db_connection(read_only=False):
+    """
+    Return the request's shared pooled connection (or a pooled connection outside a request).
+    Pass read_only=True for SELECT-only callers that can be served by a read replica.
+    """
     try:
-        conn = mysql.connector.connect(
-            host=db_config.DB_HOST,
-            user=db_config.DB_USER,
-            password=db_config.DB_PASSWORD,
-            database=db_config.DB_NAME
-        )
-        return conn
-    except mysql.connector.Error as err:
-        print(f"Error: {err}")
+        return db_session.get_connection(read_only=read_only)
+    except DatabaseUnavailableError as err:
+        # Fast-fail: the caller's 500 is turned into a 503 with Retry-After
+        logger.warning(f"Database unavailable: {err}")
         return None
+    except (mysql.connector.Error, PoolTimeoutError) as err:
+        logger.error(f"Database connection error: {err}")
+        return None
+
+def _hashing_busy(e):
+    """429 for a handler whose password hash was shed by the hashing pool (HashingBusyError)"""
+    return jsonify({"error": "Too many password requests in progress, please try again shortly"}), 429, {'Retry-After': str(e.retry_after)}
 
 # Authentication & User Management Functions
 def authenticate_user(data):
@@ -60,9 +79,18 @@ def authenticate_user(data):
     # if not user['is_verified']:
     #     return jsonify({"error": "Account not verified. Please check your email for verification link."}), 401
     
-    if bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+    try:
+        password_ok = check_password(password, user['password'])
+    except HashingBusyError as e:
+        return _hashing_busy(e)
+    
+    if password_ok:
+        if needs_rehash(user['password']):
+            schedule_rehash(user['id'], password, _password_rehash_store(user['id'], user['password']))
+        
         # Generate JWT token - no role needed
         token = jwt.encode({
+            'type': 'access',
             'user_id': user['id'],
             'email': user['email'],
             'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
@@ -71,6 +99,7 @@ def authenticate_user(data):
         return jsonify({
             "message": "Login successful",
             "token": token,
+            "refresh_token": issue_refresh_token(user['id'], user['email'], user['role']),
             "user": {
                 "id": user['id'],
                 "name": user['name'],
@@ -80,6 +109,66 @@ def authenticate_user(data):
     else:
         return jsonify({"error": "Invalid credentials"}), 401
 
+def _password_rehash_store(user_id, old_hash):
+    """Save a rehashed password unless the password was changed in the meantime"""
+    def store(new_hash):
+        conn = db_session.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                (new_hash, user_id, old_hash)
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+    return store
+
+def refresh_session(data, auth_header):
+    """
+    Exchange a refresh token for a new access token and a rotated refresh
+    token. Everything needed is in the token itself, so no DB query is made.
+
+    Clients that only hold an access token from before refresh tokens
+    existed may send it, once and while it is still valid, in the
+    Authorization header; they get a new access token and their first
+    refresh token. Access tokens issued since can't be exchanged this way.
+    """
+    refresh_token = (data or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            claims, token, new_refresh_token = rotate(refresh_token)
+        except RefreshTokenError as e:
+            return jsonify({"error": str(e)}), 401
+        except TokenStoreUnavailableError as e:
+            return _token_store_unavailable(e)
+    else:
+        claims = get_token_claims(auth_header)
+        if claims is None:
+            return jsonify({"error": "Invalid or expired token"}), 401
+        try:
+            token, new_refresh_token = adopt_legacy_session(auth_header.replace('Bearer ', ''), claims)
+        except RefreshTokenError as e:
+            return jsonify({"error": str(e)}), 401
+        except TokenStoreUnavailableError as e:
+            return _token_store_unavailable(e)
+    
+    return jsonify({
+        "message": "Token refreshed successfully",
+        "token": token,
+        "refresh_token": new_refresh_token
+    }), 200
+
+def logout_user(data):
+    refresh_token = (data or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            revoke(refresh_token)
+        except TokenStoreUnavailableError as e:
+            return _token_store_unavailable(e)
+    return jsonify({"message": "Logged out successfully"}), 200
+
 # Firebase token verification
 # def verify_firebase_token(token):
 #     try:
@@ -159,6 +248,7 @@ def google_auth(data):
             
             return jsonify({
                 "token": token,
+                "refresh_token": issue_refresh_token(user['id'], user['email'], user['role']),
                 "user": safe_user,
                 "isNewUser": False
             }), 200
@@ -200,6 +290,7 @@ def google_auth(data):
                 
                 return jsonify({
                     "token": token,
+                    "refresh_token": issue_refresh_token(existing_user['id'], existing_user['email'], existing_user['role']),
                     "user": safe_user,
                     "isNewUser": False
                 }), 200
@@ -265,7 +356,7 @@ def complete_google_registration(data):
             full_address = f"{address}, {city}, {state} {zip_code}".strip()
         
         # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hash_password(password)
         
         # Create new user with hashed password
         cursor.execute(
@@ -300,10 +391,13 @@ def complete_google_registration(data):
         
         return jsonify({
             "token": token,
+            "refresh_token": issue_refresh_token(new_user_id, email, new_user['role']),
             "user": safe_user,
             "message": "Registration completed successfully"
         }), 201
         
+    except HashingBusyError as e:
+        return _hashing_busy(e)
     except Exception as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
@@ -325,7 +419,10 @@ def register_user(data):
         return jsonify({"error": "Name, email, and password are required"}), 400
     
     # Hash the password
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        hashed_password = hash_password(password)
+    except HashingBusyError as e:
+        return _hashing_busy(e)
     
     conn = get_db_connection()
     if not conn:
@@ -367,6 +464,10 @@ def register_user(data):
         conn.close()
         return jsonify({"error": str(e)}), 500
 
+def _token_store_unavailable(e):
+    """503 for a handler that couldn't reach the token store (TokenStoreUnavailableError)"""
+    return jsonify({"error": "Verification service temporarily unavailable"}), 503, {'Retry-After': str(e.retry_after)}
+
 def send_verification_otp(data):
     email = data.get('email')
     
@@ -381,48 +482,25 @@ def send_verification_otp(data):
     
     # Check if email already exists
     cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-    if cursor.fetchone():
-        cursor.close()
-        conn.close()
+    existing = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    if existing:
         return jsonify({"error": "Email already registered"}), 409
     
-    # Generate a 6-digit OTP
-    otp = ''.join(random.choices('0123456789', k=6))
-    
-    # Store OTP in a temporary table or cache
+    # Generate a 6-digit OTP; it expires after OTP_TTL and replaces any earlier code
     try:
-        cursor.execute(
-            """
-            INSERT INTO email_verification (email, otp, created_at) 
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE otp = %s, created_at = %s, is_verified = %s
-            """,
-            (email, otp, datetime.datetime.utcnow(), otp, datetime.datetime.utcnow(), False)
-        )
-        conn.commit()
+        otp = issue_otp(email)
         
         # Send OTP email
-        email_subject = "Your Verification Code"
-        email_body = f"""
-        Hi there,
-        
-        Your verification code is: {otp}
-        
-        This code will expire in 5 minutes.
-        
-        Regards,
-        Accverse
-        """
-        send_email(email, email_subject, email_body)
-        
-        cursor.close()
-        conn.close()
+        otp_email = render_email('otp', code=otp, ttl_minutes=token_store_config.OTP_TTL // 60)
+        enqueue_email(email, otp_email.subject, otp_email.text, category='otp', html_body=otp_email.html)
         
         return jsonify({"message": "Verification code sent successfully"}), 200
+    except TokenStoreUnavailableError as e:
+        return _token_store_unavailable(e)
     except Exception as e:
         logger.error(f"Error sending OTP: {str(e)}")
-        cursor.close()
-        conn.close()
         return jsonify({"error": f"Failed to send verification code: {str(e)}"}), 500
 
 def verify_otp(data):
@@ -432,65 +510,52 @@ def verify_otp(data):
     if not email or not otp:
         return jsonify({"error": "Email and OTP are required"}), 400
     
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
-    
-    # Check if OTP is valid and not expired (5 minutes)
-    cursor.execute(
-        """
-        SELECT * FROM email_verification 
-        WHERE email = %s AND otp = %s AND created_at > %s
-        """,
-        (email, otp, datetime.datetime.utcnow() - datetime.timedelta(minutes=5))
-    )
-    verification = cursor.fetchone()
+    # Valid only if it is the latest code for this email and hasn't expired or been used
+    try:
+        verified = consume_otp(email, str(otp))
+    except TokenStoreUnavailableError as e:
+        return _token_store_unavailable(e)
     
-    if not verification:
-        cursor.close()
-        conn.close()
+    if not verified:
         return jsonify({"error": "Invalid or expired verification code"}), 400
     
-    # Mark email as verified
-    cursor.execute(
-        "UPDATE email_verification SET is_verified = 1 WHERE email = %s",
-        (email,)
-    )
-    conn.commit()
-    
-    cursor.close()
-    conn.close()
-    
     return jsonify({"message": "Email verified successfully"}), 200
 
 def verify_user(token):
     if not token:
         return jsonify({"error": "Verification token is required"}), 400
     
+    # Get the connection before touching the token, so a DB outage doesn't use up the link
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id, email FROM users WHERE verification_token = %s", (token,))
-    user = cursor.fetchone()
+    cursor = conn.cursor()
+    try:
+        verification = peek_token('verify', token)
+        if verification:
+            # Update user to verified status; kept only if this request uses up the token
+            cursor.execute(
+                "UPDATE users SET is_verified = %s WHERE id = %s",
+                (True, verification['user_id'])
+            )
+            verification = consume_token('verify', token)
+    except TokenStoreUnavailableError as e:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return _token_store_unavailable(e)
     
-    if not user:
+    if not verification:
+        conn.rollback()
         cursor.close()
         conn.close()
         return jsonify({"error": "Invalid verification token"}), 400
     
-    # Update user to verified status and remove verification token
-    cursor.execute(
-        "UPDATE users SET is_verified = %s, verification_token = %s WHERE id = %s",
-        (True, None, user['id'])
-    )
     conn.commit()
     
     # Log the successful verification
-    logger.info(f"User {user['email']} verified successfully")
+    logger.info(f"User {verification['user_id']} verified successfully")
     
     cursor.close()
     conn.close()
@@ -510,40 +575,25 @@ def resend_verification(data):
     cursor = conn.cursor(dictionary=True)
     cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
     user = cursor.fetchone()
+    cursor.close()
+    conn.close()
     
     if not user:
-        cursor.close()
-        conn.close()
         return jsonify({"error": "User not found"}), 404
     
     # Generate verification token
-    verification_token = str(uuid.uuid4())
-    
-    cursor.execute(
-        "UPDATE users SET verification_token = %s WHERE id = %s",
-        (verification_token, user['id'])
-    )
-    conn.commit()
+    try:
+        verification_token = issue_token('verify', {'user_id': user['id']}, token_store_config.VERIFICATION_TOKEN_TTL)
+    except TokenStoreUnavailableError as e:
+        return _token_store_unavailable(e)
     
     # Generate verification email
     verification_url = f"http://localhost:8080/verify?token={verification_token}&email={email}"
-    email_subject = "Verify Your Account"
-    email_body = f"""
-    Hi {user['name']},
-    
-    Please verify your account by clicking the link below:
-    
-    {verification_url}
-    
-    This link will expire in 24 hours.
-    
-    Regards,
-    Accverse
-    """
-    send_email(email, email_subject, email_body)
-    
-    cursor.close()
-    conn.close()
+    verification_email = render_email(
+        'verification', name=user['name'], verification_url=verification_url,
+        ttl_hours=token_store_config.VERIFICATION_TOKEN_TTL // 3600
+    )
+    enqueue_email(email, verification_email.subject, verification_email.text, category='verification', html_body=verification_email.html)
     
     return jsonify({"message": "Verification email sent successfully"}), 200
 
@@ -560,53 +610,27 @@ def reset_password_request(data):
     cursor = conn.cursor(dictionary=True)
     cursor.execute("SELECT id, name FROM users WHERE email = %s", (email,))
     user = cursor.fetchone()
+    cursor.close()
+    conn.close()
     
     if not user:
-        cursor.close()
-        conn.close()
         # Don't reveal that email doesn't exist for security
         return jsonify({"message": "If your email is registered, you will receive a reset link."}), 200
     
-    # Generate reset token
-    reset_token = str(uuid.uuid4())
-    
-    # Set expiry to 24 hours from now
-    # Use UTC time to avoid timezone issues
-    expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-    
-    # Store the expiry time in UTC format
-    expiry_timestamp = int(expiry.timestamp())
+    # Generate reset token; the token store expires it after RESET_TOKEN_TTL
+    ttl = token_store_config.RESET_TOKEN_TTL
+    try:
+        reset_token = issue_token('reset', {'user_id': user['id']}, ttl)
+    except TokenStoreUnavailableError as e:
+        return _token_store_unavailable(e)
+    expiry_timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) + ttl
     
-    # Log the token and expiry for debugging
-    logger.info(f"Generated reset token for {email}: {reset_token}")
-    logger.info(f"Expiry time: {expiry}, timestamp: {expiry_timestamp}")
-    logger.info(f"Current time: {datetime.datetime.utcnow()}, current timestamp: {int(datetime.datetime.utcnow().timestamp())}")
-    
-    cursor.execute(
-        "UPDATE users SET reset_token = %s, reset_token_expiry = %s WHERE id = %s",
-        (reset_token, expiry, user['id'])
-    )
-    conn.commit()
+    logger.info(f"Generated reset token for user ID: {user['id']}")
     
     # Send reset email with expiry timestamp in URL
     reset_url = f"http://localhost:8080/forgot-password?token={reset_token}&expiry={expiry_timestamp}"
-    email_subject = "Reset Your Password"
-    email_body = f"""
-    Hi {user['name']},
-    
-    To reset your password, please click the link below:
-    
-    {reset_url}
-    
-    This link will expire in 24 hours.
-    
-    Regards,
-    Accverse
-    """
-    send_email(email, email_subject, email_body)
-    
-    cursor.close()
-    conn.close()
+    reset_email = render_email('password_reset', name=user['name'], reset_url=reset_url, ttl_hours=ttl // 3600)
+    enqueue_email(email, reset_email.subject, reset_email.text, category='password_reset', html_body=reset_email.html)
     
     return jsonify({"message": "If your email is registered, you will receive a reset link."}), 200
 
@@ -617,48 +641,49 @@ def reset_password_complete(data):
     if not token or not new_password:
         return jsonify({"error": "Token and new password are required"}), 400
     
+    # The token is used up last, so a busy hashing pool or a DB or token store
+    # outage on the way leaves the emailed link working
+    try:
+        reset = peek_token('reset', token)
+        if not reset:
+            return jsonify({"error": "Invalid or expired token"}), 400
+        
+        # Hash the new password
+        hashed_password = hash_password(new_password)
+    except HashingBusyError as e:
+        return _hashing_busy(e)
+    except TokenStoreUnavailableError as e:
+        return _token_store_unavailable(e)
+    
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get the current time in UTC
-    current_time = datetime.datetime.utcnow()
-    logger.info(f"Validating token: {token}, current time: {current_time}")
-    
-    # First check if the token exists
-    cursor.execute("SELECT id, reset_token_expiry FROM users WHERE reset_token = %s", (token,))
-    user = cursor.fetchone()
-    
-    if not user:
-        logger.error(f"Token not found: {token}")
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE users SET password = %s WHERE id = %s",
+        (hashed_password, reset['user_id'])
+    )
+    try:
+        # Sessions started with the old password end at their next refresh
+        revoke_user(reset['user_id'])
+        # Only one request can consume the token; the others roll back
+        reset = consume_token('reset', token)
+    except TokenStoreUnavailableError as e:
+        conn.rollback()
         cursor.close()
         conn.close()
-        return jsonify({"error": "Invalid token"}), 400
-    
-    # Log the expiry time from the database for debugging
-    expiry_time = user['reset_token_expiry']
-    logger.info(f"Token expiry from DB: {expiry_time}, current time: {current_time}")
+        return _token_store_unavailable(e)
     
-    # For testing purposes, we'll bypass the expiry check
-    # In production, uncomment this check
-    # if expiry_time < current_time:
-    #     logger.error(f"Token expired: {token}, expiry: {expiry_time}, current: {current_time}")
-    #     cursor.close()
-    #     conn.close()
-    #     return jsonify({"error": "Token has expired. Please request a new password reset."}), 400
-    
-    # Hash the new password
-    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    if not reset:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+        return jsonify({"error": "Invalid or expired token"}), 400
     
-    cursor.execute(
-        "UPDATE users SET password = %s, reset_token = NULL, reset_token_expiry = NULL WHERE id = %s",
-        (hashed_password, user['id'])
-    )
     conn.commit()
     
-    logger.info(f"Password reset successful for user ID: {user['id']}")
+    logger.info(f"Password reset successful for user ID: {reset['user_id']}")
     
     cursor.close()
     conn.close()
@@ -674,7 +699,7 @@ def get_user_profile(token):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         "SELECT id, name, email, phone, address, created_at FROM users WHERE id = %s",
         (user_id,)
@@ -712,26 +737,21 @@ def update_user_profile(token, data):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_user(user_id)
     
     return jsonify({"message": "Profile updated successfully"}), 200
 
-def serialize_timedelta(obj):
-    """Convert timedelta object to a human-readable string."""
-    if isinstance(obj, timedelta):
-        return str(obj)  # Example: '1:30:00' (1 hour, 30 minutes)
-    return obj
-
 # Appointment Booking Functions
 def get_appointments(token):
     user_id = validate_token(token)
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own appointments
     cursor.execute(
@@ -750,17 +770,13 @@ def get_appointments(token):
     cursor.close()
     conn.close()
     
-    for appointment in appointments:
-        for key, value in appointment.items():
-            if isinstance(value, timedelta):
-                appointment[key] = serialize_timedelta(value)
-
     return jsonify({"appointments": appointments}), 200
 
 def create_appointment(token, data):
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
+    user_id = principal.user_id
     
     service_id = data.get('service_id')
     appointment_date = data.get('date')
@@ -799,9 +815,8 @@ def create_appointment(token, data):
         return jsonify({"error": "This time slot is already booked"}), 409
     
     try:
-        # Get user email for Teams meeting and confirmation
-        cursor.execute("SELECT email, name FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
+        # User email and name for the Teams meeting and confirmation
+        user = principal.row
         
         # Create Teams meeting if not already provided
         teams_meeting_data = None
@@ -851,39 +866,15 @@ def create_appointment(token, data):
         )
         conn.commit()
         appointment_id = cursor.lastrowid
+        slot_index.book(appointment_date, appointment_time)
         
-        # Send confirmation email with Teams meeting link if available
-        email_subject = "Appointment Booking Confirmation"
-        email_body = f"""
-        Hi {user['name']},
-        
-        Thank you for booking an appointment with Accverse.
-        
-        Appointment Details:
-        Service: {service['name']}
-        Date: {appointment_date}
-        Time: {appointment_time}
-        Status: Pending (awaiting confirmation)
-        """
-        
-        if teams_meeting_data:
-            email_body += f"""
-            
-            Join Microsoft Teams Meeting:
-            {teams_meeting_data['join_url']}
-            
-            You can join this meeting from your computer, tablet, or smartphone.
-            """
-        
-        email_body += """
-        
-        We will confirm your appointment shortly.
-        
-        Regards,
-        Accverse
-        """
-        
-        send_email(user['email'], email_subject, email_body)
+        # Send confirmation email
+        confirmation = render_email(
+            'appointment_confirmation', name=user['name'], service_name=service['name'],
+            date=appointment_date, time=appointment_time,
+            teams_join_url=teams_meeting_data['join_url'] if teams_meeting_data else None
+        )
+        enqueue_email(user['email'], confirmation.subject, confirmation.text, category='appointment', html_body=confirmation.html)
         
         cursor.close()
         conn.close()
@@ -915,7 +906,7 @@ def get_appointment_details(token, appointment_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own appointments
     cursor.execute(
@@ -948,29 +939,21 @@ def update_appointment(token, appointment_id, data):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get the appointment to check ownership
-    cursor.execute(
-        "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
-        (appointment_id, user_id)
-    )
-    
-    appointment = cursor.fetchone()
+    # Get the appointment to check ownership, with client and service details for the email
+    appointment = get_repository().appointment_with_details(appointment_id, user_id)
     
     if not appointment:
-        cursor.close()
         conn.close()
         return jsonify({"error": "Appointment not found"}), 404
     
     # Clients can only update notes if appointment is not confirmed
     if appointment['status'] != 'pending':
-        cursor.close()
         conn.close()
         return jsonify({"error": "Cannot update confirmed or completed appointments"}), 400
     
     notes = data.get('notes', appointment['notes'])
     
+    cursor = conn.cursor(dictionary=True)
     cursor.execute(
         "UPDATE appointments SET notes = %s WHERE id = %s",
         (notes, appointment_id)
@@ -978,31 +961,12 @@ def update_appointment(token, appointment_id, data):
     
     conn.commit()
     
-    # Get user email for notification
-    cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
-    client = cursor.fetchone()
-    
-    # Get service name
-    cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
-    service = cursor.fetchone()
-    
     # Send update email
-    email_subject = "Appointment Update Notification"
-    email_body = f"""
-    Hi {client['name']},
-    
-    Your appointment with Accverse has been updated.
-    
-    Updated Appointment Details:
-    Service: {service['name']}
-    Date: {appointment['appointment_date']}
-    Time: {appointment['appointment_time']}
-    Status: {appointment['status']}
-    
-    Regards,
-    Accverse
-    """
-    send_email(client['email'], email_subject, email_body)
+    update_email = render_email(
+        'appointment_update', name=appointment['client_name'], service_name=appointment['service_name'],
+        date=appointment['appointment_date'], time=appointment['appointment_time'], status=appointment['status']
+    )
+    enqueue_email(appointment['client_email'], update_email.subject, update_email.text, category='appointment', html_body=update_email.html)
     
     cursor.close()
     conn.close()
@@ -1018,65 +982,37 @@ def cancel_appointment(token, appointment_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
-    
-    # Get the appointment to check ownership
-    cursor.execute(
-        "SELECT * FROM appointments WHERE id = %s AND user_id = %s",
-        (appointment_id, user_id)
-    )
-    
-    appointment = cursor.fetchone()
+    # Get the appointment to check ownership, with client and service details for the email
+    appointment = get_repository().appointment_with_details(appointment_id, user_id)
     
     if not appointment:
-        cursor.close()
         conn.close()
         return jsonify({"error": "Appointment not found"}), 404
     
     # Check if appointment is already cancelled
     if appointment['status'] == 'cancelled':
-        cursor.close()
         conn.close()
         return jsonify({"error": "Appointment is already cancelled"}), 400
     
     # Check if appointment is completed
     if appointment['status'] == 'completed':
-        cursor.close()
         conn.close()
         return jsonify({"error": "Cannot cancel completed appointments"}), 400
     
+    cursor = conn.cursor(dictionary=True)
     cursor.execute(
         "UPDATE appointments SET status = 'cancelled' WHERE id = %s",
         (appointment_id,)
     )
     conn.commit()
-    
-    # Get user email for notification
-    cursor.execute("SELECT email, name FROM users WHERE id = %s", (appointment['user_id'],))
-    client = cursor.fetchone()
-    
-    # Get service name
-    cursor.execute("SELECT name FROM services WHERE id = %s", (appointment['service_id'],))
-    service = cursor.fetchone()
+    slot_index.release(appointment['appointment_date'], appointment['appointment_time'])
     
     # Send cancellation email
-    email_subject = "Appointment Cancellation Notification"
-    email_body = f"""
-    Hi {client['name']},
-    
-    Your appointment with Accverse has been cancelled.
-    
-    Cancelled Appointment Details:
-    Service: {service['name']}
-    Date: {appointment['appointment_date']}
-    Time: {appointment['appointment_time']}
-    
-    If you did not request this cancellation, please contact us.
-    
-    Regards,
-    Accverse
-    """
-    send_email(client['email'], email_subject, email_body)
+    cancellation = render_email(
+        'appointment_cancellation', name=appointment['client_name'], service_name=appointment['service_name'],
+        date=appointment['appointment_date'], time=appointment['appointment_time']
+    )
+    enqueue_email(appointment['client_email'], cancellation.subject, cancellation.text, category='appointment', html_body=cancellation.html)
     
     cursor.close()
     conn.close()
@@ -1086,49 +1022,37 @@ def cancel_appointment(token, appointment_id):
 def get_available_slots(date, service_id):
     if not date:
         return jsonify({"error": "Date is required"}), 400
-    
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection error"}), 500
-    
-    cursor = conn.cursor(dictionary=True)
+    try:
+        date = datetime.date.fromisoformat(date).isoformat()
+    except ValueError:
+        return jsonify({"error": "Date must be YYYY-MM-DD"}), 400
     
     # Check if service exists if service_id is provided
     if service_id:
+        conn = get_db_connection(read_only=True)
+        if not conn:
+            return jsonify({"error": "Database connection error"}), 500
+        
+        cursor = conn.cursor(dictionary=True)
         cursor.execute("SELECT id FROM services WHERE id = %s", (service_id,))
-        if not cursor.fetchone():
-            cursor.close()
-            conn.close()
+        service = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if not service:
             return jsonify({"error": "Service not found"}), 404
     
-    # Get all booked slots for the date
-    cursor.execute(
-        """
-        SELECT appointment_time FROM appointments 
-        WHERE appointment_date = %s AND status != 'cancelled'
-        """,
-        (date,)
-    )
-    booked_slots = [slot['appointment_time'] for slot in cursor.fetchall()]
-    
-    # Define all available time slots (9 AM to 5 PM, 1-hour intervals)
-    all_slots = ['09:00', '10:00', '11:00', '12:00', '13:00', '14:00', '15:00', '16:00']
-    
-    # Filter out booked slots
-    available_slots = [slot for slot in all_slots if slot not in booked_slots]
-    
-    cursor.close()
-    conn.close()
+    # Booked slots come from the in-memory index; only the first lookup of a date queries appointments
+    available_slots = slot_index.available(date)
     
     return jsonify({"date": date, "available_slots": available_slots}), 200
 
 # Services & Pricing Functions
 def get_services():
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         """
         SELECT s.*, c.name as category_name 
@@ -1149,7 +1073,7 @@ def get_service_details(service_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         """
         SELECT s.*, c.name as category_name 
@@ -1169,11 +1093,11 @@ def get_service_details(service_id):
     return jsonify({"service": service}), 200
 
 def get_service_categories():
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute("SELECT * FROM service_categories ORDER BY name")
     categories = cursor.fetchall()
     cursor.close()
@@ -1186,11 +1110,11 @@ def get_tax_form_templates():
     Get available tax form templates
     """
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=True)
         if not conn:
             return jsonify({"error": "Database connection error"}), 500
             
-        cursor = conn.cursor(dictionary=True)
+        cursor = conn.cursor(dictionary=True, json_ready=True)
         cursor.execute("""
             SELECT id, title, subtitle, description, steps, is_active 
             FROM tax_form_templates
@@ -1423,9 +1347,8 @@ def load_tax_form_progress(token, form_id):
     logger.info(f"Loading tax form progress for form ID: {form_id}")
     
     # Get user ID if authenticated
-    user_id = None
-    if token:
-        user_id = get_user_id_from_token(token)
+    principal = get_principal(token) if token else None
+    user_id = principal.user_id if principal else None
     
     try:
         conn = get_db_connection()
@@ -1443,29 +1366,25 @@ def load_tax_form_progress(token, form_id):
         cursor.execute(query, (form_id,))
         saved_form = cursor.fetchone()
         
-        cursor.close()
-        conn.close()
-        
         if not saved_form:
+            cursor.close()
+            conn.close()
             return {'error': 'Form not found'}, 404
             
         # If authenticated, check if the form belongs to the user
         if user_id:
             form_data = json.loads(saved_form['form_data'])
             if 'email' in form_data:
-                # Get user email from DB
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                
-                cursor.execute("SELECT email FROM users WHERE id = %s", (user_id,))
-                user = cursor.fetchone()
-                
-                cursor.close()
-                conn.close()
+                user = principal.row
                 
                 if user and user['email'] != form_data.get('email'):
+                    cursor.close()
+                    conn.close()
                     return {'error': 'Unauthorized access to form'}, 403
         
+        cursor.close()
+        conn.close()
+        
         # Return saved form data
         return {
             'form_data': json.loads(saved_form['form_data']),
@@ -1489,7 +1408,7 @@ def get_payments(token):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own payments
     cursor.execute(
@@ -1509,9 +1428,10 @@ def get_payments(token):
     return jsonify({"payments": payments}), 200
 
 def create_payment(token, data):
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
+    user_id = principal.user_id
     
     amount = data.get('amount')
     description = data.get('description', '')
@@ -1529,8 +1449,7 @@ def create_payment(token, data):
     
     # Check if invoice exists if invoice_id is provided
     if invoice_id:
-        cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
-        invoice = cursor.fetchone()
+        invoice = get_repository().invoices.load(invoice_id)
         
         if not invoice:
             cursor.close()
@@ -1538,10 +1457,7 @@ def create_payment(token, data):
             return jsonify({"error": "Invoice not found"}), 404
         
         # Check if invoice belongs to user if not admin
-        cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        
-        if user['role'] != 'admin' and invoice['user_id'] != user_id:
+        if not principal.is_admin and invoice['user_id'] != user_id:
             cursor.close()
             conn.close()
             return jsonify({"error": "Unauthorized"}), 403
@@ -1558,7 +1474,6 @@ def create_payment(token, data):
             (user_id, amount, description, payment_method, payment_reference, 'pending', 
              invoice_id, datetime.datetime.utcnow())
         )
-        conn.commit()
         payment_id = cursor.lastrowid
         
         # If invoice_id is provided, update invoice status
@@ -1567,7 +1482,11 @@ def create_payment(token, data):
                 "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
                 (datetime.datetime.utcnow(), invoice_id)
             )
-            conn.commit()
+        
+        # Payment and invoice status are committed together
+        conn.commit()
+        if invoice_id:
+            get_repository().invoices.forget(invoice_id)
         
         cursor.close()
         conn.close()
@@ -1578,6 +1497,7 @@ def create_payment(token, data):
             "reference": payment_reference
         }), 201
     except Exception as e:
+        conn.rollback()
         cursor.close()
         conn.close()
         return jsonify({"error": str(e)}), 500
@@ -1591,7 +1511,7 @@ def get_payment_details(token, payment_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own payments
     cursor.execute(
@@ -1644,7 +1564,6 @@ def handle_payment_webhook(data):
         """,
         (status, transaction_id, datetime.datetime.utcnow(), reference)
     )
-    conn.commit()
     
     # If payment is successful and linked to an invoice, update invoice status
     if status == 'completed' and payment['invoice_id']:
@@ -1652,7 +1571,9 @@ def handle_payment_webhook(data):
             "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
             (datetime.datetime.utcnow(), payment['invoice_id'])
         )
-        conn.commit()
+    
+    # Payment and invoice status are committed together
+    conn.commit()
     
     cursor.close()
     conn.close()
@@ -1664,11 +1585,11 @@ def get_invoices(token):
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own invoices
     cursor.execute(
@@ -1696,7 +1617,7 @@ def get_invoice_details(token, invoice_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own invoices
     cursor.execute(
@@ -1746,9 +1667,10 @@ def get_invoice_details(token, invoice_id):
     return jsonify({"invoice": invoice}), 200
 
 def pay_invoice(token, invoice_id, data):
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
+    user_id = principal.user_id
     
     payment_method = data.get('payment_method')
     
@@ -1762,8 +1684,7 @@ def pay_invoice(token, invoice_id, data):
     cursor = conn.cursor(dictionary=True)
     
     # Check if invoice exists
-    cursor.execute("SELECT * FROM invoices WHERE id = %s", (invoice_id,))
-    invoice = cursor.fetchone()
+    invoice = get_repository().invoices.load(invoice_id)
     
     if not invoice:
         cursor.close()
@@ -1771,10 +1692,7 @@ def pay_invoice(token, invoice_id, data):
         return jsonify({"error": "Invoice not found"}), 404
     
     # Check if invoice belongs to user if not admin
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and invoice['user_id'] != user_id:
+    if not principal.is_admin and invoice['user_id'] != user_id:
         cursor.close()
         conn.close()
         return jsonify({"error": "Unauthorized"}), 403
@@ -1797,15 +1715,15 @@ def pay_invoice(token, invoice_id, data):
             (invoice['user_id'], invoice['total_amount'], f"Payment for Invoice #{invoice_id}", 
              payment_method, payment_reference, 'completed', invoice_id, datetime.datetime.utcnow())
         )
-        conn.commit()
         payment_id = cursor.lastrowid
         
-        # Update invoice status
+        # Update invoice status in the same transaction as the payment
         cursor.execute(
             "UPDATE invoices SET status = 'paid', updated_at = %s WHERE id = %s",
             (datetime.datetime.utcnow(), invoice_id)
         )
         conn.commit()
+        get_repository().invoices.forget(invoice_id)
         
         cursor.close()
         conn.close()
@@ -1816,6 +1734,7 @@ def pay_invoice(token, invoice_id, data):
             "reference": payment_reference
         }), 200
     except Exception as e:
+        conn.rollback()
         cursor.close()
         conn.close()
         return jsonify({"error": str(e)}), 500
@@ -1826,11 +1745,11 @@ def get_notifications(token):
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
     
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         """
         SELECT * FROM notifications 
@@ -1939,7 +1858,7 @@ def get_calendar_events(token):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     
     # Clients can only see their own events
     cursor.execute(
@@ -1997,9 +1916,10 @@ def create_calendar_event(token, data):
     }), 201
 
 def update_calendar_event(token, event_id, data):
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
+    user_id = principal.user_id
     
     conn = get_db_connection()
     if not conn:
@@ -2008,8 +1928,7 @@ def update_calendar_event(token, event_id, data):
     cursor = conn.cursor(dictionary=True)
     
     # Check if event exists and belongs to user
-    cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
-    event = cursor.fetchone()
+    event = get_repository().calendar_events.load(event_id)
     
     if not event:
         cursor.close()
@@ -2017,10 +1936,7 @@ def update_calendar_event(token, event_id, data):
         return jsonify({"error": "Event not found"}), 404
     
     # Check if user is admin or event owner
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and event['user_id'] != user_id:
+    if not principal.is_admin and event['user_id'] != user_id:
         cursor.close()
         conn.close()
         return jsonify({"error": "Unauthorized"}), 403
@@ -2042,15 +1958,17 @@ def update_calendar_event(token, event_id, data):
         (title, description, event_date, start_time, end_time, location, event_id)
     )
     conn.commit()
+    get_repository().calendar_events.forget(event_id)
     cursor.close()
     conn.close()
     
     return jsonify({"message": "Calendar event updated successfully"}), 200
 
 def delete_calendar_event(token, event_id):
-    user_id = validate_token(token)
-    if not user_id:
+    principal = get_principal(token)
+    if not principal:
         return jsonify({"error": "Unauthorized"}), 401
+    user_id = principal.user_id
     
     conn = get_db_connection()
     if not conn:
@@ -2059,8 +1977,7 @@ def delete_calendar_event(token, event_id):
     cursor = conn.cursor(dictionary=True)
     
     # Check if event exists
-    cursor.execute("SELECT * FROM calendar_events WHERE id = %s", (event_id,))
-    event = cursor.fetchone()
+    event = get_repository().calendar_events.load(event_id)
     
     if not event:
         cursor.close()
@@ -2068,16 +1985,14 @@ def delete_calendar_event(token, event_id):
         return jsonify({"error": "Event not found"}), 404
     
     # Check if user is admin or event owner
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    
-    if user['role'] != 'admin' and event['user_id'] != user_id:
+    if not principal.is_admin and event['user_id'] != user_id:
         cursor.close()
         conn.close()
         return jsonify({"error": "Unauthorized"}), 403
     
     cursor.execute("DELETE FROM calendar_events WHERE id = %s", (event_id,))
     conn.commit()
+    get_repository().calendar_events.forget(event_id)
     cursor.close()
     conn.close()
     
@@ -2098,11 +2013,11 @@ def sync_external_calendar(token):
 
 # Content Management Functions
 def get_knowledge_base():
-    conn = get_db_connection()
+    conn = get_db_connection(read_only=True)
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         """
         SELECT * FROM knowledge_articles 
@@ -2121,7 +2036,7 @@ def get_knowledge_article(article_id):
     if not conn:
         return jsonify({"error": "Database connection error"}), 500
     
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor(dictionary=True, json_ready=True)
     cursor.execute(
         """
         SELECT * FROM knowledge_articles 
@@ -2138,3 +2053,29 @@ def get_knowledge_article(article_id):
     
     return jsonify({"article": article}), 200
 
+# Admin Diagnostics Functions
+def get_db_query_stats(token):
+    principal = get_principal(token)
+    if not principal:
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if not principal.is_admin:
+        return jsonify({"error": "Unauthorized"}), 403
+    
+    return jsonify({
+        "queries": query_stats.snapshot(),
+        "slow_query_ms": query_stats.slow_query_ms,
+        "pool": get_pool().metrics(),
+        "bulkhead": db_session.bulkhead.metrics(),
+        "token_cache": token_cache_stats(),
+        "hashing": hashing_pool.metrics(),
+        "principal_cache": principal_cache_stats(),
+        "refresh_tokens": refresh_token_stats(),
+        "token_store": token_store_stats(),
+        "smtp": smtp_pool_stats(),
+        "outbox_workers": outbox_stats(),
+        "delivery": delivery_stats(),
+        "reminders": reminder_stats(),
+        "slot_index": slot_index_stats(),
+        "rate_limits": rate_limit_stats()
+    }), 200
@@ -0,0 +1,98 @@
+import os
+import sys
+import logging
+import mysql.connector
+from config import db_config
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def split_statements(sql_script):
+    """Split a SQL script on ';', dropping chunks that hold only comments"""
+    statements = []
+    for chunk in sql_script.split(';'):
+        code = '\n'.join(
+            line for line in chunk.splitlines()
+            if line.strip() and not line.strip().startswith('--')
+        )
+        if code.strip():
+            statements.append(chunk.strip())
+    return statements
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """Return (version, path) for every .sql file, in version order"""
+    migrations = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.sql'):
+            migrations.append((name[:-4], os.path.join(directory, name)))
+    return migrations
+
+
+def run_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Apply pending migrations on an open connection.
+
+    Args:
+        conn: mysql.connector connection with the target database selected
+        directory (str): Folder holding NNNN_description.sql files
+
+    Returns:
+        list: Versions applied by this run
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(255) PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+
+    newly_applied = []
+    for version, path in list_migrations(directory):
+        if version in applied:
+            continue
+        with open(path, 'r') as file:
+            statements = split_statements(file.read())
+        logger.info(f"Applying migration {version} ({len(statements)} statements)")
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+        conn.commit()
+        newly_applied.append(version)
+
+    cursor.close()
+    return newly_applied
+
+
+def main():
+    try:
+        conn = mysql.connector.connect(
+            host=db_config.DB_HOST,
+            port=db_config.DB_PORT,
+            user=db_config.DB_USER,
+            password=db_config.DB_PASSWORD,
+            database=db_config.DB_NAME
+        )
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+        sys.exit(1)
+    try:
+        applied = run_migrations(conn)
+    finally:
+        conn.close()
+    if applied:
+        print(f"Applied migrations: {', '.join(applied)}")
+    else:
+        print("Database schema is up to date.")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
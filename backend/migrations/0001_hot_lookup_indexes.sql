@@ -0,0 +1,50 @@
+-- Secondary indexes for the lookups in methods.py.
+-- Applied by migrate.py; each statement runs once and the version is
+-- recorded in schema_migrations.
+
+-- get_available_slots / create_appointment slot check:
+-- WHERE appointment_date = ? [AND appointment_time = ?] AND status != 'cancelled'
+-- Covers the query (appointment_time, status and the primary key are in the index).
+CREATE INDEX idx_appointments_slot ON appointments (appointment_date, appointment_time, status);
+
+-- get_appointments: WHERE user_id = ? ORDER BY appointment_date DESC, appointment_time DESC
+CREATE INDEX idx_appointments_user_date ON appointments (user_id, appointment_date, appointment_time);
+
+-- verify_user: WHERE verification_token = ?
+CREATE INDEX idx_users_verification_token ON users (verification_token);
+
+-- reset_password_complete: WHERE reset_token = ?
+CREATE INDEX idx_users_reset_token ON users (reset_token);
+
+-- google_auth / complete_google_registration: WHERE firebase_uid = ?
+CREATE INDEX idx_users_firebase_uid ON users (firebase_uid);
+
+-- submit_tax_form admin notifications: WHERE role = 'admin'
+CREATE INDEX idx_users_role ON users (role);
+
+-- handle_payment_webhook: WHERE reference = ?
+CREATE INDEX idx_payments_reference ON payments (reference);
+
+-- get_payments: WHERE user_id = ? ORDER BY created_at DESC
+CREATE INDEX idx_payments_user_created ON payments (user_id, created_at);
+
+-- get_invoice_details payments: WHERE invoice_id = ? ORDER BY created_at DESC
+CREATE INDEX idx_payments_invoice_created ON payments (invoice_id, created_at);
+
+-- get_invoices: WHERE user_id = ? ORDER BY created_at DESC
+CREATE INDEX idx_invoices_user_created ON invoices (user_id, created_at);
+
+-- get_notifications: WHERE user_id = ? ORDER BY created_at DESC
+CREATE INDEX idx_notifications_user_created ON notifications (user_id, created_at);
+
+-- get_calendar_events: WHERE user_id = ? ORDER BY event_date, start_time
+CREATE INDEX idx_calendar_events_user_date ON calendar_events (user_id, event_date, start_time);
+
+-- get_services: WHERE is_active = 1 ORDER BY category_id, name
+CREATE INDEX idx_services_active_category ON services (is_active, category_id, name);
+
+-- get_knowledge_base: WHERE is_published = 1 ORDER BY created_at DESC
+CREATE INDEX idx_knowledge_articles_published ON knowledge_articles (is_published, created_at);
+
+-- get_tax_form_templates: WHERE is_active = TRUE
+CREATE INDEX idx_tax_form_templates_active ON tax_form_templates (is_active);
@@ -0,0 +1,23 @@
+-- Transactional outbox for outgoing email.
+-- Handlers insert a row in the same transaction as the change the email is
+-- about; email_outbox.py workers claim due rows with FOR UPDATE SKIP LOCKED
+-- (MySQL 8.0+), send them and record the outcome.
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    category VARCHAR(50) NOT NULL DEFAULT 'general' COMMENT 'otp, verification, password_reset, appointment, ...',
+    to_email VARCHAR(255) NOT NULL,
+    subject VARCHAR(255) NOT NULL,
+    body MEDIUMTEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' COMMENT 'pending, sending, sent, failed',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until DATETIME NULL COMMENT 'lease of the worker sending it; expired leases are retried',
+    last_error VARCHAR(500) NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at DATETIME NULL
+);
+
+-- Workers: WHERE status = 'pending' AND next_attempt_at <= NOW() ORDER BY next_attempt_at
+-- and the lease reaper: WHERE status = 'sending' AND locked_until < NOW()
+CREATE INDEX idx_email_outbox_due ON email_outbox (status, next_attempt_at);
@@ -0,0 +1,3 @@
+-- HTML alternative for queued email, rendered from templates/email by email_templates.py.
+-- Rows without one are sent as plain text.
+ALTER TABLE email_outbox ADD COLUMN html_body MEDIUMTEXT NULL AFTER body;
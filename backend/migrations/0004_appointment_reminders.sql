@@ -0,0 +1,10 @@
+-- Appointment reminders (reminders.py).
+-- reminder_sent_at is set in the same transaction that queues the reminder
+-- in email_outbox, so each appointment is reminded at most once.
+
+ALTER TABLE appointments ADD COLUMN reminder_sent_at DATETIME NULL;
+
+-- Scheduler refresh, appointments changed since the last refresh:
+-- WHERE updated_at >= ? (new bookings and reschedules inside the loaded window)
+-- The start-time slice uses idx_appointments_slot (appointment_date, appointment_time, status).
+CREATE INDEX idx_appointments_updated ON appointments (updated_at);
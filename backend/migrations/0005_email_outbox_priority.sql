@@ -0,0 +1,13 @@
+-- Priority lanes for outgoing email (email_delivery.py).
+-- 0 = urgent (OTP, password reset, verification), 1 = normal, 2 = bulk (reminders).
+-- Workers claim each lane separately, urgent first, so a backlog of bulk mail
+-- never sits in front of an OTP.
+
+ALTER TABLE email_outbox ADD COLUMN priority TINYINT NOT NULL DEFAULT 1 AFTER category;
+
+UPDATE email_outbox SET priority = 0 WHERE category IN ('otp', 'password_reset', 'verification');
+
+UPDATE email_outbox SET priority = 2 WHERE category = 'reminder';
+
+-- Workers: WHERE status = 'pending' AND priority = ? AND next_attempt_at <= NOW() ORDER BY next_attempt_at
+CREATE INDEX idx_email_outbox_lane ON email_outbox (status, priority, next_attempt_at);
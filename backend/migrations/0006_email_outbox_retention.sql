@@ -0,0 +1,10 @@
+-- Outbox retention (email_outbox.py).
+-- Urgent mail (OTP codes, verification and password-reset links) holds live
+-- credentials, so workers blank its body once it is sent or given up on, and
+-- purge sent and failed rows after OUTBOX_RETENTION_DAYS. This clears the
+-- bodies of urgent mail sent before that.
+
+UPDATE email_outbox SET body = '', html_body = NULL WHERE priority = 0 AND status IN ('sent', 'failed');
+
+-- The purge: WHERE status IN ('sent', 'failed') AND next_attempt_at < ? uses idx_email_outbox_due;
+-- next_attempt_at of a finished row is when its last attempt was due.
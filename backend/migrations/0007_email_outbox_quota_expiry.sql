@@ -0,0 +1,10 @@
+-- Shared daily quota and expiring email (email_delivery.py, email_outbox.py).
+-- Every process sets its copy of the account's daily quota from the mail
+-- sent in the last 24 hours by all of them:
+-- WHERE sent_at > NOW() - INTERVAL 1 DAY
+CREATE INDEX idx_email_outbox_sent ON email_outbox (sent_at);
+
+-- Reminders are pointless once the appointment has started; rows still
+-- queued at expires_at are marked 'expired' instead of being sent, and
+-- purged with sent and failed rows.
+ALTER TABLE email_outbox ADD COLUMN expires_at DATETIME NULL AFTER next_attempt_at;
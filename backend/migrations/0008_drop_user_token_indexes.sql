@@ -0,0 +1,6 @@
+-- Verification and reset tokens moved to the token store (token_store.py),
+-- so nothing looks users up by verification_token or reset_token anymore.
+-- Their indexes from 0001 only slow down writes to users.
+DROP INDEX idx_users_verification_token ON users;
+
+DROP INDEX idx_users_reset_token ON users;
@@ -0,0 +1,96 @@
+import logging
+from flask import g, has_request_context
+from config import jwt_config
+from ttl_cache import TTLCache
+from utils import get_token_claims
+from repositories import get_repository
+
+logger = logging.getLogger(__name__)
+
+# Recently loaded user rows (id, name, email, role) shared across requests
+_user_rows = TTLCache(maxsize=jwt_config.PRINCIPAL_CACHE_SIZE, ttl=jwt_config.PRINCIPAL_CACHE_TTL)
+
+
+class Principal:
+    """
+    The authenticated user of a request.
+
+    user_id (and email, when the token carries it) come from the verified
+    token claims. name and role come from the user row, which is loaded on
+    first access and shared between requests for PRINCIPAL_CACHE_TTL seconds.
+
+    Args:
+        claims (dict): Verified JWT claims
+    """
+
+    def __init__(self, claims):
+        self.user_id = claims['user_id']
+        self._claim_email = claims.get('email')
+        self._row = None
+
+    @property
+    def row(self):
+        """The user's row, or {} if the user no longer exists"""
+        if self._row is None:
+            row = _user_rows.get(self.user_id)
+            if row is None:
+                user = get_repository().users.load(self.user_id)
+                row = {}
+                if user is not None:
+                    row = {key: user[key] for key in ('id', 'name', 'email', 'role')}
+                    _user_rows.set(self.user_id, row)
+            self._row = row
+        return self._row
+
+    @property
+    def exists(self):
+        return bool(self.row)
+
+    @property
+    def email(self):
+        return self._claim_email or self.row.get('email')
+
+    @property
+    def name(self):
+        return self.row.get('name')
+
+    @property
+    def role(self):
+        return self.row.get('role')
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+
+def get_principal(token):
+    """
+    Return the Principal for an Authorization header value, or None if the
+    token is missing or invalid. Inside a request it is built once and reused.
+    """
+    if has_request_context():
+        cached = g.get('principal')
+        if cached is not None and g.get('principal_token') == token:
+            return cached
+    claims = get_token_claims(token)
+    if claims is None:
+        return None
+    principal = Principal(claims)
+    if has_request_context():
+        g.principal = principal
+        g.principal_token = token
+    return principal
+
+
+def invalidate_user(user_id):
+    """Drop a cached user row after it changes"""
+    _user_rows.pop(user_id)
+    if has_request_context():
+        get_repository().users.forget(user_id)
+        principal = g.get('principal')
+        if principal is not None and principal.user_id == user_id:
+            principal._row = None
+
+
+def principal_cache_stats():
+    return _user_rows.stats()
@@ -0,0 +1,316 @@
+import math
+import threading
+import time
+import logging
+from functools import wraps
+from flask import request, jsonify
+from config import rate_limit_config, redis_config
+from resp_client import RespClient, RespError
+
+logger = logging.getLogger(__name__)
+
+SLIDING_WINDOW = 'sliding_window'
+TOKEN_BUCKET = 'token_bucket'
+
+
+class Rule:
+    """
+    One limit, e.g. at most 10 login attempts per email per 15 minutes.
+
+    Args:
+        name (str): Rule name used in keys and metrics
+        scope (str): 'ip' or 'email', what the limit is counted per
+        spec (str): "<count>/<seconds>", e.g. "10/900"
+        algorithm (str): SLIDING_WINDOW, or TOKEN_BUCKET to allow bursts of
+            up to count and refill at count/seconds
+    """
+
+    def __init__(self, name, scope, spec, algorithm=SLIDING_WINDOW):
+        count, period = spec.split('/')
+        self.name = name
+        self.scope = scope
+        self.limit = int(count)
+        self.period = float(period)
+        self.algorithm = algorithm
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.scope!r}, '{self.limit}/{self.period:g}', {self.algorithm!r})"
+
+
+def _sliding_window(rule, now, current, previous):
+    """
+    Sliding window counter: the previous fixed window's count is weighted by
+    how much of it still overlaps the sliding window.
+
+    Returns:
+        tuple: (allowed, retry_after) for one more hit
+    """
+    elapsed = now % rule.period
+    estimate = previous * (1 - elapsed / rule.period) + current
+    if estimate < rule.limit:
+        return True, 0
+    if current >= rule.limit or previous == 0:
+        wait = rule.period - elapsed
+    else:
+        # Time until the previous window's weight decays enough for one more hit
+        wait = rule.period * (1 - (rule.limit - current) / previous) - elapsed
+    return False, max(1, math.ceil(wait))
+
+
+class LocalBackend:
+    """
+    In-process limiter state split across shards, each with its own lock, so
+    concurrent requests for different keys rarely contend.
+
+    Entries idle for longer than their rule's period are pruned from a shard
+    once it holds more than max_keys_per_shard entries.
+
+    Args:
+        shards (int): Number of shards
+        max_keys_per_shard (int): Size that triggers pruning
+        clock (callable): Time source, time.time by default
+    """
+
+    name = 'memory'
+
+    def __init__(self, shards=16, max_keys_per_shard=10000, clock=time.time):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+        self._clock = clock
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def hit(self, rule, key):
+        """
+        Count one request against rule for key.
+
+        Returns:
+            tuple: (allowed, retry_after in whole seconds)
+        """
+        now = self._clock()
+        entries, lock = self._shard(key)
+        with lock:
+            if len(entries) > self.max_keys_per_shard:
+                self._prune(entries, now)
+            if rule.algorithm == TOKEN_BUCKET:
+                return self._token_bucket(entries, rule, key, now)
+            return self._window(entries, rule, key, now)
+
+    @staticmethod
+    def _window(entries, rule, key, now):
+        window = int(now // rule.period)
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = [window, 0, 0, rule.period, now]
+        elif entry[0] != window:
+            # Roll forward; anything older than the previous window no longer counts
+            entry[2] = entry[1] if entry[0] == window - 1 else 0
+            entry[0], entry[1] = window, 0
+        entry[4] = now
+        allowed, retry_after = _sliding_window(rule, now, entry[1], entry[2])
+        if allowed:
+            entry[1] += 1
+        return allowed, retry_after
+
+    @staticmethod
+    def _token_bucket(entries, rule, key, now):
+        rate = rule.limit / rule.period
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = [float(rule.limit), now, rule.period, now]
+        tokens = min(float(rule.limit), entry[0] + (now - entry[1]) * rate)
+        entry[1] = entry[3] = now
+        if tokens >= 1:
+            entry[0] = tokens - 1
+            return True, 0
+        entry[0] = tokens
+        return False, max(1, math.ceil((1 - tokens) / rate))
+
+    @staticmethod
+    def _prune(entries, now):
+        # entry[-2] is the rule period, entry[-1] the last hit
+        stale = [key for key, entry in entries.items() if now - entry[-1] > 2 * entry[-2]]
+        for key in stale:
+            del entries[key]
+
+    def clear(self):
+        for entries, lock in self._shards:
+            with lock:
+                entries.clear()
+
+
+class RedisBackend:
+    """
+    Limiter state on a shared Redis-protocol server so every worker process
+    and host sees the same counts.
+
+    Each hit is one pipelined round trip (INCR and PEXPIRE on the current
+    window's counter, GET on the previous one). Token-bucket rules are counted
+    as sliding windows here; the sustained rate is the same, only the burst
+    shape differs. If the server can't be reached or answers with an error
+    (e.g. NOAUTH or WRONGTYPE), hits fall back to the in-process backend until
+    it answers again, so limits stay enforced per process. An error is logged
+    when it first occurs, not on every retry.
+
+    Args:
+        client (RespClient): Connection to the server
+        prefix (str): Key prefix
+        fallback (LocalBackend): Used while the server is unavailable
+        retry_interval (float): Seconds between reconnect attempts
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='rl:', fallback=None, retry_interval=5, clock=time.time):
+        self.client = client
+        self.prefix = prefix
+        self.fallback = fallback or LocalBackend()
+        self.retry_interval = retry_interval
+        self._clock = clock
+        self._down_until = 0
+        self._last_error = None
+        self.errors = 0
+
+    def hit(self, rule, key):
+        now = self._clock()
+        if now < self._down_until:
+            return self.fallback.hit(rule, key)
+        window = int(now // rule.period)
+        current_key = f"{self.prefix}{key}:{window}"
+        try:
+            current, _, previous = self.client.pipeline(
+                ('INCR', current_key),
+                ('PEXPIRE', current_key, int(rule.period * 2000)),
+                ('GET', f"{self.prefix}{key}:{window - 1}"),
+            )
+            allowed, retry_after = _sliding_window(rule, now, current - 1, int(previous or 0))
+            if not allowed:
+                # Rejected hits don't count, as with the in-process backend
+                self.client.execute('DECR', current_key)
+        except (ConnectionError, ValueError, RespError) as e:
+            self.errors += 1
+            self._down_until = now + self.retry_interval
+            if str(e) != self._last_error:
+                self._last_error = str(e)
+                logger.warning(f"Rate limit backend unavailable, using in-process limits until it answers: {str(e)}")
+            return self.fallback.hit(rule, key)
+        if self._last_error is not None:
+            self._last_error = None
+            logger.info("Rate limit backend is answering again")
+        return allowed, retry_after
+
+    def clear(self):
+        self.fallback.clear()
+
+
+class RateLimiter:
+    """
+    Checks requests against named rules and keeps per-rule counters.
+
+    Args:
+        backend: LocalBackend or RedisBackend
+        rules (list): Rule objects
+    """
+
+    def __init__(self, backend, rules):
+        self.backend = backend
+        self.rules = {rule.name: rule for rule in rules}
+        self._lock = threading.Lock()
+        self._stats = {rule.name: {'allowed': 0, 'rejected': 0} for rule in rules}
+
+    def check(self, rule_names, ip=None, email=None):
+        """
+        Count one request against each rule that has a value for its scope.
+
+        Returns:
+            tuple: (allowed, retry_after, name of the rule that rejected or None)
+        """
+        values = {'ip': ip, 'email': email.strip().lower() if isinstance(email, str) else None}
+        for name in rule_names:
+            rule = self.rules[name]
+            value = values.get(rule.scope)
+            if not value:
+                continue
+            allowed, retry_after = self.backend.hit(rule, f"{name}:{value}")
+            with self._lock:
+                self._stats[name]['allowed' if allowed else 'rejected'] += 1
+            if not allowed:
+                return False, retry_after, name
+        return True, 0, None
+
+    def metrics(self):
+        with self._lock:
+            rules = {name: dict(stats) for name, stats in self._stats.items()}
+        for name, stats in rules.items():
+            rule = self.rules[name]
+            stats.update(scope=rule.scope, limit=rule.limit, period=rule.period, algorithm=rule.algorithm)
+        metrics = {'backend': self.backend.name, 'enabled': rate_limit_config.RATE_LIMIT_ENABLED, 'rules': rules}
+        if isinstance(self.backend, RedisBackend):
+            metrics['backend_errors'] = self.backend.errors
+        return metrics
+
+
+def _build_rules():
+    c = rate_limit_config
+    return [
+        Rule('login_ip', 'ip', c.RATE_LIMIT_LOGIN_IP, TOKEN_BUCKET),
+        Rule('login_email', 'email', c.RATE_LIMIT_LOGIN_EMAIL),
+        Rule('otp_send_ip', 'ip', c.RATE_LIMIT_OTP_SEND_IP, TOKEN_BUCKET),
+        Rule('otp_send_email', 'email', c.RATE_LIMIT_OTP_SEND_EMAIL),
+        Rule('otp_verify_ip', 'ip', c.RATE_LIMIT_OTP_VERIFY_IP, TOKEN_BUCKET),
+        Rule('otp_verify_email', 'email', c.RATE_LIMIT_OTP_VERIFY_EMAIL),
+        Rule('reset_ip', 'ip', c.RATE_LIMIT_RESET_IP, TOKEN_BUCKET),
+        Rule('reset_email', 'email', c.RATE_LIMIT_RESET_EMAIL),
+    ]
+
+
+def _build_backend():
+    local = LocalBackend(shards=rate_limit_config.RATE_LIMIT_SHARDS)
+    if rate_limit_config.RATE_LIMIT_BACKEND == 'redis':
+        client = RespClient(redis_config.REDIS_URL, timeout=redis_config.REDIS_TIMEOUT)
+        return RedisBackend(client, fallback=local)
+    return local
+
+
+limiter = RateLimiter(_build_backend(), _build_rules())
+
+
+def client_ip():
+    """
+    The caller's address. Behind RATE_LIMIT_TRUSTED_PROXIES reverse proxies
+    it is read from X-Forwarded-For, counting entries from the right so a
+    client can't choose its own address by sending the header itself.
+    """
+    proxies = rate_limit_config.RATE_LIMIT_TRUSTED_PROXIES
+    forwarded = request.headers.get('X-Forwarded-For')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-min(proxies, len(hops))]
+    return request.remote_addr
+
+
+def rate_limited(*rule_names):
+    """
+    Reject a view's requests with 429 and Retry-After once any of the named
+    rules is exceeded. Runs before the view, so rejected requests cost no DB
+    or bcrypt work.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if rate_limit_config.RATE_LIMIT_ENABLED:
+                data = request.get_json(silent=True)
+                email = data.get('email') if isinstance(data, dict) else None
+                allowed, retry_after, rule = limiter.check(rule_names, ip=client_ip(), email=email)
+                if not allowed:
+                    logger.warning(f"Rate limit {rule} exceeded on {request.path}")
+                    return jsonify({"error": "Too many requests, please try again later"}), 429, {'Retry-After': str(retry_after)}
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rate_limit_stats():
+    return limiter.metrics()
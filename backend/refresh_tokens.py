@@ -0,0 +1,204 @@
+import threading
+import time
+import uuid
+import logging
+import jwt
+from config import jwt_config
+from token_store import store
+from utils import generate_token
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshTokenError(Exception):
+    """The refresh token is invalid, expired, revoked or was reused"""
+
+
+# Revocations live in the token store (token_store.py), so every server
+# process sees them; with the memory backend they are forgotten on restart.
+# Each is kept until the tokens it covers would have expired anyway:
+#   refresh_rotated (jti)  -> rotated_at for tokens already exchanged
+#   refresh_next (jti)     -> successor token, for JWT_REFRESH_REUSE_GRACE seconds
+#   refresh_family (id)    -> revoked_at for sessions ended by logout or reuse
+#   refresh_user (id)      -> revoked_at; refresh tokens issued earlier are rejected
+#   refresh_legacy (token) -> adopted_at for pre-refresh-token access tokens already exchanged
+_lock = threading.Lock()
+_stats = {'issued': 0, 'rotated': 0, 'grace_reuses': 0, 'reuse_detected': 0, 'legacy_adopted': 0, 'rejected': 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def issue_refresh_token(user_id, email=None, role=None, family=None):
+    """
+    Create a refresh token valid for JWT_REFRESH_TOKEN_EXPIRES seconds.
+
+    The user's claims travel in the token, so exchanging it for an access
+    token needs no database lookup. Tokens rotated from one login share a
+    family id; reusing a rotated token revokes the whole family.
+
+    Args:
+        user_id (int): The user's ID
+        email (str): The user's email (optional)
+        role (str): The user's role (optional)
+        family (str): Family to continue; a new one is started if omitted
+
+    Returns:
+        str: Encoded refresh token
+    """
+    now = time.time()
+    payload = {
+        'type': 'refresh',
+        'user_id': user_id,
+        'jti': uuid.uuid4().hex,
+        'fam': family or uuid.uuid4().hex,
+        'iat': now,  # sub-second, so revoke_user() can't miss a token issued in the same second
+        'exp': int(now) + jwt_config.JWT_REFRESH_TOKEN_EXPIRES,
+    }
+    if email:
+        payload['email'] = email
+    if role:
+        payload['role'] = role
+    _count('issued')
+    return jwt.encode(payload, jwt_config.JWT_SECRET_KEY, algorithm='HS256')
+
+
+def _decode(refresh_token):
+    try:
+        claims = jwt.decode(refresh_token, jwt_config.JWT_SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise RefreshTokenError("Refresh token expired")
+    except jwt.InvalidTokenError:
+        raise RefreshTokenError("Invalid refresh token")
+    if claims.get('type') != 'refresh' or not all(k in claims for k in ('user_id', 'jti', 'fam', 'iat')):
+        raise RefreshTokenError("Invalid refresh token")
+    return claims
+
+
+def _revoke_family(family, now):
+    store.put('refresh_family', family, now, jwt_config.JWT_REFRESH_TOKEN_EXPIRES)
+
+
+def rotate(refresh_token):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+
+    The presented token is marked as rotated. Presenting it again within
+    JWT_REFRESH_REUSE_GRACE seconds (another tab refreshing at the same time)
+    returns the same successor; after that it counts as reuse of a stolen
+    token and the whole family is revoked. The successor itself is only kept
+    for the grace period.
+
+    Returns:
+        tuple: (claims of the presented token, access token, refresh token)
+
+    Raises:
+        RefreshTokenError: The token can't be used
+        TokenStoreUnavailableError: Revocations can't be checked
+    """
+    try:
+        claims = _decode(refresh_token)
+        now = time.time()
+        if store.get('refresh_family', claims['fam']) is not None:
+            raise RefreshTokenError("Refresh token revoked")
+        revoked_at = store.get('refresh_user', claims['user_id'])
+        if revoked_at is not None and claims['iat'] < revoked_at:
+            raise RefreshTokenError("Refresh token revoked")
+
+        successor = None
+        if store.get('refresh_rotated', claims['jti']) is None:
+            candidate = issue_refresh_token(claims['user_id'], claims.get('email'), claims.get('role'), family=claims['fam'])
+            # Of concurrent exchanges, only the first stores its successor; the others return it
+            if store.add('refresh_next', claims['jti'], candidate, max(1, jwt_config.JWT_REFRESH_REUSE_GRACE)):
+                store.put('refresh_rotated', claims['jti'], now, max(1, claims['exp'] - now))
+                successor = candidate
+                _count('rotated')
+        if successor is None:
+            successor = store.get('refresh_next', claims['jti'])
+            if successor is not None:
+                _count('grace_reuses')
+            else:
+                _revoke_family(claims['fam'], now)
+                _count('reuse_detected')
+                logger.warning(f"Refresh token reuse for user {claims['user_id']}, session revoked")
+                raise RefreshTokenError("Refresh token reuse detected")
+    except RefreshTokenError:
+        _count('rejected')
+        raise
+
+    access_token = generate_token(claims['user_id'], claims.get('email'), claims.get('role'))
+    return claims, access_token, successor
+
+
+def adopt_legacy_session(access_token, claims):
+    """
+    Issue the first refresh token of a session that started before refresh
+    tokens existed, from its still valid access token.
+
+    Only access tokens without a type claim qualify; every access token
+    issued since carries one, so this path stops being reachable 24 hours
+    after the upgrade and can then be removed. Each token is adopted once,
+    so it can't start new sessions after a logout, and not at all after
+    revoke_user().
+
+    Args:
+        access_token (str): The encoded access token
+        claims (dict): Its verified claims
+
+    Returns:
+        tuple: (access token, refresh token)
+
+    Raises:
+        RefreshTokenError: The token can't be exchanged
+        TokenStoreUnavailableError: Revocations can't be checked
+    """
+    try:
+        if 'type' in claims:
+            raise RefreshTokenError("A refresh token is required")
+        if store.get('refresh_user', claims['user_id']) is not None:
+            raise RefreshTokenError("Session revoked")
+        now = time.time()
+        ttl = max(1, claims.get('exp', now + jwt_config.JWT_ACCESS_TOKEN_EXPIRES) - now)
+        if not store.add('refresh_legacy', access_token, now, ttl):
+            raise RefreshTokenError("Session already upgraded, a refresh token is required")
+        _count('legacy_adopted')
+    except RefreshTokenError:
+        _count('rejected')
+        raise
+
+    access = generate_token(claims['user_id'], claims.get('email'), claims.get('role'))
+    return access, issue_refresh_token(claims['user_id'], claims.get('email'), claims.get('role'))
+
+
+def revoke(refresh_token):
+    """
+    End the session a refresh token belongs to (logout). Invalid tokens are ignored.
+
+    Raises:
+        TokenStoreUnavailableError: The revocation couldn't be stored
+    """
+    try:
+        claims = _decode(refresh_token)
+    except RefreshTokenError:
+        return False
+    _revoke_family(claims['fam'], time.time())
+    return True
+
+
+def revoke_user(user_id):
+    """
+    Reject every refresh token issued to user_id so far, e.g. after a password reset.
+
+    Raises:
+        TokenStoreUnavailableError: The revocation couldn't be stored
+    """
+    store.put('refresh_user', user_id, time.time(), jwt_config.JWT_REFRESH_TOKEN_EXPIRES)
+
+
+def refresh_token_stats():
+    with _lock:
+        stats = dict(_stats)
+    stats['store'] = store.name
+    return stats
@@ -0,0 +1,333 @@
+import argparse
+import datetime
+import heapq
+import threading
+import time
+import logging
+from config import reminder_config
+import db_session
+from email_outbox import enqueue_emails
+from email_templates import render_many
+
+logger = logging.getLogger(__name__)
+
+# Changed-row scans overlap the previous one by this much, so a row whose
+# transaction committed just after the last scan started isn't missed
+_CHANGE_OVERLAP = datetime.timedelta(seconds=5)
+
+
+def _starts_at(appointment_date, appointment_time):
+    """appointment_time comes back from mysql.connector as a timedelta"""
+    if isinstance(appointment_time, datetime.timedelta):
+        return datetime.datetime.combine(appointment_date, datetime.time.min) + appointment_time
+    return datetime.datetime.combine(appointment_date, appointment_time)
+
+
+class ReminderScheduler:
+    """
+    Queues a reminder email REMINDER_LEAD seconds before each appointment.
+
+    Only reminders due within the next horizon seconds are held, in a
+    min-heap keyed by due time. Each refresh loads the next slice of start
+    times with one range query on (appointment_date, appointment_time).
+    It also picks up appointments booked or rescheduled into the part
+    already loaded, found through updated_at. The thread sleeps until the
+    earliest due time or the next refresh, whichever comes first.
+
+    Due reminders are sent in batches. One query per batch re-reads the
+    appointments, joined with the user, the service and
+    notification_preferences, and locks them with SKIP LOCKED. The
+    reminders are rendered together, queued in email_outbox and
+    reminder_sent_at is set, all in the same transaction. Several schedulers
+    can therefore run at once without sending an appointment's reminder
+    twice. Cancelled, moved and opted-out appointments are dropped at that
+    point, and so are those booked less than lead seconds ahead (the booking
+    confirmation covers them).
+
+    Args:
+        name (str): Name used in logs
+        lead (int): Seconds before the appointment the reminder goes out
+        horizon (int): Seconds of upcoming reminders loaded into the heap
+        refresh_interval (float): Seconds between refreshes
+        batch_size (int): Reminders per send transaction
+    """
+
+    def __init__(self, name='reminders', lead=86400, horizon=900, refresh_interval=60, batch_size=500):
+        self.name = name
+        self.lead = datetime.timedelta(seconds=lead)
+        self.horizon = datetime.timedelta(seconds=horizon)
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self._heap = []  # (due, appointment_id)
+        self._due = {}  # appointment_id -> due of its live heap entry; others are stale
+        self._loaded_until = None  # every reminder due up to here has been loaded
+        self._changed_since = None  # DB time of the previous refresh
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {'loaded': 0, 'queued': 0, 'opted_out': 0, 'dropped': 0, 'batches': 0, 'refreshes': 0}
+
+    def _push(self, appointment_id, due):
+        if self._due.get(appointment_id) == due:
+            return False
+        self._due[appointment_id] = due
+        heapq.heappush(self._heap, (due, appointment_id))
+        return True
+
+    def _schedule(self, rows, now, due_until):
+        """Push rows due by due_until that were booked before their reminder was due"""
+        pushed = 0
+        for row in rows:
+            start = _starts_at(row['appointment_date'], row['appointment_time'])
+            due = start - self.lead
+            if start <= now or due > due_until or row['created_at'] > due:
+                continue
+            pushed += self._push(row['id'], due)
+        return pushed
+
+    def refresh(self, now=None):
+        """
+        Load reminders falling due by now + horizon that aren't in the heap yet.
+
+        Returns:
+            int: Reminders added
+        """
+        now = now or datetime.datetime.now()
+        due_until = now + self.horizon
+        # Start times already loaded end at _loaded_until + lead; never look at ones that have begun
+        start_from = now if self._loaded_until is None else max(now, self._loaded_until + self.lead)
+        start_until = due_until + self.lead
+
+        conn = db_session.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("SELECT NOW() AS now")
+            db_now = cursor.fetchone()['now']
+            cursor.execute(
+                """
+                SELECT id, appointment_date, appointment_time, created_at
+                FROM appointments
+                WHERE (appointment_date > %s OR (appointment_date = %s AND appointment_time > %s))
+                AND (appointment_date < %s OR (appointment_date = %s AND appointment_time <= %s))
+                AND status IN ('pending', 'confirmed') AND reminder_sent_at IS NULL
+                """,
+                (start_from.date(), start_from.date(), start_from.time(),
+                 start_until.date(), start_until.date(), start_until.time())
+            )
+            slice_rows = cursor.fetchall()
+            changed_rows = []
+            if self._changed_since is not None:
+                cursor.execute(
+                    """
+                    SELECT id, appointment_date, appointment_time, created_at
+                    FROM appointments
+                    WHERE updated_at >= %s AND status IN ('pending', 'confirmed') AND reminder_sent_at IS NULL
+                    """,
+                    (self._changed_since - _CHANGE_OVERLAP,)
+                )
+                changed_rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            added = self._schedule(slice_rows, now, due_until)
+            if self._loaded_until is not None:
+                # Later ones will come in with their own slice
+                added += self._schedule(changed_rows, now, self._loaded_until)
+            self._loaded_until = due_until
+            self._changed_since = db_now
+            self.stats['loaded'] += added
+            self.stats['refreshes'] += 1
+        return added
+
+    def _pop_due(self, now):
+        ids = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+                due, appointment_id = heapq.heappop(self._heap)
+                if self._due.get(appointment_id) != due:
+                    continue  # rescheduled since this entry was pushed
+                del self._due[appointment_id]
+                ids.append(appointment_id)
+        return ids
+
+    def _send_batch(self, ids, now):
+        conn = db_session.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f"""
+                SELECT a.id, a.appointment_date, a.appointment_time, u.name, u.email, s.name AS service_name,
+                COALESCE(np.email_notifications, TRUE) AND COALESCE(np.appointment_reminders, TRUE) AS wanted
+                FROM appointments a
+                JOIN users u ON a.user_id = u.id
+                JOIN services s ON a.service_id = s.id
+                LEFT JOIN notification_preferences np ON np.user_id = a.user_id
+                WHERE a.id IN ({placeholders})
+                AND a.status IN ('pending', 'confirmed') AND a.reminder_sent_at IS NULL
+                FOR UPDATE OF a SKIP LOCKED
+                """,
+                ids
+            )
+            rows = cursor.fetchall()
+
+            recipients, contexts, moved, opted_out = [], [], [], 0
+            for row in rows:
+                start = _starts_at(row['appointment_date'], row['appointment_time'])
+                if start - self.lead > now:
+                    moved.append((row['id'], start - self.lead))
+                elif start <= now:
+                    continue
+                elif not row['wanted']:
+                    opted_out += 1
+                else:
+                    recipients.append(row)
+                    contexts.append({
+                        'name': row['name'],
+                        'service_name': row['service_name'],
+                        'date': start.strftime('%Y-%m-%d'),
+                        'time': start.strftime('%H:%M'),
+                    })
+
+            if recipients:
+                emails = render_many('appointment_reminder', contexts)
+                # Bulk mail can be held back by the rate limits; don't send it once the appointment began
+                enqueue_emails(conn, [
+                    (row['email'], email.subject, email.text, email.html,
+                     _starts_at(row['appointment_date'], row['appointment_time']))
+                    for row, email in zip(recipients, emails)
+                ], category='reminder')
+                sent_ids = [row['id'] for row in recipients]
+                cursor.execute(
+                    f"UPDATE appointments SET reminder_sent_at = NOW(), updated_at = updated_at "
+                    f"WHERE id IN ({', '.join(['%s'] * len(sent_ids))})",
+                    sent_ids
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+        with self._lock:
+            for appointment_id, due in moved:
+                if self._loaded_until is not None and due <= self._loaded_until:
+                    self._push(appointment_id, due)
+            self.stats['batches'] += 1
+            self.stats['queued'] += len(recipients)
+            self.stats['opted_out'] += opted_out
+            self.stats['dropped'] += len(ids) - len(recipients) - opted_out - len(moved)
+        return len(recipients)
+
+    def send_due(self, now=None):
+        """
+        Queue every reminder due by now, batch_size at a time.
+
+        Returns:
+            int: Reminders queued
+        """
+        now = now or datetime.datetime.now()
+        queued = 0
+        while True:
+            ids = self._pop_due(now)
+            if not ids:
+                return queued
+            try:
+                queued += self._send_batch(ids, now)
+            except Exception:
+                # Put the batch back and try again on the next refresh
+                retry_at = now + datetime.timedelta(seconds=self.refresh_interval)
+                with self._lock:
+                    for appointment_id in ids:
+                        self._push(appointment_id, retry_at)
+                raise
+
+    def run_once(self, now=None):
+        if time.monotonic() >= self._next_refresh:
+            self._next_refresh = time.monotonic() + self.refresh_interval
+            self.refresh(now)
+        return self.send_due(now)
+
+    def _seconds_to_wait(self):
+        wait = self._next_refresh - time.monotonic()
+        with self._lock:
+            if self._heap:
+                wait = min(wait, (self._heap[0][0] - datetime.datetime.now()).total_seconds())
+        return max(0.0, wait)
+
+    def run(self):
+        logger.info(f"{self.name}: started, reminders go out {self.lead} before appointments")
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name}: reminder round failed: {str(e)}")
+            self._stop.wait(self._seconds_to_wait())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['scheduled'] = len(self._due)
+            stats['next_due'] = self._heap[0][0].isoformat() if self._heap else None
+        return stats
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler(
+            lead=reminder_config.REMINDER_LEAD,
+            horizon=reminder_config.REMINDER_HORIZON,
+            refresh_interval=reminder_config.REMINDER_REFRESH_INTERVAL,
+            batch_size=reminder_config.REMINDER_BATCH_SIZE,
+        ).start()
+    return _scheduler
+
+
+def reminder_stats():
+    return _scheduler.metrics() if _scheduler is not None else None
+
+
+def init_app(app):
+    """
+    Start the reminder scheduler thread unless REMINDER_SCHEDULER is off,
+    e.g. because it runs as its own process with `python reminders.py`.
+    """
+    if reminder_config.REMINDER_SCHEDULER:
+        start_scheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the appointment reminder scheduler as a separate process")
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    scheduler = start_scheduler()
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f"Reminders: {reminder_stats()}")
+    except KeyboardInterrupt:
+        scheduler.stop(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
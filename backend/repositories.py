@@ -0,0 +1,122 @@
+import logging
+from flask import g, has_request_context
+import db_session
+
+logger = logging.getLogger(__name__)
+
+
+class BatchLoader:
+    """
+    Loads rows of one table by id and memoizes them for the request.
+
+    load_many() fetches every id it hasn't seen yet with a single IN (...)
+    query, so handlers that need several rows from the same table pay for
+    one round trip.
+
+    Args:
+        table (str): Table name
+        columns (str): Column list to select; must include id
+    """
+
+    def __init__(self, table, columns='*'):
+        self.table = table
+        self.columns = columns
+        self._rows = {}
+
+    @staticmethod
+    def _key(key):
+        # Ids arrive as strings from JSON bodies and query strings
+        if isinstance(key, str) and key.isdigit():
+            return int(key)
+        return key
+
+    def prime(self, key, row):
+        self._rows[self._key(key)] = row
+
+    def forget(self, key):
+        """Drop a memoized row, e.g. after updating it"""
+        self._rows.pop(self._key(key), None)
+
+    def load(self, key):
+        return self.load_many([key])[0]
+
+    def load_many(self, keys):
+        """Return rows (or None for missing ids) in the order of keys"""
+        missing = {key for key in map(self._key, keys) if key is not None and key not in self._rows}
+        if missing:
+            self._fetch(list(missing))
+        return [self._rows.get(self._key(key)) for key in keys]
+
+    def _fetch(self, keys):
+        placeholders = ', '.join(['%s'] * len(keys))
+        conn = db_session.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(
+                f"SELECT {self.columns} FROM {self.table} WHERE id IN ({placeholders})",
+                tuple(keys)
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        for key in keys:
+            self._rows.setdefault(key, None)
+        for row in rows:
+            self._rows[row['id']] = row
+
+
+class Repository:
+    """
+    Per-request data access used by handlers in methods.py.
+
+    Holds batching loaders for users, invoices and calendar events
+    plus a joined lookup that replaces the fetch-appointment-then-client-
+    then-service sequence in the appointment handlers. The requesting user's
+    role comes from the request's Principal (see principal.py).
+    """
+
+    def __init__(self):
+        self.users = BatchLoader('users', 'id, name, email, phone, address, role, is_verified, created_at')
+        self.invoices = BatchLoader('invoices')
+        self.calendar_events = BatchLoader('calendar_events')
+
+    def _fetchone(self, query, params):
+        conn = db_session.get_connection()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params)
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+        return row
+
+    def appointment_with_details(self, appointment_id, user_id):
+        """
+        Fetch a user's appointment together with the client's name/email and
+        the service name in one query.
+
+        Returns:
+            dict: appointments.* plus client_name, client_email and service_name, or None
+        """
+        return self._fetchone(
+            """
+            SELECT a.*, u.name AS client_name, u.email AS client_email, s.name AS service_name
+            FROM appointments a
+            JOIN users u ON a.user_id = u.id
+            JOIN services s ON a.service_id = s.id
+            WHERE a.id = %s AND a.user_id = %s
+            """,
+            (appointment_id, user_id)
+        )
+
+
+def get_repository():
+    """Return the request's Repository (a fresh one outside a request)"""
+    if not has_request_context():
+        return Repository()
+    repo = g.get('repository')
+    if repo is None:
+        repo = g.repository = Repository()
+    return repo
@@ -0,0 +1,160 @@
+import socket
+import threading
+import logging
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    """Error reply from the server (e.g. "-ERR unknown command")"""
+
+
+class RespClient:
+    """
+    Minimal client for servers speaking the Redis protocol (RESP2).
+
+    Only what the shared rate limiter and token store need: plain commands and
+    pipelines over a small pool of sockets. Any RESP server works, including a
+    local stand-in during development.
+
+    Args:
+        url (str): redis://[:password@]host[:port][/db]
+        timeout (float): Socket connect and read timeout in seconds
+        max_idle (int): Idle connections kept for reuse
+
+    Raises:
+        ConnectionError: The server could not be reached or the connection dropped
+        RespError: The server answered a command with an error
+    """
+
+    def __init__(self, url, timeout=0.5, max_idle=10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip('/') or 0)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile('rb'))
+        try:
+            if self.password:
+                self._roundtrip(conn, [('AUTH', self.password)])
+            if self.db:
+                self._roundtrip(conn, [('SELECT', self.db)])
+        except Exception:
+            self._close(conn)
+            raise
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        for part in reversed(conn):
+            try:
+                part.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(command):
+        out = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if isinstance(arg, bytes):
+                data = arg
+            elif isinstance(arg, str):
+                data = arg.encode('utf-8')
+            else:
+                data = str(arg).encode('ascii')
+            out.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(out)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            return RespError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by server")
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            if count < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply type {kind!r}")
+
+    def _roundtrip(self, conn, commands):
+        sock, reader = conn
+        sock.sendall(b''.join(self._encode(command) for command in commands))
+        replies = [self._read_reply(reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def pipeline(self, *commands):
+        """
+        Send several commands in one round trip and return their replies in order.
+
+        Args:
+            commands: Tuples such as ('INCR', 'key'), ('PEXPIRE', 'key', 1000)
+
+        Returns:
+            list: One reply per command (str, int, bytes, list or None)
+        """
+        conn = None
+        try:
+            # Inside the try, so DNS failures and connect timeouts surface as ConnectionError too
+            conn = self._acquire()
+            replies = self._roundtrip(conn, commands)
+        except RespError:
+            # The whole reply set was read, so the connection is still usable
+            if conn is not None:
+                self._release(conn)
+            raise
+        except (OSError, ValueError) as e:
+            if conn is not None:
+                self._close(conn)
+            raise ConnectionError(f"RESP server {self.host}:{self.port}: {str(e)}") from e
+        self._release(conn)
+        return replies
+
+    def execute(self, *command):
+        """Run a single command, e.g. execute('GET', 'key')"""
+        return self.pipeline(command)[0]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
@@ -0,0 +1,62 @@
+"""
+Cooperative serving mode for I/O-bound traffic.
+
+Runs the regular Flask app on a gevent WSGI server with the standard
+library monkey-patched, so every blocking call the handlers make - MySQL
+through the pure-Python connector, SMTP in utils.send_email, Firebase and
+Microsoft Graph over requests - yields to other requests instead of
+holding a worker thread. The business logic in methods.py is unchanged
+and shared with the threaded entry point (python app.py).
+
+Thousands of requests can be in flight while they wait on SMTP, Firebase,
+Graph or bcrypt. Requests talking to MySQL at the same moment are still
+capped: by the bulkhead (ASYNC_DB_MAX_CONCURRENT_REQUESTS, which replaces
+DB_MAX_CONCURRENT_REQUESTS here) and by the pool (ASYNC_DB_POOL_MAX_SIZE
+connections). A request only counts against them while it holds a
+connection, i.e. until its handler closes a clean connection or, after a
+write, until the response is committed. Size ASYNC_DB_POOL_MAX_SIZE
+against MySQL's max_connections across all processes.
+
+    pip install gevent
+    python serve_async.py
+"""
+from gevent import monkey
+
+# Must run before anything imports socket, ssl, threading or select
+monkey.patch_all()
+
+import logging  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+from config import app_config, db_config  # noqa: E402
+
+# The C extension does its own blocking socket I/O that gevent cannot patch
+db_config.DB_USE_PURE = True
+# Greenlets are cheap, so size the database limits for this mode before db_session builds them
+db_config.DB_POOL_MAX_SIZE = app_config.ASYNC_DB_POOL_MAX_SIZE
+db_config.DB_MAX_CONCURRENT_REQUESTS = app_config.ASYNC_DB_MAX_CONCURRENT_REQUESTS
+
+from app import app, start_background  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def serve():
+    """Serve the app until interrupted, holding up to ASYNC_MAX_CONNECTIONS requests at once"""
+    start_background()
+    server = WSGIServer(
+        (app_config.ASYNC_HOST, app_config.ASYNC_PORT),
+        app,
+        spawn=Pool(app_config.ASYNC_MAX_CONNECTIONS),
+        log=None,
+    )
+    logger.info(
+        f"Cooperative server listening on {app_config.ASYNC_HOST}:{app_config.ASYNC_PORT} "
+        f"(max {app_config.ASYNC_MAX_CONNECTIONS} concurrent requests, {db_config.DB_MAX_CONCURRENT_REQUESTS} "
+        f"of them using the database, {db_config.DB_POOL_MAX_SIZE} database connections)"
+    )
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    serve()
@@ -1,7 +1,8 @@
 import mysql.connector
 import os
-import bcrypt
+from hashing import hash_password
 from dotenv import load_dotenv
+from migrate import run_migrations
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -42,6 +43,11 @@ def setup_database():
         
         print("Database schema and sample data created successfully.")
         
+        # Apply versioned schema changes (indexes etc.) on top of database.sql
+        applied = run_migrations(conn)
+        if applied:
+            print(f"Applied migrations: {', '.join(applied)}")
+        
     except mysql.connector.Error as err:
         print(f"Error: {err}")
     finally:
@@ -71,7 +77,7 @@ def create_admin_user():
         if not admin:
             # Hash password
             password = "admin123"
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            hashed_password = hash_password(password)
             
             # Create admin user
             cursor.execute(
@@ -0,0 +1,228 @@
+import datetime
+import threading
+import time
+import logging
+from config import slot_config, redis_config
+from resp_client import RespClient, RespError
+from ttl_cache import TTLCache
+import db_session
+
+logger = logging.getLogger(__name__)
+
+
+def _minutes(value):
+    """Minutes since midnight of a TIME column (a timedelta from mysql.connector), a time or an 'HH:MM[:SS]' string"""
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds()) // 60
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    hour, minute = str(value).split(':')[:2]
+    return int(hour) * 60 + int(minute)
+
+
+class LocalVersions:
+    """Per-date change counters for a single server process"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, date):
+        return self._versions.get(date, 0)
+
+    def bump(self, date):
+        with self._lock:
+            version = self._versions[date] = self._versions.get(date, 0) + 1
+        return version
+
+
+class RedisVersions:
+    """
+    Per-date change counters shared by every server process. A worker that
+    sees a counter other than the one its copy was built at reloads the date.
+    get() returns None when the server can't be reached, and callers then
+    read the database instead of trusting their copy.
+
+    Args:
+        client (RespClient): Connection to the server
+        prefix (str): Key prefix
+        ttl (int): Seconds a date's counter is kept after its last change
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='slots:v:', ttl=30 * 86400):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, date):
+        try:
+            value = self.client.execute('GET', self.prefix + date)
+        except (ConnectionError, RespError) as e:
+            logger.warning(f"Slot versions unavailable: {str(e)}")
+            return None
+        return int(value) if value is not None else 0
+
+    def bump(self, date):
+        try:
+            version, _ = self.client.pipeline(('INCR', self.prefix + date), ('EXPIRE', self.prefix + date, self.ttl))
+        except (ConnectionError, RespError) as e:
+            logger.warning(f"Slot versions unavailable: {str(e)}")
+            return None
+        return version
+
+
+class DaySlots:
+    """Booked appointments per slot of one date, and the bitmask of slots with any"""
+
+    __slots__ = ('version', 'loaded_at', 'counts', 'mask')
+
+    def __init__(self, version, loaded_at, size):
+        self.version = version
+        self.loaded_at = loaded_at
+        self.counts = [0] * size
+        self.mask = 0
+
+    def add(self, slot, delta):
+        self.counts[slot] = max(0, self.counts[slot] + delta)
+        if self.counts[slot]:
+            self.mask |= 1 << slot
+        else:
+            self.mask &= ~(1 << slot)
+
+
+class SlotIndex:
+    """
+    Which of a date's appointment slots are booked, kept in memory as a
+    bitmask per date.
+
+    A date is loaded with one query the first time it is asked for. After
+    that, create_appointment and cancel_appointment update it in place once
+    their transaction commits, so answering a lookup costs a dict lookup and
+    a version check. Every change also bumps the date's version counter; a
+    copy built at an older version is reloaded, which keeps server processes
+    sharing a RedisVersions counter in step with each other. A copy loaded
+    while a change was in flight may already include it, so it is reloaded
+    too rather than updated.
+
+    Args:
+        start (str): First slot, 'HH:MM'
+        end (str): End of the last slot, 'HH:MM'
+        minutes (int): Slot length
+        versions: LocalVersions or RedisVersions
+        maxsize (int): Dates kept in memory
+        ttl (float): Seconds before a date is reloaded regardless
+    """
+
+    def __init__(self, start='09:00', end='17:00', minutes=60, versions=None, maxsize=1000, ttl=300):
+        self.first = _minutes(start)
+        self.minutes = minutes
+        self.slots = tuple(
+            f"{m // 60:02d}:{m % 60:02d}" for m in range(self.first, _minutes(end) - minutes + 1, minutes)
+        )
+        self.versions = versions or LocalVersions()
+        self._days = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.stats = {'lookups': 0, 'loads': 0, 'updates': 0}
+
+    def slot_of(self, value):
+        """Position of the slot a time falls in, or None outside opening hours"""
+        offset = _minutes(value) - self.first
+        if offset < 0 or offset >= self.minutes * len(self.slots):
+            return None
+        return offset // self.minutes
+
+    def _load(self, date, version):
+        conn = db_session.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT appointment_time FROM appointments WHERE appointment_date = %s AND status != 'cancelled'",
+                (date,)
+            )
+            rows = cursor.fetchall()
+            # Taken once the rows are read: a booking written before this may be in them
+            day = DaySlots(version, time.monotonic(), len(self.slots))
+            for (appointment_time,) in rows:
+                slot = self.slot_of(appointment_time)
+                if slot is not None:
+                    day.add(slot, 1)
+        finally:
+            cursor.close()
+            conn.close()
+        self.stats['loads'] += 1
+        return day
+
+    def _day(self, date):
+        # Read the version before the rows, so a change committed in between forces another load
+        version = self.versions.get(date)
+        day = self._days.get(date)
+        if day is None or version is None or day.version != version:
+            day = self._load(date, version)
+            # A change committed while the rows were read may or may not be in them; don't keep that copy
+            if version is not None and self.versions.get(date) == version:
+                self._days.set(date, day)
+        return day
+
+    def booked_mask(self, date):
+        """Bitmask of the booked slots on date (bit i is self.slots[i])"""
+        self.stats['lookups'] += 1
+        return self._day(str(date)).mask
+
+    def available(self, date):
+        """Free slots on date as 'HH:MM' strings, in order"""
+        mask = self.booked_mask(date)
+        return [slot for i, slot in enumerate(self.slots) if not mask >> i & 1]
+
+    def is_free(self, date, slot_time):
+        slot = self.slot_of(slot_time)
+        return slot is not None and not self.booked_mask(date) >> slot & 1
+
+    def _change(self, date, slot, delta, written_at):
+        with self._lock:
+            version = self.versions.bump(date)
+            day = self._days.get(date)
+            if day is None:
+                return
+            if version is not None and day.version == version - 1 and day.loaded_at < written_at:
+                # No other change since our copy was read, and the copy predates this one: apply in place
+                if slot is not None:
+                    day.add(slot, delta)
+                day.version = version
+                self.stats['updates'] += 1
+            else:
+                self._days.pop(date)
+
+    def _on_commit(self, date, slot_time, delta):
+        date, slot, written_at = str(date), self.slot_of(slot_time), time.monotonic()
+        db_session.on_commit(lambda: self._change(date, slot, delta, written_at))
+
+    def book(self, date, slot_time):
+        """Record a booking written in the current transaction; applied once it commits"""
+        self._on_commit(date, slot_time, 1)
+
+    def release(self, date, slot_time):
+        """Record a cancellation written in the current transaction; applied once it commits"""
+        self._on_commit(date, slot_time, -1)
+
+    def metrics(self):
+        return {'backend': self.versions.name, **self.stats, 'dates': self._days.stats()}
+
+
+def _build_versions():
+    if slot_config.SLOT_INDEX_BACKEND == 'redis':
+        return RedisVersions(RespClient(redis_config.REDIS_URL, timeout=redis_config.REDIS_TIMEOUT))
+    return LocalVersions()
+
+
+slot_index = SlotIndex(
+    slot_config.SLOT_DAY_START, slot_config.SLOT_DAY_END, slot_config.SLOT_MINUTES,
+    versions=_build_versions(), maxsize=slot_config.SLOT_INDEX_SIZE, ttl=slot_config.SLOT_INDEX_TTL,
+)
+
+
+def slot_index_stats():
+    return slot_index.metrics()
@@ -0,0 +1,329 @@
+import smtplib
+import ssl
+import threading
+import time
+import logging
+from collections import deque
+from config import email_config
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPPoolTimeoutError(Exception):
+    """Raised when no SMTP session becomes available before the checkout timeout"""
+
+
+def _session_broken(error):
+    """True for errors after which a session can't be used again"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421  # server is closing the connection
+    # SMTPException subclasses OSError; what's left are socket errors
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """
+    Bounded pool of authenticated SMTP sessions to one provider account.
+
+    Sessions stay open between messages, so a send costs one MAIL/RCPT/DATA
+    exchange instead of connect, EHLO, STARTTLS, login and QUIT. A background
+    thread sends NOOP on sessions idle for keepalive_interval so the server
+    doesn't drop them, and closes those idle longer than idle_timeout. When
+    a session turns out to be dead, the other idle sessions are closed too,
+    since whatever dropped it (a server restart, a network change) most
+    likely dropped them as well, and the message is retried once on a newly
+    opened connection.
+
+    Args:
+        name (str): Pool name used in logs and metrics
+        host (str): SMTP server
+        port (int): SMTP port
+        username (str): Login user; no login if empty
+        password (str): Login password
+        starttls (bool): Upgrade the connection with STARTTLS before login
+        max_sessions (int): Cap on open sessions to this provider
+        checkout_timeout (float): Seconds send() waits for a free session
+        keepalive_interval (float): Idle seconds before a session gets a NOOP
+        idle_timeout (float): Idle seconds before a session is closed
+        timeout (float): Socket timeout for SMTP commands
+    """
+
+    def __init__(self, name, host, port, username=None, password=None, starttls=True, max_sessions=3,
+                 checkout_timeout=10, keepalive_interval=30, idle_timeout=240, timeout=10):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.name = name
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.max_sessions = max_sessions
+        self.checkout_timeout = checkout_timeout
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (session, idle_since, noop_at) - newest on the right
+        self._size = 0
+        self._closed = False
+        self._keepalive_thread = None
+        self._stats = {
+            'connects': 0,
+            'connect_failures': 0,
+            'disconnects': 0,
+            'sent': 0,
+            'send_failures': 0,
+            'retries': 0,
+            'keepalives': 0,
+            'idle_evictions': 0,
+            'checkout_timeouts': 0,
+            'wait_time_max': 0.0,
+        }
+
+    def _connect(self):
+        try:
+            session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            session.ehlo()
+            if self.starttls:
+                session.starttls(context=ssl.create_default_context())
+                session.ehlo()
+            if self.username:
+                session.login(self.username, self.password)
+        except Exception:
+            with self._cond:
+                self._stats['connect_failures'] += 1
+            raise
+        with self._cond:
+            self._stats['connects'] += 1
+        self._start_keepalive()
+        return session
+
+    def _disconnect(self, session):
+        try:
+            session.quit()
+        except Exception:
+            try:
+                session.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._stats['disconnects'] += 1
+
+    def _checkout(self, fresh=False):
+        """Take an idle session or open one; with fresh, always open a new one"""
+        deadline = time.monotonic() + self.checkout_timeout
+        started = time.monotonic()
+        stale = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise SMTPPoolTimeoutError(f"SMTP pool '{self.name}' is closed")
+                if self._idle:
+                    session, _, _ = self._idle.pop()
+                    if fresh:
+                        # Close it and open a new session in its slot
+                        stale, session = session, None
+                    break
+                if self._size < self.max_sessions:
+                    self._size += 1
+                    session = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['checkout_timeouts'] += 1
+                    raise SMTPPoolTimeoutError(
+                        f"No SMTP session free in pool '{self.name}' after {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], time.monotonic() - started)
+        if stale is not None:
+            self._disconnect(stale)
+        if session is None:
+            try:
+                session = self._connect()
+            except Exception:
+                self._discard(None)
+                raise
+        return session
+
+    def _release(self, session, idle_since=None, noop_at=None):
+        now = time.monotonic()
+        with self._cond:
+            if not self._closed:
+                idle_since = now if idle_since is None else idle_since
+                self._idle.append((session, idle_since, noop_at or idle_since))
+                self._cond.notify()
+                return
+            self._size -= 1
+        self._disconnect(session)
+
+    def _drain_idle(self):
+        """Close every idle session"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify(len(idle))
+        for session, _, _ in idle:
+            self._disconnect(session)
+        return len(idle)
+
+    def _discard(self, session):
+        """Drop a broken session and free its slot"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        if session is not None:
+            self._disconnect(session)
+
+    def send(self, msg, from_addr=None, to_addrs=None):
+        """
+        Send an email.message.Message on a pooled session.
+
+        Raises:
+            SMTPPoolTimeoutError: Every session stayed busy for checkout_timeout
+            smtplib.SMTPException: The server rejected the message
+        """
+        for attempt in (1, 2):
+            session = self._checkout(fresh=attempt == 2)
+            try:
+                session.send_message(msg, from_addr, to_addrs)
+            except Exception as e:
+                if not _session_broken(e):
+                    # The server refused this message; the session itself is fine
+                    self._release(session)
+                    with self._cond:
+                        self._stats['send_failures'] += 1
+                    raise
+                self._discard(session)
+                if attempt == 1:
+                    # Most likely the server closed it since it was last used, and its idle siblings with it
+                    drained = self._drain_idle()
+                    logger.info(f"SMTP session in pool '{self.name}' was dead ({str(e)}), "
+                                f"closed {drained} idle sessions, reconnecting")
+                    with self._cond:
+                        self._stats['retries'] += 1
+                    continue
+                with self._cond:
+                    self._stats['send_failures'] += 1
+                raise
+            self._release(session)
+            with self._cond:
+                self._stats['sent'] += 1
+            return
+
+    def _start_keepalive(self):
+        with self._cond:
+            if self._keepalive_thread is not None or self.keepalive_interval <= 0:
+                return
+            self._keepalive_thread = threading.Thread(
+                target=self._keepalive_loop, name=f"smtp-keepalive-{self.name}", daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed, timeout=self.keepalive_interval)
+                if self._closed:
+                    return
+            self.maintain()
+
+    def maintain(self):
+        """NOOP sessions idle for keepalive_interval and close those idle past idle_timeout"""
+        now = time.monotonic()
+        due, expired = [], []
+        with self._cond:
+            keep = deque()
+            for session, idle_since, noop_at in self._idle:
+                if now - idle_since > self.idle_timeout:
+                    expired.append(session)
+                elif now - noop_at >= self.keepalive_interval:
+                    due.append((session, idle_since))
+                else:
+                    keep.append((session, idle_since, noop_at))
+            self._idle = keep
+            # Sessions being checked stay counted in _size so the cap holds
+            self._size -= len(expired)
+            self._stats['idle_evictions'] += len(expired)
+            self._cond.notify(len(expired))
+        for session in expired:
+            self._disconnect(session)
+        for session, idle_since in due:
+            try:
+                code, _ = session.noop()
+                alive = code == 250
+            except Exception:
+                alive = False
+            with self._cond:
+                self._stats['keepalives'] += 1
+            if alive:
+                # A NOOP isn't use; the session still ages towards idle_timeout
+                self._release(session, idle_since, time.monotonic())
+            else:
+                self._discard(session)
+
+    def metrics(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+        stats['max_sessions'] = self.max_sessions
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for session, _, _ in idle:
+            self._disconnect(session)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host=None, port=None, username=None, password=None):
+    """
+    Pool for an SMTP account, created on first use. One pool per
+    (host, port, username) so each provider account gets its own session cap.
+    Defaults to the EmailConfig account.
+    """
+    host = host or email_config.SMTP_SERVER
+    port = port or email_config.SMTP_PORT
+    if username is None:
+        username, password = email_config.SMTP_USERNAME, email_config.SMTP_PASSWORD
+    key = (host, port, username)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = SMTPPool(
+                    f"{username}@{host}" if username else host,
+                    host, port, username, password,
+                    starttls=email_config.SMTP_STARTTLS,
+                    max_sessions=email_config.SMTP_MAX_SESSIONS,
+                    checkout_timeout=email_config.SMTP_CHECKOUT_TIMEOUT,
+                    keepalive_interval=email_config.SMTP_KEEPALIVE_INTERVAL,
+                    idle_timeout=email_config.SMTP_IDLE_TIMEOUT,
+                    timeout=email_config.SMTP_TIMEOUT,
+                )
+    return pool
+
+
+def smtp_pool_stats():
+    return {pool.name: pool.metrics() for pool in list(_pools.values())}
+
+
+def close_smtp_pools():
+    """Close every pool; the next send opens a new one"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,66 @@
+import pytest
+from flask import Flask
+
+import methods
+from token_store import issue_token, peek_token
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params):
+        self.executed.append(query)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_verification_link_survives_a_database_outage(app, monkeypatch):
+    token = issue_token('verify', {'user_id': 7}, 60)
+    monkeypatch.setattr(methods, 'get_db_connection', lambda read_only=False: None)
+
+    with app.test_request_context():
+        _, status = methods.verify_user(token)
+    assert status == 500
+    assert peek_token('verify', token) == {'user_id': 7}
+
+
+def test_verification_link_works_once(app, monkeypatch):
+    token = issue_token('verify', {'user_id': 7}, 60)
+    first, second = FakeConnection(), FakeConnection()
+    connections = iter([first, second])
+    monkeypatch.setattr(methods, 'get_db_connection', lambda read_only=False: next(connections))
+
+    with app.test_request_context():
+        _, status = methods.verify_user(token)
+        assert status == 200 and first.committed
+        _, status = methods.verify_user(token)
+        assert status == 400 and not second.committed
+
+
+def test_reset_link_survives_a_database_outage(app, monkeypatch):
+    token = issue_token('reset', {'user_id': 7}, 60)
+    monkeypatch.setattr(methods, 'get_db_connection', lambda read_only=False: None)
+    monkeypatch.setattr(methods, 'hash_password', lambda password: 'hashed')
+
+    with app.test_request_context():
+        _, status = methods.reset_password_complete({'token': token, 'password': 'new-password'})
+    assert status == 500
+    assert peek_token('reset', token) == {'user_id': 7}
@@ -0,0 +1,146 @@
+import datetime
+import threading
+import time
+
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from firebase_setup import IdTokenVerifier, PublicKeyCache
+
+PROJECT_ID = 'accverse-test'
+
+
+def make_key(name):
+    """An RSA key and a self-signed certificate for it, like the ones Google publishes"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode('utf-8')
+
+
+class FakeResponse:
+    def __init__(self, certs, max_age):
+        self._certs = certs
+        self.headers = {'Cache-Control': f"public, max-age={max_age}"}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return dict(self._certs)
+
+
+class FakeCertsEndpoint:
+    """Serves the certificate document; slow and failing on demand"""
+
+    def __init__(self, certs, max_age=3600):
+        self.certs = certs
+        self.max_age = max_age
+        self.calls = 0
+        self.delay = 0
+        self.fail = False
+
+    def __call__(self, url):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("certs endpoint unreachable")
+        return FakeResponse(self.certs, self.max_age)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def sign(key, kid, now, **claims):
+    payload = {
+        'iss': f"https://securetoken.google.com/{PROJECT_ID}",
+        'aud': PROJECT_ID,
+        'sub': 'firebase-uid-1',
+        'iat': int(now),
+        'exp': int(now) + 3600,
+        **claims,
+    }
+    return jwt.encode(payload, key, algorithm='RS256', headers={'kid': kid})
+
+
+@pytest.fixture(scope='module')
+def signing_key():
+    return make_key('kid-1')
+
+
+def test_verifies_token_signed_with_published_key(signing_key):
+    key, pem = signing_key
+    endpoint = FakeCertsEndpoint({'kid-1': pem})
+    verifier = IdTokenVerifier(PROJECT_ID, PublicKeyCache('certs', fetch=endpoint))
+
+    claims = verifier.verify(sign(key, 'kid-1', time.time()))
+
+    assert claims['uid'] == 'firebase-uid-1'
+    assert endpoint.calls == 1
+
+
+def test_rejects_token_for_other_project(signing_key):
+    key, pem = signing_key
+    verifier = IdTokenVerifier(PROJECT_ID, PublicKeyCache('certs', fetch=FakeCertsEndpoint({'kid-1': pem})))
+
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(sign(key, 'kid-1', time.time(), aud='another-project'))
+
+
+def test_concurrent_misses_share_one_fetch(signing_key):
+    _, pem = signing_key
+    endpoint = FakeCertsEndpoint({'kid-1': pem})
+    endpoint.delay = 0.05
+    cache = PublicKeyCache('certs', fetch=endpoint)
+    keys = []
+
+    threads = [threading.Thread(target=lambda: keys.append(cache.get('kid-1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert endpoint.calls == 1
+    assert len(keys) == 8 and all(key is not None for key in keys)
+
+
+def test_failed_refetch_keeps_serving_unexpired_keys(signing_key):
+    _, pem = signing_key
+    clock = Clock()
+    endpoint = FakeCertsEndpoint({'kid-1': pem}, max_age=3600)
+    cache = PublicKeyCache('certs', fetch=endpoint, min_refresh=60, refresh_ahead=300, clock=clock)
+    assert cache.get('kid-1') is not None
+
+    endpoint.fail = True
+    clock.now += 3600 - 200  # inside the refresh-ahead window
+    assert cache.get('kid-1') is not None
+    clock.now += 100  # a rotated-in kid while the endpoint is down
+    assert cache.get('kid-2') is None
+    assert cache.get('kid-1') is not None
+    assert cache.stats['failures'] == 2
+
+    clock.now += 100  # past max-age with no successful refetch
+    assert cache.get('kid-1') is None
+
+    endpoint.fail = False
+    clock.now += 60
+    assert cache.get('kid-1') is not None
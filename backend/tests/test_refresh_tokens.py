@@ -0,0 +1,84 @@
+import datetime
+
+import jwt
+import pytest
+from flask import Flask
+
+import refresh_tokens
+from config import jwt_config
+from methods import get_user_profile, refresh_session
+from utils import generate_token, invalidate_token_cache, validate_token
+
+
+@pytest.fixture
+def app():
+    invalidate_token_cache()
+    return Flask(__name__)
+
+
+def test_refresh_token_is_not_an_access_token(app):
+    refresh_token = refresh_tokens.issue_refresh_token(42, 'client@example.com')
+
+    assert validate_token('Bearer ' + refresh_token) is None
+    with app.test_request_context():
+        _, status = get_user_profile('Bearer ' + refresh_token)
+    assert status == 401
+
+
+def test_revoked_refresh_token_gets_401_on_protected_endpoint(app):
+    refresh_token = refresh_tokens.issue_refresh_token(42, 'client@example.com')
+    assert refresh_tokens.revoke(refresh_token)
+
+    with app.test_request_context():
+        _, status = get_user_profile('Bearer ' + refresh_token)
+        assert status == 401
+        _, status = refresh_session({'refresh_token': refresh_token}, None)
+        assert status == 401
+
+
+def test_access_token_cannot_start_a_refresh_family(app):
+    access_token = generate_token(42, 'client@example.com')
+
+    assert validate_token('Bearer ' + access_token) == 42
+    with app.test_request_context():
+        _, status = refresh_session({}, 'Bearer ' + access_token)
+    assert status == 401
+
+
+def test_legacy_access_token_is_exchanged_once(app):
+    legacy_token = jwt.encode({
+        'user_id': 43,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1),
+    }, jwt_config.JWT_SECRET_KEY, algorithm='HS256')
+
+    with app.test_request_context():
+        response, status = refresh_session({}, 'Bearer ' + legacy_token)
+        assert status == 200
+        assert validate_token('Bearer ' + response.get_json()['token']) == 43
+        _, status = refresh_session({}, 'Bearer ' + legacy_token)
+        assert status == 401
+
+
+def test_concurrent_refresh_gets_the_same_successor_then_reuse_revokes_the_family():
+    refresh_token = refresh_tokens.issue_refresh_token(44, 'client@example.com')
+
+    _, _, successor = refresh_tokens.rotate(refresh_token)
+    _, _, again = refresh_tokens.rotate(refresh_token)
+    assert again == successor
+
+    # Past the grace period the successor is gone and the old token counts as stolen
+    jti = jwt.decode(refresh_token, options={'verify_signature': False})['jti']
+    refresh_tokens.store.delete('refresh_next', jti)
+    with pytest.raises(refresh_tokens.RefreshTokenError):
+        refresh_tokens.rotate(refresh_token)
+    with pytest.raises(refresh_tokens.RefreshTokenError):
+        refresh_tokens.rotate(successor)
+
+
+def test_revoke_user_rejects_earlier_refresh_tokens():
+    refresh_token = refresh_tokens.issue_refresh_token(45, 'client@example.com')
+    refresh_tokens.revoke_user(45)
+
+    with pytest.raises(refresh_tokens.RefreshTokenError):
+        refresh_tokens.rotate(refresh_token)
+    refresh_tokens.rotate(refresh_tokens.issue_refresh_token(45, 'client@example.com'))
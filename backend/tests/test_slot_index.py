@@ -0,0 +1,89 @@
+import datetime
+
+import pytest
+
+import db_session
+import slot_index as slot_index_module
+from slot_index import SlotIndex
+
+DATE = '2026-03-14'
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params):
+        pass
+
+    def fetchall(self):
+        if self.db.during_read:
+            hook, self.db.during_read = self.db.during_read, None
+            hook()
+        return [(appointment_time,) for appointment_time in self.db.booked]
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    """Booked appointment times of DATE; during_read runs once, while a SELECT is in progress"""
+
+    def __init__(self):
+        self.booked = []
+        self.during_read = None
+        self.loads = 0
+
+    def cursor(self):
+        self.loads += 1
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(slot_index_module.db_session, 'get_connection', lambda: db)
+    return db
+
+
+@pytest.fixture
+def commits(monkeypatch):
+    """Callbacks waiting for their transaction to commit"""
+    pending = []
+    monkeypatch.setattr(db_session, 'on_commit', pending.append)
+    return pending
+
+
+def test_booking_committed_during_a_load_is_counted_once(db, commits):
+    index = SlotIndex()
+    ten = datetime.timedelta(hours=10)
+
+    def booking():
+        # Written and committed while the rows are read, so they already include it
+        db.booked.append(ten)
+        index.book(DATE, '10:00')
+
+    db.during_read = booking
+    index.available(DATE)
+    commits.pop()()  # its after-commit callback only runs now
+    assert '10:00' not in index.available(DATE)
+
+    db.booked.remove(ten)
+    index.release(DATE, '10:00')
+    commits.pop()()
+    assert '10:00' in index.available(DATE)
+
+
+def test_bookings_after_a_load_are_applied_in_place(db, commits):
+    index = SlotIndex()
+    index.available(DATE)
+
+    db.booked.append(datetime.timedelta(hours=11))
+    index.book(DATE, '11:00')
+    commits.pop()()
+
+    assert '11:00' not in index.available(DATE)
+    assert db.loads == 1
@@ -0,0 +1,217 @@
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import logging
+from config import app_config, token_store_config, redis_config
+from resp_client import RespClient, RespError
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStoreUnavailableError(Exception):
+    """The shared token store can't be reached; callers answer with 503"""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _digest(namespace, key):
+    # Keys are stored hashed so the store never holds a usable token
+    return f"{namespace}:{hashlib.sha256(str(key).encode('utf-8')).hexdigest()}"
+
+
+class MemoryTokenStore:
+    """
+    Short-lived tokens (OTPs, verification and reset tokens, refresh token
+    revocations) kept in this process, each with its own TTL. consume()
+    removes and returns a token in one step, so a token can be used only once
+    even under concurrent requests, and add() stores one only if it is absent.
+
+    Only suitable for a single server process; use RedisTokenStore when
+    several processes serve requests.
+
+    Args:
+        maxsize (int): Tokens kept before the least recently used is dropped
+    """
+
+    name = 'memory'
+
+    def __init__(self, maxsize=100000):
+        self._tokens = TTLCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def put(self, namespace, key, value, ttl):
+        self._tokens.set(_digest(namespace, key), value, ttl=ttl)
+
+    def add(self, namespace, key, value, ttl):
+        """Store the token unless it already exists; True if it was stored"""
+        with self._lock:
+            if self._tokens.get(_digest(namespace, key)) is not None:
+                return False
+            self._tokens.set(_digest(namespace, key), value, ttl=ttl)
+            return True
+
+    def get(self, namespace, key):
+        return self._tokens.get(_digest(namespace, key))
+
+    def consume(self, namespace, key):
+        """Remove the token and return its value, or None if it doesn't exist or expired"""
+        return self._tokens.pop(_digest(namespace, key))
+
+    def delete(self, namespace, key):
+        self._tokens.pop(_digest(namespace, key))
+
+    def stats(self):
+        return {'backend': self.name, **self._tokens.stats()}
+
+
+class RedisTokenStore:
+    """
+    Short-lived tokens on a shared Redis-protocol server, using its native
+    key expiry (SET PX). consume() is a single GETDEL, so exactly one caller
+    gets the value. Requires a server that supports GETDEL (Redis 6.2+).
+
+    Args:
+        client (RespClient): Connection to the server
+        prefix (str): Key prefix
+
+    Raises:
+        TokenStoreUnavailableError: The server could not be reached
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='tok:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _call(self, *command):
+        try:
+            return self.client.execute(*command)
+        except (ConnectionError, RespError) as e:
+            logger.error(f"Token store unavailable: {str(e)}")
+            raise TokenStoreUnavailableError("Token store unavailable") from e
+
+    @staticmethod
+    def _load(raw):
+        return None if raw is None else json.loads(raw)
+
+    def put(self, namespace, key, value, ttl):
+        self._call('SET', self.prefix + _digest(namespace, key), json.dumps(value), 'PX', int(ttl * 1000))
+
+    def add(self, namespace, key, value, ttl):
+        return self._call('SET', self.prefix + _digest(namespace, key), json.dumps(value), 'PX', int(ttl * 1000), 'NX') is not None
+
+    def get(self, namespace, key):
+        return self._load(self._call('GET', self.prefix + _digest(namespace, key)))
+
+    def consume(self, namespace, key):
+        return self._load(self._call('GETDEL', self.prefix + _digest(namespace, key)))
+
+    def delete(self, namespace, key):
+        self._call('DEL', self.prefix + _digest(namespace, key))
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+def _build_store():
+    if token_store_config.TOKEN_STORE_BACKEND == 'redis':
+        return RedisTokenStore(RespClient(redis_config.REDIS_URL, timeout=redis_config.REDIS_TIMEOUT))
+    return MemoryTokenStore(maxsize=token_store_config.TOKEN_STORE_SIZE)
+
+
+store = _build_store()
+
+
+def _normalize_email(email):
+    return email.strip().lower()
+
+
+def _otp_digest(email, code):
+    # Keyed, because a plain hash of a 6-digit code is reversed by trying them all
+    message = f"{email}:{code}".encode('utf-8')
+    return hmac.new(app_config.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def issue_otp(email, length=6):
+    """
+    Create a numeric one-time code for email, replacing any earlier code.
+
+    Returns:
+        str: The code to send
+    """
+    email = _normalize_email(email)
+    code = ''.join(secrets.choice('0123456789') for _ in range(length))
+    digest = _otp_digest(email, code)
+    previous = store.get('otp_latest', email)
+    if previous:
+        store.delete('otp', f"{email}:{previous}")
+    ttl = token_store_config.OTP_TTL
+    # The code's digest is part of the key, so a wrong guess is simply a miss
+    # and a right one is consumed atomically; otp_latest holds the digest too
+    store.put('otp', f"{email}:{digest}", {'email': email}, ttl)
+    store.put('otp_latest', email, digest, ttl)
+    return code
+
+
+def consume_otp(email, code):
+    """True if code is the current, unexpired code for email; it can't be used again"""
+    email = _normalize_email(email)
+    digest = _otp_digest(email, code)
+    if store.consume('otp', f"{email}:{digest}") is None:
+        return False
+    latest = store.get('otp_latest', email)
+    if latest is not None and hmac.compare_digest(str(latest), digest):
+        store.delete('otp_latest', email)
+    return True
+
+
+def issue_token(kind, value, ttl):
+    """
+    Create a random single-use token of kind ('verify', 'reset') carrying value.
+
+    Returns:
+        str: The token to put in the emailed link
+    """
+    token = secrets.token_urlsafe(32)
+    store.put(kind, token, value, ttl)
+    return token
+
+
+def peek_token(kind, token):
+    """Value of a token without using it up, or None"""
+    return store.get(kind, token)
+
+
+def consume_token(kind, token):
+    """Use up a token and return its value, or None if it is unknown, expired or already used"""
+    return store.consume(kind, token)
+
+
+def token_store_stats():
+    return store.stats()
+
+
+def init_app(app):
+    """
+    Refuse to start with the in-process store when several server processes
+    (WEB_CONCURRENCY) serve requests: a code or link issued by one would be
+    invalid on the others, and a refresh token revoked on one would still
+    work on the others.
+    """
+    if store.name != 'memory':
+        return
+    if app_config.WEB_WORKERS > 1:
+        raise RuntimeError(
+            f"TOKEN_STORE_BACKEND=memory can't be shared by {app_config.WEB_WORKERS} server processes; "
+            f"set TOKEN_STORE_BACKEND=redis"
+        )
+    logger.warning(
+        "Token store is in process memory: pending OTPs and emailed links, and refresh token "
+        "revocations (logout, password reset, reuse), are lost on restart"
+    )
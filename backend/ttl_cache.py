@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire.
+
+    Each entry carries its own absolute expiry time (wall clock, seconds since
+    the epoch) so callers can tie it to something like a token's exp claim.
+    When the cache is full the least recently used entry is dropped.
+
+    Args:
+        maxsize (int): Entries kept before the least recently used is evicted
+        ttl (float): Default lifetime in seconds for set() without expires_at
+        clock (callable): Returns the current time; time.time by default
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.time):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self._stats['misses'] += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value, expires_at=None, ttl=None):
+        """
+        Store a value.
+
+        Args:
+            key: Hashable key
+            value: Value to cache
+            expires_at (float): Absolute expiry time; takes precedence over ttl
+            ttl (float): Lifetime in seconds; defaults to the cache's ttl
+        """
+        now = self._clock()
+        if expires_at is None:
+            expires_at = now + (self.ttl if ttl is None else ttl)
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value; default if it is missing or expired"""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        if entry is _MISSING or entry[1] <= self._clock():
+            return default
+        return entry[0]
+
+    def clear(self):
+        """Drop every entry, e.g. after the data behind the cache changed wholesale"""
+        with self._lock:
+            self._data.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+            stats['maxsize'] = self.maxsize
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        return len(self._data)
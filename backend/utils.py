@@ -118,6 +118,9 @@ from config import email_config, jwt_config
 import json
 import logging
 import datetime
+import hashlib
+from ttl_cache import TTLCache
+from smtp_pool import get_smtp_pool
 
 # Configure logging
 logging.basicConfig(
@@ -131,27 +134,31 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Email utility function
-def send_email(to_email, subject, body):
-    try:
-        if email_config.EMAIL_ENABLED:
-            msg = MIMEMultipart()
-            msg['From'] = email_config.EMAIL_FROM
-            msg['To'] = to_email
-            msg['Subject'] = subject
+def deliver_email(to_email, subject, body, html_body=None):
+    """Send an email now, raising if it can't be delivered (used by the outbox workers)"""
+    if email_config.EMAIL_ENABLED:
+        # Text and HTML versions of the same message; clients show the last one they support
+        msg = MIMEMultipart('alternative' if html_body else 'mixed')
+        msg['From'] = email_config.EMAIL_FROM
+        msg['To'] = to_email
+        msg['Subject'] = subject
 
-            msg.attach(MIMEText(body, 'plain'))
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        if html_body:
+            msg.attach(MIMEText(html_body, 'html', 'utf-8'))
 
-            server = smtplib.SMTP(email_config.SMTP_SERVER, email_config.SMTP_PORT)
-            server.starttls()
-            server.login(email_config.SMTP_USERNAME, email_config.SMTP_PASSWORD)
-            server.send_message(msg)
-            server.quit()
-            logger.info(f"Email sent to {to_email} with subject: {subject}")
-        else:
-            # Log email in development mode
-            logger.info(f"DEVELOPMENT MODE: Email to {to_email}")
-            logger.info(f"Subject: {subject}")
-            logger.info(f"Body: {body}")
+        # Reuses an authenticated session instead of connecting per message
+        get_smtp_pool().send(msg)
+        logger.info(f"Email sent to {to_email} with subject: {subject}")
+    else:
+        # Log email in development mode
+        logger.info(f"DEVELOPMENT MODE: Email to {to_email}")
+        logger.info(f"Subject: {subject}")
+        logger.info(f"Body: {body}")
+
+def send_email(to_email, subject, body, html_body=None):
+    try:
+        deliver_email(to_email, subject, body, html_body)
     except Exception as e:
         logger.error(f"Failed to send email: {str(e)}")
 
@@ -169,6 +176,7 @@ def generate_token(user_id, email=None, role=None):
     - JWT token string
     """
     payload = {
+        'type': 'access',
         'user_id': user_id,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
     }
@@ -194,31 +202,62 @@ def generate_jwt_token(user_id):
     - JWT token string
     """
     payload = {
+        'type': 'access',
         'user_id': user_id,
         'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
     }
     token = jwt.encode(payload, jwt_config.JWT_SECRET_KEY, algorithm='HS256')
     return token
 
-# JWT token validation
-def validate_token(token):
+# Verified tokens keyed by a digest of the token; entries expire with the token's exp claim
+_verified_tokens = TTLCache(maxsize=jwt_config.JWT_CACHE_SIZE, ttl=jwt_config.JWT_CACHE_MAX_TTL)
+
+# Verified claims of a "Bearer <jwt>" Authorization header, or None
+def get_token_claims(token):
     if not token or not token.startswith('Bearer '):
-        logger.warning("Missing or malformed token: %s", token)
+        logger.debug("Missing or malformed token")
         return None
     
     token = token.replace('Bearer ', '')
-    logger.info("Decoding token: %s", token)  # Debugging line
-
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _verified_tokens.get(key)
+    if payload is not None:
+        return payload
     
     try:
         payload = jwt.decode(token, jwt_config.JWT_SECRET_KEY, algorithms=['HS256'])
-        return payload['user_id']
     except jwt.ExpiredSignatureError:
         logger.warning("Token expired")
         return None
     except jwt.InvalidTokenError:
         logger.warning("Invalid token")
         return None
+    
+    # Refresh tokens are signed with the same key; they are only good at the refresh endpoint
+    if payload.get('type', 'access') != 'access':
+        logger.warning("Token of the wrong type")
+        return None
+    
+    _verified_tokens.set(key, payload, expires_at=payload.get('exp'))
+    return payload
+
+# JWT token validation
+def validate_token(token):
+    payload = get_token_claims(token)
+    if payload is None:
+        return None
+    return payload['user_id']
+
+def invalidate_token_cache():
+    """
+    Forget every verified token so the next request re-verifies its signature.
+    Call this after rotating JWT_SECRET_KEY.
+    """
+    _verified_tokens.clear()
+
+def token_cache_stats():
+    """Hit/miss counters and size of the verified-token cache"""
+    return _verified_tokens.stats()
 
 # Extract user_id from token
 def get_user_id_from_token(token):
@@ -10,7 +10,7 @@ import React, {
   ReactNode
 } from "react"
 import { useNavigate } from "react-router-dom"
-import { refreshToken } from "../services/api"
+import { refreshToken, logout as apiLogout } from "../services/api"
 import { jwtDecode } from "jwt-decode"
 
 // Define the User interface
@@ -91,6 +91,9 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
 
   // Logout function
   const logout = useCallback(() => {
+    // Revoke the refresh token server-side (reads it before it is cleared below)
+    apiLogout()
+
     // Clear state
     setUser(null)
     setToken(null)
@@ -99,6 +102,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
     // Clear localStorage
     localStorage.removeItem("user")
     localStorage.removeItem("token")
+    localStorage.removeItem("refreshToken")
     
     // Clear refresh interval
     if (refreshInterval) {
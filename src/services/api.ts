@@ -63,6 +63,7 @@ apiClient.interceptors.response.use(
           if (!window.location.pathname.includes('/login')) {
             console.log("Redirecting to login after failed token refresh")
             localStorage.removeItem("token")
+            localStorage.removeItem("refreshToken")
             localStorage.removeItem("user")
             window.location.href = "/login"
           }
@@ -83,18 +84,21 @@ apiClient.interceptors.response.use(
 export const refreshToken = async (): Promise<string | null> => {
   try {
     console.log("Calling refresh token endpoint")
-     // Get the current token (not from closure)
+     // Get the current tokens (not from closure)
      const currentToken = localStorage.getItem("token")
+     const currentRefreshToken = localStorage.getItem("refreshToken")
     
      // Don't attempt to refresh if no token exists
-     if (!currentToken) {
+     if (!currentToken && !currentRefreshToken) {
        console.log("No token to refresh")
        return null
      }
-    const response = await apiClient.post("/auth/refresh-token", {})
+    // Refresh tokens are single-use; the response carries the next one
+    const response = await apiClient.post("/auth/refresh-token", { refresh_token: currentRefreshToken })
     if (response.data && response.data.token) {
       console.log("Token refreshed successfully")
       localStorage.setItem("token", response.data.token)
+      saveRefreshToken(response.data)
       return response.data.token
     }
     return null
@@ -104,19 +108,28 @@ export const refreshToken = async (): Promise<string | null> => {
   }
 }
 
+// Keep the refresh token issued with a login or refresh response
+const saveRefreshToken = (data: { refresh_token?: string }) => {
+  if (data && data.refresh_token) {
+    localStorage.setItem("refreshToken", data.refresh_token)
+  }
+}
+
 // Auth API calls
 export const login = async (email: string, password: string) => {
   const response = await apiClient.post("/auth/login", { email, password })
+  saveRefreshToken(response.data)
   return response.data
 }
 
 export const logout = async () => {
   try {
-    // Send empty object to prevent 415 errors
-    await apiClient.post("/auth/logout", {})
+    // Ends the session server-side so its refresh token can't be used again
+    await apiClient.post("/auth/logout", { refresh_token: localStorage.getItem("refreshToken") })
   } catch (error) {
     console.error("Logout error:", error)
   }
+  localStorage.removeItem("refreshToken")
 }
 
 export const googleAuth = async (data: {
@@ -130,6 +143,7 @@ export const googleAuth = async (data: {
     firebase_token: data.firebase_token ? "TOKEN_HIDDEN_FOR_SECURITY" : null
   })
   const response = await apiClient.post("/auth/google", data)
+  saveRefreshToken(response.data)
   return response.data
 }
 
@@ -149,6 +163,7 @@ export const completeGoogleRegistration = async (userData: {
     firebase_token: "TOKEN_HIDDEN_FOR_SECURITY"
   })
   const response = await apiClient.post("/auth/google/complete-registration", userData)
+  saveRefreshToken(response.data)
   return response.data
 }
 